@@ -53,6 +53,22 @@ public class FocasController : ControllerBase
         return response.Success ? Ok(response) : BadRequest(response);
     }
 
+    [HttpGet("telemetry/{ipAddress}")]
+    public IActionResult GetTelemetry(string ipAddress, [FromQuery] int port = 8193)
+    {
+        // Own session per machine, independent of connect/disconnect
+        var response = _focasService.GetTelemetry(ipAddress, port);
+        // Return 200 with error details instead of 400, so Flask can see the error message
+        return Ok(response);
+    }
+
+    [HttpDelete("telemetry/{ipAddress}")]
+    public IActionResult CloseTelemetrySession(string ipAddress)
+    {
+        var response = _focasService.CloseTelemetrySession(ipAddress);
+        return Ok(response);
+    }
+
     [HttpGet("status")]
     public IActionResult GetStatus()
     {
@@ -182,5 +198,63 @@ public class FocasController : ControllerBase
         // Return 200 with error details instead of 400, so Flask can see the error message
         return Ok(response);
     }
+
+    [HttpPost("sessions/{ipAddress}/write-macros")]
+    public IActionResult WriteMacros(string ipAddress, [FromBody] WriteMacroBatchRequest request)
+    {
+        // Own session for the machine, so several machines can be written in parallel
+        var response = _focasService.WriteMacros(ipAddress, request.Port, request.Writes);
+        return Ok(response);
+    }
+
+    // Reads in a session of their own per machine, independent of connect/disconnect,
+    // so reads for different machines run in parallel
+
+    [HttpGet("sessions/{ipAddress}/tool-radius/{toolNumber}")]
+    public IActionResult GetToolRadiusSession(string ipAddress, short toolNumber, [FromQuery] int port = 8193)
+    {
+        return Ok(_focasService.ReadInSession(ipAddress, port, () => _focasService.GetToolRadius(0, toolNumber)));
+    }
+
+    [HttpGet("sessions/{ipAddress}/tool-offsets/{toolNumber}")]
+    public IActionResult GetToolOffsetsSession(string ipAddress, short toolNumber, [FromQuery] int port = 8193)
+    {
+        return Ok(_focasService.ReadInSession(ipAddress, port, () => _focasService.GetToolOffsets(toolNumber)));
+    }
+
+    [HttpGet("sessions/{ipAddress}/tool-offsets-range/{startToolNumber}/{endToolNumber}")]
+    public IActionResult GetToolOffsetsRangeSession(string ipAddress, short startToolNumber, short endToolNumber, [FromQuery] int port = 8193)
+    {
+        return Ok(_focasService.ReadInSession(ipAddress, port,
+            () => _focasService.GetToolOffsetsRange(startToolNumber, endToolNumber)));
+    }
+
+    [HttpGet("sessions/{ipAddress}/work-zero-offsets-range/{startCoordinateSystem}/{endCoordinateSystem}")]
+    public IActionResult GetWorkZeroOffsetsRangeSession(string ipAddress, short startCoordinateSystem, short endCoordinateSystem, [FromQuery] int port = 8193)
+    {
+        return Ok(_focasService.ReadInSession(ipAddress, port,
+            () => _focasService.GetWorkZeroOffsetsRange(startCoordinateSystem, endCoordinateSystem)));
+    }
+
+    [HttpGet("sessions/{ipAddress}/work-zero-offset/{number}/{axis}/{length}")]
+    public IActionResult GetWorkZeroOffsetSession(string ipAddress, short number, short axis, short length, [FromQuery] int port = 8193)
+    {
+        return Ok(_focasService.ReadInSession(ipAddress, port, () => _focasService.GetWorkZeroOffset(number, axis, length)));
+    }
+
+    [HttpGet("sessions/{ipAddress}/work-zero-offsets-range-single/{axis}/{startNumber}/{endNumber}")]
+    public IActionResult GetWorkZeroOffsetsRangeSingleSession(string ipAddress, short axis, short startNumber, short endNumber, [FromQuery] int port = 8193)
+    {
+        return Ok(_focasService.ReadInSession(ipAddress, port,
+            () => _focasService.GetWorkZeroOffsetsRangeSingle(axis, startNumber, endNumber, null)));
+    }
+
+    [HttpGet("sessions/{ipAddress}/macros/{startNumber}/{endNumber}")]
+    public IActionResult ReadMacros(string ipAddress, short startNumber, short endNumber, [FromQuery] int port = 8193)
+    {
+        // Whole range in one session for the machine, independent of connect/disconnect
+        var response = _focasService.ReadMacros(ipAddress, port, startNumber, endNumber);
+        return Ok(response);
+    }
 }
 
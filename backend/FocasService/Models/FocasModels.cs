@@ -24,6 +24,15 @@ public class AxisPositionData
     public short AxisType { get; set; }
 }
 
+public class TelemetryData
+{
+    public int Feedrate { get; set; }
+    public int SpindleSpeed { get; set; }
+    public List<int> Positions { get; set; } = new();
+    public short AxisType { get; set; }
+    public bool Reconnected { get; set; } // true if the machine's session was (re)opened for this read
+}
+
 public class ConnectionRequest
 {
     public string? IpAddress { get; set; }
@@ -128,3 +137,35 @@ public class WriteMacroData
     public int McrVal { get; set; }
     public short DecVal { get; set; }
 }
+
+public class WriteMacroBatchRequest
+{
+    public int Port { get; set; } = 8193; // Default FOCAS port
+    public List<WriteMacroRequest> Writes { get; set; } = new();
+}
+
+public class WriteMacroResult
+{
+    public short Number { get; set; }
+    public int McrVal { get; set; }
+    public short DecVal { get; set; }
+    public bool Success { get; set; }
+    public string? Error { get; set; }
+    public int ErrorCode { get; set; }
+    public double ElapsedMs { get; set; }
+}
+
+public class MacroVariableData
+{
+    public short Number { get; set; }
+    public int McrVal { get; set; }
+    public short DecVal { get; set; }
+    public double? Value { get; set; } // null when the variable is vacant
+}
+
+public class MacroRangeData
+{
+    public short StartNumber { get; set; }
+    public short EndNumber { get; set; }
+    public List<MacroVariableData> Variables { get; set; } = new();
+}
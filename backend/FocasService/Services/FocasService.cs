@@ -1,4 +1,5 @@
 using FocasService.Models;
+using System.Collections.Concurrent;
 using System.Linq;
 using System.Runtime.InteropServices;
 
@@ -11,6 +12,26 @@ public class FocasService
     private int _lastPort = 8193;
     private readonly ILogger<FocasService> _logger;
 
+    // Telemetry sessions: one handle per machine, kept open between samples
+    private readonly ConcurrentDictionary<string, ushort> _telemetryHandles = new();
+    private readonly ConcurrentDictionary<string, object> _telemetryLocks = new();
+    // Macro batches and session reads: one session per machine for the duration of the request
+    private readonly ConcurrentDictionary<string, object> _sessionLocks = new();
+    private const int MaxMacroRange = 1000;
+
+    // The session of the read running on this call (ReadInSession); the read methods use its handle
+    // instead of the shared one from connect/disconnect
+    private sealed class ReadSession
+    {
+        public required string IpAddress { get; init; }
+        public required int Port { get; init; }
+        public required int Timeout { get; init; }
+        public ushort? Handle { get; set; }
+    }
+    private readonly AsyncLocal<ReadSession?> _readSession = new();
+
+    private ushort? Handle => _readSession.Value != null ? _readSession.Value.Handle : _handle;
+
     public FocasService(ILogger<FocasService> logger)
     {
         _logger = logger;
@@ -271,7 +292,7 @@ public class FocasService
 
     public FocasResponse<ToolRadiusData> GetToolRadius(short toolGroup, short toolNumber)
     {
-        if (_handle == null)
+        if (Handle == null)
         {
             return new FocasResponse<ToolRadiusData>
             {
@@ -283,7 +304,7 @@ public class FocasService
         try
         {
             var radiusData = new Focas1.ODBTLIFE4();
-            short result = Focas1.cnc_rd1radius(_handle.Value, toolGroup, toolNumber, radiusData);
+            short result = Focas1.cnc_rd1radius(Handle!.Value, toolGroup, toolNumber, radiusData);
 
             if (result == Focas1.EW_OK)
             {
@@ -321,6 +342,24 @@ public class FocasService
 
     private bool TryReconnect()
     {
+        var session = _readSession.Value;
+        if (session != null)
+        {
+            // Reopen the session's own handle; the shared handle is left alone
+            if (session.Handle != null)
+                Focas1.cnc_freelibhndl(session.Handle.Value);
+            session.Handle = null;
+            object ipObj = session.IpAddress;
+            short result = Focas1.cnc_allclibhndl3(ipObj, (ushort)session.Port, session.Timeout, out ushort opened);
+            if (result != Focas1.EW_OK)
+            {
+                _logger.LogWarning($"Could not reopen session to {session.IpAddress}: {GetErrorString(result)}");
+                return false;
+            }
+            session.Handle = opened;
+            return true;
+        }
+
         if (string.IsNullOrEmpty(_lastIpAddress))
         {
             _logger.LogWarning("Cannot reconnect: No previous IP address stored");
@@ -334,7 +373,7 @@ public class FocasService
 
     public FocasResponse<ToolOffsetData> GetToolOffsets(short toolNumber)
     {
-        if (_handle == null)
+        if (Handle == null)
         {
             return new FocasResponse<ToolOffsetData>
             {
@@ -354,7 +393,7 @@ public class FocasService
             int? ReadOffset(short type, string offsetName)
             {
                 var tofs = new Focas1.ODBTOFS();
-                short result = Focas1.cnc_rdtofs(_handle!.Value, toolNumber, type, 8, tofs);
+                short result = Focas1.cnc_rdtofs(Handle!.Value, toolNumber, type, 8, tofs);
                 
                 if (result == Focas1.EW_OK)
                 {
@@ -369,7 +408,7 @@ public class FocasService
                     {
                         // Retry once after reconnection
                         tofs = new Focas1.ODBTOFS();
-                        result = Focas1.cnc_rdtofs(_handle!.Value, toolNumber, type, 8, tofs);
+                        result = Focas1.cnc_rdtofs(Handle!.Value, toolNumber, type, 8, tofs);
                         if (result == Focas1.EW_OK)
                         {
                             _logger.LogInformation($"Tool {toolNumber} {offsetName} (type {type}) after reconnect: {tofs.data}");
@@ -413,7 +452,7 @@ public class FocasService
 
     public FocasResponse<ToolOffsetRangeData> GetToolOffsetsRange(short startToolNumber, short endToolNumber)
     {
-        if (_handle == null)
+        if (Handle == null)
         {
             return new FocasResponse<ToolOffsetRangeData>
             {
@@ -471,7 +510,7 @@ public class FocasService
 
     public FocasResponse<WorkZeroOffsetRangeData> GetWorkZeroOffsetsRange(short startCoordinateSystem, short endCoordinateSystem)
     {
-        if (_handle == null)
+        if (Handle == null)
         {
             return new FocasResponse<WorkZeroOffsetRangeData>
             {
@@ -509,7 +548,7 @@ public class FocasService
                         
                         // Try reading all axes at once first
                         var zofs = new Focas1.IODBZOFS();
-                        short resultCode = Focas1.cnc_rdzofs(_handle.Value, coordSys, Focas1.ALL_AXES, length, zofs);
+                        short resultCode = Focas1.cnc_rdzofs(Handle!.Value, coordSys, Focas1.ALL_AXES, length, zofs);
 
                         if (resultCode == Focas1.EW_OK)
                         {
@@ -541,7 +580,7 @@ public class FocasService
                                 zofs = new Focas1.IODBZOFS();
                                 // For individual axis, length might be different - try smaller length
                                 short axisLength = (short)(4 + 4); // datano + type + one axis value
-                                resultCode = Focas1.cnc_rdzofs(_handle.Value, coordSys, axis, axisLength, zofs);
+                                resultCode = Focas1.cnc_rdzofs(Handle!.Value, coordSys, axis, axisLength, zofs);
                                 
                                 if (resultCode == Focas1.EW_OK && zofs.data != null && zofs.data.Length > 0)
                                 {
@@ -562,7 +601,7 @@ public class FocasService
                             if (TryReconnect())
                             {
                                 zofs = new Focas1.IODBZOFS();
-                                resultCode = Focas1.cnc_rdzofs(_handle.Value, coordSys, Focas1.ALL_AXES, length, zofs);
+                                resultCode = Focas1.cnc_rdzofs(Handle!.Value, coordSys, Focas1.ALL_AXES, length, zofs);
                                 if (resultCode == Focas1.EW_OK && zofs.data != null && zofs.data.Length > 0)
                                 {
                                     for (short axis = 0; axis < 3 && axis < zofs.data.Length; axis++)
@@ -617,7 +656,7 @@ public class FocasService
 
     public FocasResponse<WorkZeroOffsetSingleData> GetWorkZeroOffset(short number, short axis, short length)
         {
-            if (_handle == null)
+            if (Handle == null)
             {
                 return new FocasResponse<WorkZeroOffsetSingleData>
                 {
@@ -629,7 +668,7 @@ public class FocasService
             try
             {
                 var zofs = new Focas1.IODBZOFS();
-                short resultCode = Focas1.cnc_rdzofs(_handle.Value, number, axis, length, zofs);
+                short resultCode = Focas1.cnc_rdzofs(Handle!.Value, number, axis, length, zofs);
 
                 if (resultCode == Focas1.EW_OK)
                 {
@@ -656,7 +695,7 @@ public class FocasService
                         if (TryReconnect())
                         {
                             zofs = new Focas1.IODBZOFS();
-                            resultCode = Focas1.cnc_rdzofs(_handle.Value, number, axis, length, zofs);
+                            resultCode = Focas1.cnc_rdzofs(Handle!.Value, number, axis, length, zofs);
                             if (resultCode == Focas1.EW_OK)
                             {
                                 var result = new WorkZeroOffsetSingleData
@@ -695,7 +734,7 @@ public class FocasService
 
     public FocasResponse<WorkZeroOffsetRangeSingleData> GetWorkZeroOffsetsRangeSingle(short axis, short startNumber, short endNumber, short? length = null)
     {
-        if (_handle == null)
+        if (Handle == null)
         {
             return new FocasResponse<WorkZeroOffsetRangeSingleData>
             {
@@ -717,7 +756,7 @@ public class FocasService
             // So we need to swap axis and startNumber when calling
             // User inputs: s_number=7, axis=1, e_number=12
             // We call: cnc_rdzofsr(handle, startNumber=7, axis=1, endNumber=12, length, zor)
-            short resultCode = Focas1.cnc_rdzofsr(_handle.Value, startNumber, axis, endNumber, calculatedLength, zor);
+            short resultCode = Focas1.cnc_rdzofsr(Handle!.Value, startNumber, axis, endNumber, calculatedLength, zor);
 
             if (resultCode == Focas1.EW_OK)
             {
@@ -746,7 +785,7 @@ public class FocasService
                     {
                         zor = new Focas1.IODBZOR();
                         // Swap startNumber and axis when calling FOCAS (a=s_number, b=axis)
-                        resultCode = Focas1.cnc_rdzofsr(_handle.Value, startNumber, axis, endNumber, calculatedLength, zor);
+                        resultCode = Focas1.cnc_rdzofsr(Handle!.Value, startNumber, axis, endNumber, calculatedLength, zor);
                         if (resultCode == Focas1.EW_OK)
                         {
                             var result = new WorkZeroOffsetRangeSingleData
@@ -866,6 +905,368 @@ public class FocasService
         }
     }
 
+    public FocasResponse<List<WriteMacroResult>> WriteMacros(string ipAddress, int port, List<WriteMacroRequest> writes, int timeout = 10)
+    {
+        // Batches for the same machine run one at a time; other machines are not blocked
+        var sessionLock = _sessionLocks.GetOrAdd(ipAddress, _ => new object());
+        lock (sessionLock)
+        {
+            ushort? handle = null;
+            try
+            {
+                object ipObj = ipAddress;
+                short result = Focas1.cnc_allclibhndl3(ipObj, (ushort)port, timeout, out ushort opened);
+                if (result != Focas1.EW_OK)
+                {
+                    return new FocasResponse<List<WriteMacroResult>>
+                    {
+                        Success = false,
+                        Error = $"{GetErrorString(result)} (IP: {ipAddress}, Port: {port})",
+                        ErrorCode = result
+                    };
+                }
+                handle = opened;
+
+                var results = new List<WriteMacroResult>();
+                foreach (var write in writes)
+                {
+                    var started = System.Diagnostics.Stopwatch.StartNew();
+                    // length should be 10 according to documentation (see WriteMacro)
+                    result = Focas1.cnc_wrmacro(handle.Value, write.Number, 10, write.McrVal, write.DecVal);
+                    if (result == (short)Focas1.focas_ret.EW_HANDLE || result == (short)Focas1.focas_ret.EW_SOCKET)
+                    {
+                        // The session went stale - reopen it once and retry this write
+                        _logger.LogWarning($"Write session to {ipAddress} lost ({GetErrorString(result)}). Reconnecting...");
+                        Focas1.cnc_freelibhndl(handle.Value);
+                        handle = null;
+                        result = Focas1.cnc_allclibhndl3(ipObj, (ushort)port, timeout, out opened);
+                        if (result == Focas1.EW_OK)
+                        {
+                            handle = opened;
+                            result = Focas1.cnc_wrmacro(handle.Value, write.Number, 10, write.McrVal, write.DecVal);
+                        }
+                    }
+                    results.Add(new WriteMacroResult
+                    {
+                        Number = write.Number,
+                        McrVal = write.McrVal,
+                        DecVal = write.DecVal,
+                        Success = result == Focas1.EW_OK,
+                        Error = result == Focas1.EW_OK ? null : GetErrorString(result),
+                        ErrorCode = result,
+                        ElapsedMs = started.Elapsed.TotalMilliseconds
+                    });
+                    if (handle == null)
+                        break; // Could not reconnect; the remaining writes are left out of the result
+                }
+
+                return new FocasResponse<List<WriteMacroResult>>
+                {
+                    Success = results.Count == writes.Count && results.All(r => r.Success),
+                    Data = results,
+                    Error = results.FirstOrDefault(r => !r.Success)?.Error,
+                    ErrorCode = results.FirstOrDefault(r => !r.Success)?.ErrorCode ?? 0
+                };
+            }
+            catch (Exception ex)
+            {
+                _logger.LogError(ex, "Error writing macro variables to {IpAddress}", ipAddress);
+                return new FocasResponse<List<WriteMacroResult>>
+                {
+                    Success = false,
+                    Error = ex.Message
+                };
+            }
+            finally
+            {
+                if (handle != null)
+                {
+                    try
+                    {
+                        Focas1.cnc_freelibhndl(handle.Value);
+                    }
+                    catch (Exception ex)
+                    {
+                        _logger.LogWarning(ex, "Error closing write session to {IpAddress}", ipAddress);
+                    }
+                }
+            }
+        }
+    }
+
+    public FocasResponse<MacroRangeData> ReadMacros(string ipAddress, int port, short startNumber, short endNumber, int timeout = 10)
+    {
+        if (startNumber < 1 || endNumber < startNumber || endNumber - startNumber + 1 > MaxMacroRange)
+        {
+            return new FocasResponse<MacroRangeData>
+            {
+                Success = false,
+                Error = $"Invalid macro range #{startNumber}-#{endNumber} (at most {MaxMacroRange} variables)"
+            };
+        }
+
+        var sessionLock = _sessionLocks.GetOrAdd(ipAddress, _ => new object());
+        lock (sessionLock)
+        {
+            ushort? handle = null;
+            try
+            {
+                object ipObj = ipAddress;
+                short result = Focas1.cnc_allclibhndl3(ipObj, (ushort)port, timeout, out ushort opened);
+                if (result != Focas1.EW_OK)
+                {
+                    return new FocasResponse<MacroRangeData>
+                    {
+                        Success = false,
+                        Error = $"{GetErrorString(result)} (IP: {ipAddress}, Port: {port})",
+                        ErrorCode = result
+                    };
+                }
+                handle = opened;
+
+                var data = new MacroRangeData { StartNumber = startNumber, EndNumber = endNumber };
+                bool reconnected = false;
+                // IODBMR in fwlib32.cs holds 5 variables, so the range is read 5 at a time over the same handle
+                for (int chunkStart = startNumber; chunkStart <= endNumber; chunkStart += 5)
+                {
+                    short s = (short)chunkStart;
+                    short e = (short)Math.Min(endNumber, chunkStart + 4);
+                    // length = 8 + 8 * number of variables (IODBMR header + IODBMR_data per variable)
+                    short length = (short)(8 + 8 * (e - s + 1));
+                    var macros = new Focas1.IODBMR();
+                    result = Focas1.cnc_rdmacror(handle.Value, s, e, length, macros);
+                    if ((result == (short)Focas1.focas_ret.EW_HANDLE || result == (short)Focas1.focas_ret.EW_SOCKET) && !reconnected)
+                    {
+                        // The session went stale - reopen it once and retry this chunk
+                        _logger.LogWarning($"Macro read session to {ipAddress} lost ({GetErrorString(result)}). Reconnecting...");
+                        reconnected = true;
+                        Focas1.cnc_freelibhndl(handle.Value);
+                        handle = null;
+                        result = Focas1.cnc_allclibhndl3(ipObj, (ushort)port, timeout, out opened);
+                        if (result == Focas1.EW_OK)
+                        {
+                            handle = opened;
+                            macros = new Focas1.IODBMR();
+                            result = Focas1.cnc_rdmacror(handle.Value, s, e, length, macros);
+                        }
+                    }
+                    if (result != Focas1.EW_OK)
+                    {
+                        return new FocasResponse<MacroRangeData>
+                        {
+                            Success = false,
+                            Error = $"{GetErrorString(result)} (#{s}-#{e})",
+                            ErrorCode = result
+                        };
+                    }
+
+                    var values = new[] { macros.data.data1, macros.data.data2, macros.data.data3, macros.data.data4, macros.data.data5 };
+                    for (int i = 0; i <= e - s; i++)
+                    {
+                        // A vacant variable reads as mcr_val 0, dec_val -1
+                        bool vacant = values[i].mcr_val == 0 && values[i].dec_val == -1;
+                        data.Variables.Add(new MacroVariableData
+                        {
+                            Number = (short)(s + i),
+                            McrVal = values[i].mcr_val,
+                            DecVal = values[i].dec_val,
+                            Value = vacant ? null : values[i].mcr_val / Math.Pow(10, values[i].dec_val)
+                        });
+                    }
+                }
+
+                return new FocasResponse<MacroRangeData>
+                {
+                    Success = true,
+                    Data = data
+                };
+            }
+            catch (Exception ex)
+            {
+                _logger.LogError(ex, "Error reading macro variables from {IpAddress}", ipAddress);
+                return new FocasResponse<MacroRangeData>
+                {
+                    Success = false,
+                    Error = ex.Message
+                };
+            }
+            finally
+            {
+                if (handle != null)
+                {
+                    try
+                    {
+                        Focas1.cnc_freelibhndl(handle.Value);
+                    }
+                    catch (Exception ex)
+                    {
+                        _logger.LogWarning(ex, "Error closing macro read session to {IpAddress}", ipAddress);
+                    }
+                }
+            }
+        }
+    }
+
+    public FocasResponse<T> ReadInSession<T>(string ipAddress, int port, Func<FocasResponse<T>> read, int timeout = 10)
+    {
+        // Reads for the same machine run one at a time; other machines are not blocked
+        var sessionLock = _sessionLocks.GetOrAdd(ipAddress, _ => new object());
+        lock (sessionLock)
+        {
+            var session = new ReadSession { IpAddress = ipAddress, Port = port, Timeout = timeout };
+            try
+            {
+                object ipObj = ipAddress;
+                short result = Focas1.cnc_allclibhndl3(ipObj, (ushort)port, timeout, out ushort opened);
+                if (result != Focas1.EW_OK)
+                {
+                    return new FocasResponse<T>
+                    {
+                        Success = false,
+                        Error = $"{GetErrorString(result)} (IP: {ipAddress}, Port: {port})",
+                        ErrorCode = result
+                    };
+                }
+                session.Handle = opened;
+                _readSession.Value = session;
+                return read();
+            }
+            catch (Exception ex)
+            {
+                _logger.LogError(ex, "Error reading from {IpAddress}", ipAddress);
+                return new FocasResponse<T>
+                {
+                    Success = false,
+                    Error = ex.Message
+                };
+            }
+            finally
+            {
+                _readSession.Value = null;
+                if (session.Handle != null)
+                {
+                    try
+                    {
+                        Focas1.cnc_freelibhndl(session.Handle.Value);
+                    }
+                    catch (Exception ex)
+                    {
+                        _logger.LogWarning(ex, "Error closing read session to {IpAddress}", ipAddress);
+                    }
+                }
+            }
+        }
+    }
+
+    public FocasResponse<TelemetryData> GetTelemetry(string ipAddress, int port = 8193, int timeout = 3)
+    {
+        var sessionLock = _telemetryLocks.GetOrAdd(ipAddress, _ => new object());
+        lock (sessionLock)
+        {
+            try
+            {
+                bool reconnected = false;
+                short result = Focas1.EW_OK;
+                for (int attempt = 0; attempt < 2; attempt++)
+                {
+                    if (!_telemetryHandles.TryGetValue(ipAddress, out ushort handle))
+                    {
+                        object ipObj = ipAddress;
+                        result = Focas1.cnc_allclibhndl3(ipObj, (ushort)port, timeout, out handle);
+                        if (result != Focas1.EW_OK)
+                        {
+                            return new FocasResponse<TelemetryData>
+                            {
+                                Success = false,
+                                Error = $"{GetErrorString(result)} (IP: {ipAddress}, Port: {port})",
+                                ErrorCode = result
+                            };
+                        }
+                        _telemetryHandles[ipAddress] = handle;
+                        reconnected = true;
+                    }
+
+                    var feed = new Focas1.ODBACT();
+                    var spindle = new Focas1.ODBACT();
+                    var axis = new Focas1.ODBAXIS();
+                    result = Focas1.cnc_actf(handle, feed);
+                    if (result == Focas1.EW_OK)
+                        result = Focas1.cnc_acts(handle, spindle);
+                    if (result == Focas1.EW_OK)
+                        result = Focas1.cnc_absolute(handle, Focas1.ALL_AXES, 0, axis);
+
+                    if (result == Focas1.EW_OK)
+                    {
+                        return new FocasResponse<TelemetryData>
+                        {
+                            Success = true,
+                            Data = new TelemetryData
+                            {
+                                Feedrate = feed.data,
+                                SpindleSpeed = spindle.data,
+                                Positions = axis.data.ToList(),
+                                AxisType = axis.type,
+                                Reconnected = reconnected
+                            }
+                        };
+                    }
+
+                    // The session went stale (CNC restarted, network dropped) - reopen it once
+                    CloseTelemetryHandle(ipAddress);
+                    if (result != (short)Focas1.focas_ret.EW_HANDLE && result != (short)Focas1.focas_ret.EW_SOCKET)
+                        break;
+                    _logger.LogWarning($"Telemetry session to {ipAddress} lost ({GetErrorString(result)}). Reconnecting...");
+                }
+
+                return new FocasResponse<TelemetryData>
+                {
+                    Success = false,
+                    Error = GetErrorString(result),
+                    ErrorCode = result
+                };
+            }
+            catch (Exception ex)
+            {
+                CloseTelemetryHandle(ipAddress);
+                _logger.LogError(ex, "Error reading telemetry from {IpAddress}", ipAddress);
+                return new FocasResponse<TelemetryData>
+                {
+                    Success = false,
+                    Error = ex.Message
+                };
+            }
+        }
+    }
+
+    public FocasResponse<string> CloseTelemetrySession(string ipAddress)
+    {
+        var sessionLock = _telemetryLocks.GetOrAdd(ipAddress, _ => new object());
+        lock (sessionLock)
+        {
+            bool closed = CloseTelemetryHandle(ipAddress);
+            return new FocasResponse<string>
+            {
+                Success = true,
+                Data = closed ? "Session closed" : "No open session"
+            };
+        }
+    }
+
+    private bool CloseTelemetryHandle(string ipAddress)
+    {
+        if (!_telemetryHandles.TryRemove(ipAddress, out ushort handle))
+            return false;
+        try
+        {
+            Focas1.cnc_freelibhndl(handle);
+        }
+        catch (Exception ex)
+        {
+            _logger.LogWarning(ex, "Error closing telemetry session to {IpAddress}", ipAddress);
+        }
+        return true;
+    }
+
     private string GetErrorString(short errorCode)
     {
         // Use the enum values from focas_ret
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Admission control for expensive endpoints.
+
+Each endpoint class (kassationer, fleet-scan, focas) runs at most `limit` requests at a time.
+Further requests wait in a bounded priority queue - interactive calls (write-macro) ahead of
+normal reads, and background callers (compensation_monitor.py) last. A request is shed with
+503 and Retry-After when the queue is full or its wait times out, and with 429 when one client
+already has PER_CLIENT_LIMIT requests of the class running or queued.
+"""
+
+import os
+import heapq
+import itertools
+import math
+import threading
+import time
+from typing import Dict, List, Optional
+
+from metrics import REGISTRY
+
+ADMISSION_ENABLED = os.getenv('ADMISSION_ENABLED', 'true').lower() == 'true'
+ADMISSION_QUEUE_SIZE = int(os.getenv('ADMISSION_QUEUE_SIZE', '16'))  # waiting requests per class
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv('ADMISSION_QUEUE_TIMEOUT', '15'))  # max seconds a request waits
+ADMISSION_PER_CLIENT = int(os.getenv('ADMISSION_PER_CLIENT', '2'))  # running + queued per client and class
+
+# Priorities (lower runs first); requests can ask for background with X-Request-Priority
+INTERACTIVE, NORMAL, BACKGROUND = 0, 1, 2
+PRIORITY_NAMES = {'interactive': INTERACTIVE, 'normal': NORMAL, 'background': BACKGROUND}
+
+ADMISSION_QUEUE_DEPTH = REGISTRY.gauge(
+    "admission_queue_depth", "Requests waiting for an admission slot", ("endpoint_class",))
+ADMISSION_ACTIVE = REGISTRY.gauge(
+    "admission_active_requests", "Requests holding an admission slot", ("endpoint_class",))
+ADMISSION_REJECTED = REGISTRY.counter(
+    "admission_rejected_total", "Requests shed by admission control", ("endpoint_class", "reason"))
+ADMISSION_WAIT = REGISTRY.histogram(
+    "admission_wait_seconds", "Time spent queued before admission", ("endpoint_class",),
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0))
+
+
+class AdmissionRejected(Exception):
+    """Request shed by admission control; status is 503 (overload) or 429 (per-client limit)"""
+
+    def __init__(self, endpoint_class: str, reason: str, retry_after: int, status: int = 503):
+        self.endpoint_class = endpoint_class
+        self.reason = reason
+        self.retry_after = retry_after
+        self.status = status
+        super().__init__(f"{endpoint_class} is busy ({reason}), retry in {retry_after} s")
+
+
+def parse_priority(value: Optional[str], default: int = NORMAL) -> int:
+    return PRIORITY_NAMES.get((value or '').strip().lower(), default)
+
+
+class _Waiter:
+    __slots__ = ('priority', 'seq', 'client', 'enqueued', 'wake', 'granted', 'cancelled')
+
+    def __init__(self, priority: int, seq: int, client: str, wake):
+        self.priority = priority
+        self.seq = seq
+        self.client = client
+        self.enqueued = time.monotonic()
+        self.wake = wake
+        self.granted = False
+        self.cancelled = False
+
+    def __lt__(self, other: '_Waiter') -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class Ticket:
+    """Held while a request runs; release() exactly once (also usable as a context manager)"""
+
+    def __init__(self, limiter: 'ConcurrencyLimiter', client: str):
+        self.limiter = limiter
+        self.client = client
+        self.started = time.monotonic()
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self.limiter._release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class ConcurrencyLimiter:
+    def __init__(self, name: str, limit: int, queue_size: int = ADMISSION_QUEUE_SIZE,
+                 queue_timeout: float = ADMISSION_QUEUE_TIMEOUT, per_client: int = ADMISSION_PER_CLIENT):
+        self.name = name
+        self.limit = max(1, limit)
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.per_client = per_client
+        self._lock = threading.Lock()
+        self._queue: List[_Waiter] = []
+        self._seq = itertools.count()
+        self._active = 0
+        self._per_client: Dict[str, int] = {}
+        self._stats = {'admitted': 0, 'enqueued': 0, 'rejected_queue_full': 0, 'rejected_timeout': 0,
+                       'rejected_client_limit': 0, 'evicted': 0, 'max_queue_depth': 0}
+        self._service_avg = 1.0  # EWMA of seconds per request, for Retry-After
+        self._wait_total = 0.0
+
+    # Admission
+
+    def _retry_after(self) -> int:
+        """Seconds until the queue ahead has likely drained"""
+        backlog = (len(self._queue) + self._active) / self.limit
+        return max(1, math.ceil(backlog * self._service_avg))
+
+    def _reject(self, reason: str, status: int = 503) -> AdmissionRejected:
+        self._stats[f'rejected_{reason}'] += 1
+        ADMISSION_REJECTED.inc(endpoint_class=self.name, reason=reason)
+        return AdmissionRejected(self.name, reason, self._retry_after(), status)
+
+    def _try_enter(self, priority: int, client: str, wake) -> Optional[_Waiter]:
+        """Under the lock: take a slot (returns None) or enqueue a waiter; raises when shedding"""
+        if self._per_client.get(client, 0) >= self.per_client:
+            raise self._reject('client_limit', 429)
+        if self._active < self.limit and not self._queue:
+            self._grant(client)
+            return None
+        if len(self._queue) >= self.queue_size:
+            # A full queue makes room for higher-priority work by shedding the lowest-priority waiter
+            lowest = max(self._queue)
+            if lowest.priority <= priority:
+                raise self._reject('queue_full')
+            self._queue.remove(lowest)
+            heapq.heapify(self._queue)
+            lowest.cancelled = True
+            self._client_done(lowest.client)
+            self._stats['evicted'] += 1
+            lowest.wake()
+        waiter = _Waiter(priority, next(self._seq), client, wake)
+        heapq.heappush(self._queue, waiter)
+        self._per_client[client] = self._per_client.get(client, 0) + 1
+        self._stats['enqueued'] += 1
+        self._stats['max_queue_depth'] = max(self._stats['max_queue_depth'], len(self._queue))
+        ADMISSION_QUEUE_DEPTH.set(len(self._queue), endpoint_class=self.name)
+        return waiter
+
+    def _client_done(self, client: str):
+        self._per_client[client] -= 1
+        if not self._per_client[client]:
+            del self._per_client[client]
+
+    def _grant(self, client: str):
+        self._active += 1
+        self._per_client[client] = self._per_client.get(client, 0) + 1
+        self._stats['admitted'] += 1
+        ADMISSION_ACTIVE.set(self._active, endpoint_class=self.name)
+
+    def _abandon(self, waiter: _Waiter) -> Optional[AdmissionRejected]:
+        """Under the lock: a waiter gave up or was evicted; returns the error to raise"""
+        if waiter.granted:
+            return None
+        if waiter.cancelled:
+            return self._reject('queue_full')
+        self._queue.remove(waiter)
+        heapq.heapify(self._queue)
+        self._client_done(waiter.client)
+        ADMISSION_QUEUE_DEPTH.set(len(self._queue), endpoint_class=self.name)
+        return self._reject('timeout')
+
+    def _admitted(self, waiter: _Waiter, client: str) -> Ticket:
+        wait = time.monotonic() - waiter.enqueued if waiter else 0.0
+        self._wait_total += wait
+        ADMISSION_WAIT.observe(wait, endpoint_class=self.name)
+        return Ticket(self, client)
+
+    def acquire(self, priority: int = NORMAL, client: str = '') -> Ticket:
+        """Block until admitted (Flask worker threads); raises AdmissionRejected"""
+        event = threading.Event()
+        with self._lock:
+            waiter = self._try_enter(priority, client, event.set)
+        if waiter is not None:
+            event.wait(self.queue_timeout)
+            with self._lock:
+                error = self._abandon(waiter)
+            if error is not None:
+                raise error
+        return self._admitted(waiter, client)
+
+    def _release(self, ticket: Ticket):
+        duration = time.monotonic() - ticket.started
+        with self._lock:
+            self._service_avg = 0.8 * self._service_avg + 0.2 * duration
+            self._active -= 1
+            self._client_done(ticket.client)
+            # Hand the slot straight to the next waiter
+            if self._queue and self._active < self.limit:
+                waiter = heapq.heappop(self._queue)
+                waiter.granted = True
+                self._active += 1
+                self._stats['admitted'] += 1
+                waiter.wake()
+            ADMISSION_ACTIVE.set(self._active, endpoint_class=self.name)
+            ADMISSION_QUEUE_DEPTH.set(len(self._queue), endpoint_class=self.name)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            admitted = self._stats['admitted']
+            return {
+                "endpoint_class": self.name,
+                "limit": self.limit,
+                "queue_size": self.queue_size,
+                "queue_timeout_seconds": self.queue_timeout,
+                "per_client_limit": self.per_client,
+                "active": self._active,
+                "queued": len(self._queue),
+                "queued_by_priority": {
+                    name: sum(1 for w in self._queue if w.priority == p) for name, p in PRIORITY_NAMES.items()
+                },
+                "avg_service_seconds": round(self._service_avg, 3),
+                "avg_wait_seconds": round(self._wait_total / admitted, 3) if admitted else 0.0,
+                **self._stats,
+            }
+
+
+class AdmissionController:
+    def __init__(self):
+        self._limiters: Dict[str, ConcurrencyLimiter] = {}
+
+    def register(self, name: str, limit: int, **kwargs) -> ConcurrencyLimiter:
+        self._limiters[name] = ConcurrencyLimiter(name, limit, **kwargs)
+        return self._limiters[name]
+
+    def get(self, name: str) -> Optional[ConcurrencyLimiter]:
+        return self._limiters.get(name) if ADMISSION_ENABLED else None
+
+    def stats(self) -> List[Dict]:
+        return [limiter.stats() for limiter in self._limiters.values()]
+
+
+admission = AdmissionController()
+admission.register('kassationer', int(os.getenv('KASSATIONER_CONCURRENCY', '2')))
+admission.register('fleet-scan', int(os.getenv('FLEET_SCAN_CONCURRENCY', '1')), queue_size=2)
+admission.register('focas', int(os.getenv('FOCAS_CONCURRENCY', '8')), queue_size=64)
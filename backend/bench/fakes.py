@@ -0,0 +1,690 @@
+#!/usr/bin/env python3
+"""
+Local stand-ins for the backend's external dependencies, used by the benchmark harness:
+- FakeModbusServer: AdamBox Modbus TCP (function code 3, holding registers)
+- FakeFocasService: FocasService HTTP API with configurable latency, errors and unreachable CNCs
+- FakeMI: SQLite database with the MI tables, exposing the pyodbc subset app.py uses
+- FakePostgREST: Supabase REST (PostgREST) for select/insert/update with the filters the backend uses
+"""
+
+import re
+import json
+import time
+import random
+import socket
+import sqlite3
+import struct
+import threading
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Set
+from urllib.parse import urlparse, parse_qs
+
+
+def _sleep_ms(latency_ms: float, jitter: float = 0.2):
+    if latency_ms > 0:
+        time.sleep(latency_ms * random.uniform(1 - jitter, 1 + jitter) / 1000.0)
+
+
+class _QuietHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 256
+
+
+class _BackgroundServer:
+    """Run a ThreadingHTTPServer in a daemon thread"""
+
+    handler_class = BaseHTTPRequestHandler
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0):
+        handler = type('Handler', (self.handler_class,), {'fake': self})
+        self.httpd = _QuietHTTPServer((host, port), handler)
+        self.host, self.port = self.httpd.server_address[:2]
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class _JSONHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Send headers and body in one segment; separate writes hit delayed-ACK stalls on keep-alive connections
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if not length:
+            return None
+        return json.loads(self.rfile.read(length) or b'null')
+
+    def send_json(self, payload, status: int = 200, headers: Optional[Dict[str, str]] = None):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+# Modbus
+
+class FakeModbusServer:
+    """
+    Modbus TCP server answering 'read holding registers' with a part counter that
+    increases over time. One instance per AdamBox; bind to 127.0.0.N to emulate a fleet.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 15020, latency_ms: float = 2.0,
+                 parts_per_minute: float = 2.0, error_rate: float = 0.0):
+        self.host, self.port = host, port
+        self.latency_ms = latency_ms
+        self.parts_per_minute = parts_per_minute
+        self.error_rate = error_rate
+        self.started_at = time.time()
+        self.base_count = random.randint(1000, 30000)
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind((host, port))
+        self._sock.listen(64)
+        self._stopped = False
+
+    def counter(self) -> int:
+        elapsed_min = (time.time() - self.started_at) / 60.0
+        return int(self.base_count + elapsed_min * self.parts_per_minute) % 65536
+
+    def start(self):
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stopped = True
+        self._sock.close()
+
+    def _accept_loop(self):
+        while not self._stopped:
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn: socket.socket):
+        with conn:
+            while True:
+                try:
+                    frame = conn.recv(260)
+                except OSError:
+                    return
+                if len(frame) < 12:
+                    return
+                t_id, p_id, _length, unit_id, f_code, address, count = struct.unpack('>HHHBBHH', frame[:12])
+                _sleep_ms(self.latency_ms)
+                if random.random() < self.error_rate or f_code != 3:
+                    # Exception response: illegal data address
+                    response = struct.pack('>HHHBBB', t_id, p_id, 3, unit_id, f_code | 0x80, 2)
+                else:
+                    values = [self.counter() if address + i == 2 else 0 for i in range(count)]
+                    payload = struct.pack(f'>B{count}H', count * 2, *values)
+                    response = struct.pack('>HHHBB', t_id, p_id, 2 + len(payload), unit_id, f_code) + payload
+                try:
+                    conn.sendall(response)
+                except OSError:
+                    return
+
+
+# FocasService
+
+class FakeFocasService(_BackgroundServer):
+    """
+    FocasService stand-in. Like the real service it holds a single CNC handle for
+    connect/disconnect callers: reads return data for the CNC connected last. The
+    session routes (/api/focas/sessions/<ip>/...) read the given CNC, one request per
+    CNC at a time.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency_ms: float = 20.0,
+                 per_tool_latency_ms: float = 2.0, error_rate: float = 0.0,
+                 unreachable: Optional[Set[str]] = None, connect_timeout_s: float = 10.0,
+                 drift_probability: float = 0.02):
+        self.latency_ms = latency_ms
+        self.per_tool_latency_ms = per_tool_latency_ms
+        self.error_rate = error_rate
+        self.unreachable = set(unreachable or ())
+        self.connect_timeout_s = connect_timeout_s
+        self.drift_probability = drift_probability
+        self.connected_ip: Optional[str] = None
+        self.tool_offsets: Dict[str, Dict[int, List[int]]] = {}
+        self.work_offsets: Dict[str, Dict[int, List[int]]] = {}
+        self.macros: Dict[str, Dict[int, float]] = {}
+        self.calls: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._session_locks: Dict[str, threading.Lock] = {}
+        super().__init__(host, port)
+
+    def _machine_tools(self, ip: str) -> Dict[int, List[int]]:
+        tools = self.tool_offsets.get(ip)
+        if tools is None:
+            rnd = random.Random(ip)
+            tools = {t: [rnd.randint(0, 8000), rnd.randint(-200, 200), rnd.randint(50000, 250000), rnd.randint(-500, 500)]
+                     for t in range(1, 201)}
+            self.tool_offsets[ip] = tools
+        # Operators adjust wear now and then
+        for values in tools.values():
+            if random.random() < self.drift_probability:
+                values[1] += random.choice((-5, -2, 2, 5))
+                values[3] += random.choice((-10, -5, 5, 10))
+        return tools
+
+    def _machine_work_offsets(self, ip: str) -> Dict[int, List[int]]:
+        offsets = self.work_offsets.get(ip)
+        if offsets is None:
+            rnd = random.Random(ip + 'wzo')
+            offsets = {n: [rnd.randint(-400000, 400000) for _ in range(5)] for n in range(1, 61)}
+            self.work_offsets[ip] = offsets
+        return offsets
+
+    def _count(self, name: str):
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+    def _session_lock(self, ip: str) -> threading.Lock:
+        # FocasService serialises sessions per IP
+        with self._lock:
+            return self._session_locks.setdefault(ip, threading.Lock())
+
+    class handler_class(_JSONHandler):
+        def _fail_randomly(self) -> bool:
+            if random.random() < self.fake.error_rate:
+                self.send_json({"success": False, "error": "EW_SOCKET: Socket error", "errorCode": -16})
+                return True
+            return False
+
+        def _require_connection(self) -> Optional[str]:
+            ip = self.fake.connected_ip
+            if ip is None:
+                self.send_json({"success": False, "error": "Not connected", "errorCode": 0})
+            return ip
+
+        def do_POST(self):
+            fake = self.fake
+            path = urlparse(self.path).path
+            body = self.read_json() or {}
+            fake._count(path)
+
+            if path == '/api/focas/connect':
+                ip = body.get('ipAddress')
+                if ip in fake.unreachable:
+                    time.sleep(fake.connect_timeout_s)
+                    return self.send_json({"success": False, "error": f"EW_SOCKET (IP: {ip}, Port: 8193)",
+                                           "errorCode": -16}, status=400)
+                _sleep_ms(fake.latency_ms)
+                fake.connected_ip = ip
+                return self.send_json({"success": True, "data": "Connected with handle: 1"})
+
+            if path == '/api/focas/disconnect':
+                _sleep_ms(fake.latency_ms / 4)
+                if fake.connected_ip is None:
+                    return self.send_json({"success": False, "error": "Not connected"}, status=400)
+                fake.connected_ip = None
+                return self.send_json({"success": True, "data": "Disconnected"})
+
+            if path == '/api/focas/write-macro':
+                ip = self._require_connection()
+                if ip is None or self._fail_randomly():
+                    return
+                _sleep_ms(fake.latency_ms)
+                fake.macros.setdefault(ip, {})[int(body.get('number', 0))] = \
+                    body.get('mcrVal', 0) / (10 ** int(body.get('decVal', 0) or 0))
+                return self.send_json({"success": True, "data": body})
+
+            if path.startswith('/api/focas/sessions/') and path.endswith('/write-macros'):
+                # Own session per machine, independent of the shared handle
+                ip = path.split('/')[4]
+                if ip in fake.unreachable:
+                    time.sleep(fake.connect_timeout_s)
+                    return self.send_json({"success": False, "error": f"EW_SOCKET (IP: {ip}, Port: 8193)",
+                                           "errorCode": -16})
+                if self._fail_randomly():
+                    return
+                results = []
+                for write in body.get('writes', []):
+                    _sleep_ms(fake.latency_ms)
+                    fake.macros.setdefault(ip, {})[int(write.get('number', 0))] = \
+                        write.get('mcrVal', 0) / (10 ** int(write.get('decVal', 0) or 0))
+                    results.append({**write, "success": True, "error": None, "errorCode": 0,
+                                    "elapsedMs": fake.latency_ms})
+                return self.send_json({"success": True, "data": results, "errorCode": 0})
+
+            if path == '/api/focas/tool-radius':
+                return self.send_json({"success": True, "data": {"radius": 500, "toolGroup": 0,
+                                                                 "toolNumber": body.get('toolNumber', 0)}})
+
+            self.send_json({"error": "Not found"}, status=404)
+
+        def do_GET(self):
+            fake = self.fake
+            path = urlparse(self.path).path
+            parts = path.strip('/').split('/')
+            fake._count('/'.join(p for p in parts if not p.lstrip('-').isdigit()))
+
+            if path == '/api/focas/status':
+                return self.send_json({"status": "FOCAS Service is running"})
+
+            if parts[2] == 'sessions' and parts[4] == 'macros':
+                # Own session per machine, independent of the shared handle
+                ip, start, end = parts[3], int(parts[5]), int(parts[6])
+                if ip in fake.unreachable:
+                    time.sleep(fake.connect_timeout_s)
+                    return self.send_json({"success": False, "error": f"EW_SOCKET (IP: {ip}, Port: 8193)",
+                                           "errorCode": -16})
+                if self._fail_randomly():
+                    return
+                _sleep_ms(fake.latency_ms + fake.per_tool_latency_ms * (end - start + 1) / 5)
+                macros = fake.macros.get(ip, {})
+                return self.send_json({"success": True, "data": {"startNumber": start, "endNumber": end, "variables": [
+                    {"number": n, "mcrVal": 0, "decVal": -1, "value": None} if n not in macros else
+                    {"number": n, "mcrVal": int(round(macros[n] * 1000)), "decVal": 3, "value": macros[n]}
+                    for n in range(start, end + 1)
+                ]}, "errorCode": 0})
+
+            if parts[2] == 'sessions':
+                # Read in a session of its own for the machine
+                ip = parts[3]
+                if ip in fake.unreachable:
+                    time.sleep(fake.connect_timeout_s)
+                    return self.send_json({"success": False, "error": f"EW_SOCKET (IP: {ip}, Port: 8193)",
+                                           "errorCode": -16})
+                with fake._session_lock(ip):
+                    if not self._fail_randomly():
+                        self._read(ip, parts[:2] + parts[4:])
+                return
+
+            ip = self._require_connection()
+            if ip is None or self._fail_randomly():
+                return
+            self._read(ip, parts)
+
+        def _read(self, ip: str, parts: List[str]):
+            fake = self.fake
+            if parts[2] == 'tool-offsets-range':
+                start, end = int(parts[3]), int(parts[4])
+                _sleep_ms(fake.latency_ms + fake.per_tool_latency_ms * (end - start + 1))
+                tools = fake._machine_tools(ip)
+                return self.send_json({"success": True, "data": {"tools": [
+                    {"toolNumber": t, "cutterRadiusGeometry": tools[t][0], "cutterRadiusWear": tools[t][1],
+                     "toolLengthGeometry": tools[t][2], "toolLengthWear": tools[t][3]}
+                    for t in range(start, end + 1) if t in tools
+                ]}, "errorCode": 0})
+
+            if parts[2] == 'tool-offsets':
+                _sleep_ms(fake.latency_ms)
+                values = fake._machine_tools(ip).get(int(parts[3]))
+                if values is None:
+                    return self.send_json({"success": False, "error": "EW_NUMBER", "errorCode": 3})
+                return self.send_json({"success": True, "data": {
+                    "toolNumber": int(parts[3]), "cutterRadiusGeometry": values[0], "cutterRadiusWear": values[1],
+                    "toolLengthGeometry": values[2], "toolLengthWear": values[3]}, "errorCode": 0})
+
+            if parts[2] == 'work-zero-offsets-range-single':
+                axis, start, end = int(parts[3]), int(parts[4]), int(parts[5])
+                _sleep_ms(fake.latency_ms + fake.per_tool_latency_ms * (end - start + 1) / 4)
+                if axis > 4:
+                    return self.send_json({"success": False, "error": "EW_ATTRIB: axis not supported", "errorCode": 4})
+                offsets = fake._machine_work_offsets(ip)
+                data = [offsets.get(n - 6, [0] * 5)[axis - 1] for n in range(start, end + 1)]
+                return self.send_json({"success": True, "data": {"startNumber": start, "endNumber": end,
+                                                                 "axis": axis, "data": data}})
+
+            if parts[2] == 'work-zero-offset':
+                _sleep_ms(fake.latency_ms)
+                number, axis = int(parts[3]), int(parts[4])
+                values = fake._machine_work_offsets(ip).get(number, [0] * 5)
+                return self.send_json({"success": True, "data": {"number": number, "axis": axis,
+                                                                 "data": values if axis < 0 else [values[axis - 1]]}})
+
+            if parts[2] == 'tool-radius':
+                _sleep_ms(fake.latency_ms)
+                return self.send_json({"success": True, "data": {"radius": 500, "toolGroup": 0,
+                                                                 "toolNumber": int(parts[-1])}})
+
+            if parts[2] == 'feedrate':
+                _sleep_ms(fake.latency_ms)
+                return self.send_json({"success": True, "data": {"feedrate": random.randint(0, 5000)}})
+
+            if parts[2] == 'spindle-speed':
+                _sleep_ms(fake.latency_ms)
+                return self.send_json({"success": True, "data": {"speed": random.randint(0, 12000)}})
+
+            if parts[2] == 'absolute-position':
+                _sleep_ms(fake.latency_ms)
+                return self.send_json({"success": True, "data": {
+                    "positions": [random.randint(-500000, 500000) for _ in range(5)], "axisType": 0}})
+
+            self.send_json({"error": "Not found"}, status=404)
+
+
+# MI (Monitor) database
+
+MI_SCHEMA = """
+CREATE TABLE machine_information (machine_id INTEGER PRIMARY KEY, work_center_number TEXT, state INTEGER,
+    is_setup INTEGER, indirect_code TEXT, last_reporting_time TIMESTAMP);
+CREATE TABLE work_log_item (id INTEGER PRIMARY KEY, work_center_number TEXT, indirect_code TEXT, report_time TIMESTAMP);
+CREATE INDEX work_log_item_wc ON work_log_item (work_center_number, report_time);
+CREATE TABLE current_work (id INTEGER PRIMARY KEY, work_center_number TEXT, order_number TEXT, part_number TEXT,
+    report_number INTEGER, start_time TIMESTAMP, end_time TIMESTAMP);
+CREATE TABLE report_item (id INTEGER PRIMARY KEY, report_number INTEGER, machine_id INTEGER, part_number TEXT,
+    extra_info TEXT, reported_quantity INTEGER, rejected_quantity INTEGER, report_item_summary_id INTEGER);
+CREATE TABLE report_item_summary (id INTEGER PRIMARY KEY, start_time TIMESTAMP, end_time TIMESTAMP);
+CREATE TABLE material_work_log_item (id INTEGER PRIMARY KEY, machine_id INTEGER, report_number INTEGER,
+    part_number TEXT, rejected_pieces INTEGER, rejected_code TEXT, operator_id INTEGER, report_time TIMESTAMP);
+CREATE INDEX material_wli_time ON material_work_log_item (report_time);
+CREATE TABLE manual_work_log_item (id INTEGER PRIMARY KEY, machine_id INTEGER, report_number INTEGER,
+    part_number TEXT, rejected_pieces INTEGER, rejected_code TEXT, comment TEXT, operator_id INTEGER,
+    report_time TIMESTAMP);
+CREATE INDEX manual_wli_time ON manual_work_log_item (report_time);
+CREATE TABLE Person (Id INTEGER PRIMARY KEY, FirstName TEXT, LastName TEXT);
+"""
+
+
+def translate_mi_sql(sql: str) -> str:
+    """Rewrite the PostgreSQL dialect used against MI into SQLite"""
+    sql = sql.replace('"mi_001.1".public.', '').replace('monitor.Person', 'Person')
+    sql = re.sub(r"\s+AT TIME ZONE '[^']+'", '', sql)
+    sql = re.sub(r'::\w+', '', sql)
+    return sql
+
+
+def _parse_timestamp(value: bytes):
+    return datetime.fromisoformat(value.decode())
+
+
+sqlite3.register_converter('TIMESTAMP', _parse_timestamp)
+sqlite3.register_adapter(datetime, lambda d: d.astimezone(timezone.utc).replace(tzinfo=None).isoformat(' ')
+                         if d.tzinfo else d.isoformat(' '))
+
+
+class FakeRow(tuple):
+    """pyodbc.Row look-alike: index and attribute access"""
+
+    def __new__(cls, values, columns):
+        row = super().__new__(cls, values)
+        row._columns = columns
+        return row
+
+    def __getattr__(self, item):
+        try:
+            return self[self._columns[item]]
+        except KeyError:
+            raise AttributeError(item)
+
+
+class FakeCursor:
+    def __init__(self, conn: sqlite3.Connection, latency_ms: float):
+        self._cur = conn.cursor()
+        self._latency_ms = latency_ms
+        self._columns: Dict[str, int] = {}
+        self.description = None
+
+    def execute(self, sql: str, *params):
+        if len(params) == 1 and isinstance(params[0], (list, tuple)):
+            params = tuple(params[0])
+        _sleep_ms(self._latency_ms)
+        self._cur.execute(translate_mi_sql(sql), params)
+        self.description = self._cur.description
+        self._columns = {d[0]: i for i, d in enumerate(self._cur.description or ())}
+        return self
+
+    def _wrap(self, row):
+        return FakeRow(row, self._columns) if row is not None else None
+
+    def fetchone(self):
+        return self._wrap(self._cur.fetchone())
+
+    def fetchall(self):
+        return [self._wrap(r) for r in self._cur.fetchall()]
+
+    def fetchmany(self, size: int = 1):
+        return [self._wrap(r) for r in self._cur.fetchmany(size)]
+
+    def close(self):
+        self._cur.close()
+
+
+class FakeConnection:
+    def __init__(self, path: str, latency_ms: float):
+        self._conn = sqlite3.connect(path, detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False)
+        self._latency_ms = latency_ms
+
+    def cursor(self):
+        return FakeCursor(self._conn, self._latency_ms)
+
+    def close(self):
+        self._conn.close()
+
+
+class FakeMI:
+    """SQLite file seeded with MI data for a fleet of work centers"""
+
+    def __init__(self, path: str, work_centers: List[str], days: int = 14, rejects_per_day: int = 20,
+                 query_latency_ms: float = 5.0, seed: int = 1):
+        self.path = path
+        self.work_centers = work_centers
+        self.query_latency_ms = query_latency_ms
+        self._seed(days, rejects_per_day, random.Random(seed))
+
+    def _seed(self, days: int, rejects_per_day: int, rnd: random.Random):
+        conn = sqlite3.connect(self.path, detect_types=sqlite3.PARSE_DECLTYPES)
+        conn.executescript(MI_SCHEMA)
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        codes = ['K01', 'K02', 'K05', 'K11', 'K20']
+        conn.executemany("INSERT INTO Person VALUES (?, ?, ?)",
+                         [(i, f"Operatör{i}", f"Efternamn{i}") for i in range(1, 51)])
+        report_number = 100000
+        summary_id = 0
+        for machine_id, wc in enumerate(self.work_centers, start=1):
+            state = rnd.choice([1, 1, 1, 2, 3, 4, 5])
+            conn.execute("INSERT INTO machine_information VALUES (?, ?, ?, ?, ?, ?)",
+                         (machine_id, wc, state, 1 if state == 5 else 0,
+                          '' if state == 1 else rnd.choice(['S01', 'S04', 'S12']), now))
+            for i in range(days * 10):
+                conn.execute("INSERT INTO work_log_item (work_center_number, indirect_code, report_time) VALUES (?, ?, ?)",
+                             (wc, rnd.choice(['S01', 'S04', 'S12', '']), now - timedelta(minutes=i * 144)))
+            conn.execute("INSERT INTO current_work (work_center_number, order_number, part_number, report_number, start_time, end_time) "
+                         "VALUES (?, ?, ?, ?, ?, NULL)",
+                         (wc, f"ORD{machine_id:05d}", f"P{rnd.randint(10000, 99999)}", report_number, now - timedelta(hours=3)))
+            for day in range(days):
+                day_start = now - timedelta(days=day + 1)
+                summary_id += 1
+                conn.execute("INSERT INTO report_item_summary VALUES (?, ?, ?)",
+                             (summary_id, day_start, day_start + timedelta(hours=23)))
+                report_number += 1
+                part = f"P{rnd.randint(10000, 99999)}"
+                conn.execute("INSERT INTO report_item (report_number, machine_id, part_number, extra_info, "
+                             "reported_quantity, rejected_quantity, report_item_summary_id) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                             (report_number, machine_id, part, None, rnd.randint(200, 800), rnd.randint(0, 20), summary_id))
+                for _ in range(rnd.randint(rejects_per_day // 2, rejects_per_day)):
+                    t = day_start + timedelta(seconds=rnd.randint(0, 86399))
+                    table = 'material_work_log_item' if rnd.random() < 0.7 else 'manual_work_log_item'
+                    if table == 'material_work_log_item':
+                        conn.execute("INSERT INTO material_work_log_item (machine_id, report_number, part_number, "
+                                     "rejected_pieces, rejected_code, operator_id, report_time) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                     (machine_id, report_number, part, rnd.randint(1, 3), rnd.choice(codes),
+                                      rnd.randint(1, 50), t))
+                    else:
+                        conn.execute("INSERT INTO manual_work_log_item (machine_id, report_number, part_number, "
+                                     "rejected_pieces, rejected_code, comment, operator_id, report_time) "
+                                     "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                     (machine_id, report_number, part, rnd.randint(1, 3), rnd.choice(codes),
+                                      'Manuell kassation', rnd.randint(1, 50), t))
+        conn.commit()
+        conn.close()
+
+    def connect(self, *args, **kwargs) -> FakeConnection:
+        return FakeConnection(self.path, self.query_latency_ms)
+
+
+# Supabase (PostgREST)
+
+class FakePostgREST(_BackgroundServer):
+    """In-memory PostgREST subset: GET with filters/order/limit, POST insert, PATCH/DELETE with filters"""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency_ms: float = 30.0,
+                 tables: Optional[Dict[str, List[Dict]]] = None):
+        self.latency_ms = latency_ms
+        self.tables: Dict[str, List[Dict]] = tables or {}
+        self.calls: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        super().__init__(host, port)
+
+    @staticmethod
+    def _matches(row: Dict, filters: List) -> bool:
+        for column, op, value in filters:
+            current = row.get(column)
+            if op == 'is':
+                if (value == 'null') != (current is None):
+                    return False
+                continue
+            if op == 'in':
+                if str(current) not in [v.strip('"') for v in value.strip('()').split(',')]:
+                    return False
+                continue
+            if current is None:
+                return False
+            if op in ('eq', 'neq'):
+                equal = str(current).lower() == value.lower() if isinstance(current, bool) else str(current) == value
+                if equal != (op == 'eq'):
+                    return False
+                continue
+            try:
+                a, b = float(current), float(value)
+            except (TypeError, ValueError):
+                a, b = str(current), value
+            if not {'gt': a > b, 'gte': a >= b, 'lt': a < b, 'lte': a <= b}.get(op, True):
+                return False
+        return True
+
+    class handler_class(_JSONHandler):
+        def _parse(self):
+            if self.command in ('GET', 'DELETE'):
+                self.read_json()  # postgrest-py may send a body; drain it to keep the connection usable
+            parsed = urlparse(self.path)
+            table = parsed.path.rsplit('/', 1)[-1]
+            query = parse_qs(parsed.query, keep_blank_values=True)
+            filters, options = [], {}
+            for key, values in query.items():
+                for value in values:
+                    if key in ('select', 'order', 'limit', 'offset', 'columns', 'on_conflict'):
+                        options[key] = value
+                    elif '.' in value:
+                        op, operand = value.split('.', 1)
+                        if op == 'not':
+                            continue  # Not used by the backend
+                        filters.append((key, op, operand))
+            return table, filters, options
+
+        def _project(self, rows: List[Dict], select: Optional[str]) -> List[Dict]:
+            if not select or select.strip() == '*':
+                return rows
+            columns = [c.strip() for c in select.split(',') if c.strip()]
+            return [{c: r.get(c) for c in columns} for r in rows]
+
+        def _count(self, method: str, table: str):
+            key = f"{method} {table}"
+            with self.fake._lock:
+                self.fake.calls[key] = self.fake.calls.get(key, 0) + 1
+
+        def do_GET(self):
+            table, filters, options = self._parse()
+            self._count('GET', table)
+            _sleep_ms(self.fake.latency_ms)
+            with self.fake._lock:
+                rows = [dict(r) for r in self.fake.tables.get(table, []) if self.fake._matches(r, filters)]
+            for spec in reversed((options.get('order') or '').split(',')):
+                if not spec:
+                    continue
+                column, _, direction = spec.partition('.')
+                desc = direction.startswith('desc')
+                rows.sort(key=lambda r: (r.get(column) is None, r.get(column) or ''), reverse=desc)
+            offset = int(options.get('offset', 0) or 0)
+            if 'limit' in options:
+                rows = rows[offset:offset + int(options['limit'])]
+            elif offset:
+                rows = rows[offset:]
+            self.send_json(self._project(rows, options.get('select')))
+
+        def do_POST(self):
+            table, _, options = self._parse()
+            self._count('POST', table)
+            _sleep_ms(self.fake.latency_ms)
+            payload = self.read_json()
+            rows = payload if isinstance(payload, list) else [payload]
+            inserted = []
+            with self.fake._lock:
+                target = self.fake.tables.setdefault(table, [])
+                for row in rows:
+                    row = dict(row)
+                    row.setdefault('id', f"{table[:8]}-{len(target) + 1}-{random.getrandbits(32):08x}")
+                    target.append(row)
+                    inserted.append(row)
+            self.send_json(inserted, status=201)
+
+        def do_PATCH(self):
+            table, filters, _ = self._parse()
+            self._count('PATCH', table)
+            _sleep_ms(self.fake.latency_ms)
+            changes = self.read_json() or {}
+            updated = []
+            with self.fake._lock:
+                for row in self.fake.tables.get(table, []):
+                    if self.fake._matches(row, filters):
+                        row.update(changes)
+                        updated.append(dict(row))
+            self.send_json(updated)
+
+        def do_DELETE(self):
+            table, filters, _ = self._parse()
+            self._count('DELETE', table)
+            _sleep_ms(self.fake.latency_ms)
+            with self.fake._lock:
+                rows = self.fake.tables.get(table, [])
+                removed = [r for r in rows if self.fake._matches(r, filters)]
+                self.fake.tables[table] = [r for r in rows if not self.fake._matches(r, filters)]
+            self.send_json(removed)
+
+
+def seed_supabase_tables(machines: List[Dict], tools_count: int = 60, seed: int = 1) -> Dict[str, List[Dict]]:
+    """Reference data for FakePostgREST: machines, shared tools and a recent tool change per tool and machine"""
+    rnd = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    tools = [{'id': f"tool-{t}", 'plats': str(t), 'benämning': f"Verktyg {t}",
+              'maxgräns': rnd.choice([None, 500, 1000, 2000, 5000]), 'maxgräns_varning': None}
+             for t in range(1, tools_count + 1)]
+    changes = []
+    for m in machines:
+        for tool in tools:
+            changes.append({'id': f"chg-{m['id']}-{tool['id']}", 'tool_id': tool['id'], 'machine_id': m['id'],
+                            'number_of_parts_ADAM': rnd.randint(0, 30000),
+                            'date_created': (now - timedelta(days=rnd.randint(0, 30))).isoformat()})
+    return {
+        'verktygshanteringssystem_maskiner': machines,
+        'verktygshanteringssystem_verktyg': tools,
+        'verktygshanteringssystem_verktygsbyteslista': changes,
+        'verktygshanteringssystem_kompenseringar_nuvarande': [],
+        'verktygshanteringssystem_kompenseringar': [],
+    }
@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+"""
+Replay recorded upstream traffic (traffic_capture.py) so app.py and compensation_monitor.py
+can run against a captured day on the shop floor without CNCs, AdamBoxes or FocasService.
+
+serve starts stand-ins that answer with the recorded responses:
+- FocasService: responses keyed by (connected CNC, method, path, request body), returned in
+  recorded order and repeated from the start once used up; failed exchanges drop the connection
+- AdamBox Modbus: one server per recorded AdamBox on 127.0.0.N (Linux), answering with the
+  recorded frames (transaction id rewritten to match the request)
+- Backend (for compensation_monitor.py): the backend responses the monitor recorded
+- Supabase: FakePostgREST seeded with one machine per recorded CNC/AdamBox address
+Latency is the recorded duration divided by --speed (0 answers at once).
+
+Usage (from backend/):
+    TRAFFIC_CAPTURE_FILE='cache/capture/{process}-{pid}.ndjson.gz' python app.py
+    python bench/replay.py info cache/capture/app-1234.ndjson.gz
+    python bench/replay.py serve cache/capture/*.ndjson.gz --speed 10
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import socket
+import argparse
+import threading
+from collections import defaultdict, deque
+from itertools import zip_longest
+from typing import Deque, Dict, List, Optional
+from urllib.parse import urlparse
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BACKEND_DIR)
+
+from fakes import _BackgroundServer, _JSONHandler, FakePostgREST, seed_supabase_tables  # noqa: E402
+from run_bench import free_port, percentile  # noqa: E402
+from traffic_capture import decode_body, read_capture  # noqa: E402
+
+_IP_SEGMENT = re.compile(r'/\d{1,3}(?:\.\d{1,3}){3}(?=/|$)')
+_NUMBER_SEGMENT = re.compile(r'/-?\d+(?=/|$)')
+
+
+def path_pattern(path: str) -> str:
+    """Path with the query, CNC addresses and numbers collapsed, for grouping"""
+    path = _IP_SEGMENT.sub('/{ip}', urlparse(path).path)
+    return _NUMBER_SEGMENT.sub('/{n}', path)
+
+
+def load_captures(paths: List[str]) -> Dict[str, List[Dict]]:
+    """Records of all files grouped as 'capture' (headers), 'focas', 'backend' and 'modbus'"""
+    grouped: Dict[str, List[Dict]] = defaultdict(list)
+    for path in paths:
+        for record in read_capture(path):
+            if record['k'] == 'http':
+                grouped[record['svc']].append(record)
+            else:
+                grouped[record['k']].append(record)
+    for records in grouped.values():
+        records.sort(key=lambda r: r.get('t', 0))
+    return grouped
+
+
+def _body_key(body) -> Optional[str]:
+    return None if body is None else json.dumps(body, sort_keys=True)
+
+
+class ReplayHTTPService(_BackgroundServer):
+    """Answers HTTP requests with recorded responses; track_connect emulates FocasService's single CNC handle"""
+
+    def __init__(self, records: List[Dict], speed: float, track_connect: bool = False,
+                 host: str = '127.0.0.1', port: int = 0):
+        self.speed = speed
+        self.track_connect = track_connect
+        self.connected_ip: Optional[str] = None
+        self.responses: Dict[tuple, Deque[Dict]] = defaultdict(deque)
+        self.any_cnc: Dict[tuple, Deque[Dict]] = defaultdict(deque)
+        for r in records:
+            key = (r['m'], r['p'], _body_key(r.get('q')))
+            self.responses[(r.get('ip'),) + key].append(r)
+            self.any_cnc[key].append(r)
+        self.served = 0
+        self.missing: Dict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+        super().__init__(host, port)
+
+    def next_response(self, method: str, path: str, body) -> Optional[Dict]:
+        key = (method, path, _body_key(body))
+        with self._lock:
+            # Fall back to the same call recorded for another CNC before giving up
+            for responses in (self.responses.get((self.connected_ip,) + key), self.any_cnc.get(key)):
+                if responses:
+                    record = responses[0]
+                    responses.rotate(-1)
+                    self.served += 1
+                    return record
+            self.missing[f"{method} {path_pattern(path)}"] += 1
+            return None
+
+    def delay(self, record: Dict):
+        if self.speed > 0:
+            time.sleep(record.get('d', 0) / self.speed)
+
+    class handler_class(_JSONHandler):
+        def _replay(self, method: str):
+            fake = self.fake
+            body = self.read_json()
+            if fake.track_connect and self.path.startswith('/api/focas/connect') and isinstance(body, dict):
+                fake.connected_ip = body.get('ipAddress')
+            record = fake.next_response(method, self.path, body)
+            if record is None:
+                return self.send_json({"success": False, "error": f"No recorded response for {method} {self.path}"},
+                                      status=404)
+            fake.delay(record)
+            if 'e' in record:
+                # Recorded as a connection error or timeout: close without answering
+                self.close_connection = True
+                return
+            payload = decode_body(record.get('b'))
+            self.send_response(record.get('s') or 200)
+            self.send_header('Content-Type', record.get('ct') or 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            self._replay('GET')
+
+        def do_POST(self):
+            self._replay('POST')
+
+        def do_PUT(self):
+            self._replay('PUT')
+
+        def do_DELETE(self):
+            self._replay('DELETE')
+
+
+class ReplayModbusServer:
+    """Modbus TCP server answering with the recorded frames of one AdamBox (or of all, when shared)"""
+
+    def __init__(self, host: str, port: int, records: List[Dict], speed: float):
+        self.host, self.port = host, port
+        self.speed = speed
+        self.records: Deque[Dict] = deque(records)
+        self.served = 0
+        self._lock = threading.Lock()
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind((host, port))
+        self._sock.listen(64)
+        self._stopped = False
+
+    def start(self):
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stopped = True
+        self._sock.close()
+
+    def _next(self) -> Dict:
+        with self._lock:
+            record = self.records[0]
+            self.records.rotate(-1)
+            self.served += 1
+            return record
+
+    def _delay(self, record: Dict):
+        if self.speed > 0:
+            time.sleep(record.get('d', 0) / self.speed)
+
+    def _accept_loop(self):
+        while not self._stopped:
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn: socket.socket):
+        with conn:
+            record = self._next()
+            if 'tx' not in record:
+                # Connect failed when recorded: hold a timeout, drop a refused connection at once
+                if record.get('e') != 'refused':
+                    self._delay(record)
+                return
+            while True:
+                try:
+                    frame = conn.recv(260)
+                except OSError:
+                    return
+                if len(frame) < 12:
+                    return
+                record = record or self._next()
+                self._delay(record)
+                if 'rx' not in record:
+                    return
+                response = bytes.fromhex(record['rx'])
+                try:
+                    conn.sendall(frame[:2] + response[2:])
+                except OSError:
+                    return
+                record = None
+
+def _focas_ips(grouped: Dict[str, List[Dict]]) -> List[str]:
+    ips = {r['q'].get('ipAddress') for r in grouped.get('focas', []) if isinstance(r.get('q'), dict)}
+    # The monitor's backend paths carry the CNC address: /api/focas/<operation>/<ip>/...
+    for r in grouped.get('backend', []):
+        match = _IP_SEGMENT.search(urlparse(r['p']).path)
+        if match:
+            ips.add(match.group(0).lstrip('/'))
+    return sorted(ip for ip in ips if ip)
+
+
+def info(paths: List[str]):
+    grouped = load_captures(paths)
+    for header in grouped.get('capture', []):
+        print(f"{header.get('process')} on {header.get('host')} (pid {header.get('pid')}), started {header.get('started_at')}")
+    records = [r for key, rs in grouped.items() if key != 'capture' for r in rs]
+    if not records:
+        print("No records")
+        return
+    span_s = max(r['t'] + r['d'] for r in records) - min(r['t'] for r in records)
+    print(f"{len(records)} records over {span_s:.1f} s")
+
+    def row(name: str, rs: List[Dict]):
+        durations = sorted(r['d'] for r in rs)
+        errors = sum(1 for r in rs if 'e' in r or (r.get('s') or 200) >= 400)
+        print(f"  {name:<58} {len(rs):>7} {errors:>6} {percentile(durations, 50) * 1000:>9.1f} "
+              f"{percentile(durations, 99) * 1000:>9.1f}")
+
+    for service in ('focas', 'backend'):
+        if not grouped.get(service):
+            continue
+        print(f"\n{service}:")
+        print(f"  {'request':<58} {'count':>7} {'errors':>6} {'p50 ms':>9} {'p99 ms':>9}")
+        by_pattern = defaultdict(list)
+        for r in grouped[service]:
+            by_pattern[f"{r['m']} {path_pattern(r['p'])}"].append(r)
+        for name in sorted(by_pattern):
+            row(name, by_pattern[name])
+    if grouped.get('modbus'):
+        print("\nmodbus:")
+        print(f"  {'adambox':<58} {'count':>7} {'errors':>6} {'p50 ms':>9} {'p99 ms':>9}")
+        by_ip = defaultdict(list)
+        for r in grouped['modbus']:
+            by_ip[f"{r['ip']}:{r['port']}"].append(r)
+        for name in sorted(by_ip):
+            row(name, by_ip[name])
+    print(f"\nCNCs: {', '.join(_focas_ips(grouped)) or '-'}")
+
+
+def serve(args):
+    grouped = load_captures(args.captures)
+    host = args.host
+    servers = []
+    env = {}
+
+    focas = ReplayHTTPService(grouped.get('focas', []), args.speed, track_connect=True,
+                              host=host, port=args.focas_port).start()
+    servers.append(focas)
+    env['FOCAS_SERVICE_URL'] = focas.url
+
+    backend = None
+    if grouped.get('backend'):
+        backend = ReplayHTTPService(grouped['backend'], args.speed, host=host, port=args.backend_port).start()
+        servers.append(backend)
+        env['VITE_BACKEND_URL'] = backend.url
+
+    # One Modbus server per recorded AdamBox on 127.0.0.N; fall back to a shared server elsewhere
+    modbus_port = args.modbus_port or free_port()
+    by_ip: Dict[str, List[Dict]] = defaultdict(list)
+    for r in grouped.get('modbus', []):
+        by_ip[r['ip']].append(r)
+    adambox_map: Dict[str, str] = {}
+    modbus_servers: List[ReplayModbusServer] = []
+    try:
+        for n, ip in enumerate(sorted(by_ip), start=2):
+            address = f"127.0.0.{n}"
+            adambox_map[ip] = address
+            if all(r.get('e') == 'refused' for r in by_ip[ip]):
+                continue  # Never answered when recorded: leave the port closed so connects are refused
+            modbus_servers.append(ReplayModbusServer(address, modbus_port, by_ip[ip], args.speed).start())
+    except OSError:
+        for server in modbus_servers:
+            server.stop()
+        modbus_servers = [ReplayModbusServer('127.0.0.1', modbus_port, grouped['modbus'], args.speed).start()]
+        adambox_map = {ip: '127.0.0.1' for ip in by_ip}
+    if by_ip:
+        env['ADAMBOX_PORT'] = str(modbus_port)
+
+    supabase = None
+    if not args.no_supabase:
+        machines = []
+        for n, (ip_focas, ip_adambox) in enumerate(zip_longest(_focas_ips(grouped), sorted(adambox_map)), start=1):
+            # The capture does not say which AdamBox belongs to which CNC; they are paired in address order
+            machine_number = str(9000 + n)
+            machines.append({
+                'id': f"00000000-0000-4000-8000-{n:012d}",
+                'maskiner_nummer': machine_number,
+                'maskin_namn': f"Replay {machine_number}",
+                'ip_focas': ip_focas,
+                'ip_adambox': adambox_map.get(ip_adambox),
+            })
+        supabase = FakePostgREST(host=host, port=args.supabase_port, latency_ms=0,
+                                 tables=seed_supabase_tables(machines, args.tools)).start()
+        servers.append(supabase)
+        env.update({'VITE_SUPABASE_URL': supabase.url, 'VITE_SUPABASE_ANON_KEY': 'replay.anon.key'})
+        for m in machines:
+            print(f"Machine {m['maskiner_nummer']}: CNC {m['ip_focas'] or '-'}, AdamBox {m['ip_adambox'] or '-'}")
+
+    print(f"Replaying {len(grouped.get('focas', []))} FocasService, {len(grouped.get('backend', []))} backend and "
+          f"{len(grouped.get('modbus', []))} Modbus records at speed {args.speed or 'instant'}")
+    for ip, address in sorted(adambox_map.items()):
+        print(f"AdamBox {ip} -> {address}:{modbus_port}")
+    print("\nEnvironment for app.py / compensation_monitor.py:")
+    for key, value in env.items():
+        print(f"  {key}={value}")
+    print("\nCtrl+C to stop")
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for server in servers:
+            server.stop()
+        for server in modbus_servers:
+            server.stop()
+
+    print(f"\nServed: FocasService {focas.served}, backend {backend.served if backend else 0}, "
+          f"Modbus {sum(s.served for s in modbus_servers)}")
+    for service in (focas, backend):
+        for name, count in sorted((service.missing if service else {}).items()):
+            print(f"  not recorded: {name} x{count}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or replay traffic captured with TRAFFIC_CAPTURE_FILE")
+    sub = parser.add_subparsers(dest='command', required=True)
+    info_parser = sub.add_parser('info', help='Summarise one or more capture files')
+    info_parser.add_argument('captures', nargs='+')
+    serve_parser = sub.add_parser('serve', help='Serve the recorded traffic to app.py and compensation_monitor.py')
+    serve_parser.add_argument('captures', nargs='+')
+    serve_parser.add_argument('--speed', type=float, default=1.0, help='Latency divisor: 1 = recorded timing, 0 = no delay')
+    serve_parser.add_argument('--host', default='127.0.0.1')
+    serve_parser.add_argument('--focas-port', type=int, default=0)
+    serve_parser.add_argument('--backend-port', type=int, default=0, help='Recorded backend for compensation_monitor.py')
+    serve_parser.add_argument('--modbus-port', type=int, default=0)
+    serve_parser.add_argument('--supabase-port', type=int, default=0)
+    serve_parser.add_argument('--tools', type=int, default=60, help='Tools in the seeded verktyg table')
+    serve_parser.add_argument('--no-supabase', action='store_true', help='Do not start the seeded Supabase stand-in')
+    args = parser.parse_args()
+
+    if args.command == 'info':
+        info(args.captures)
+    else:
+        serve(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+"""
+Benchmark harness for the backend hot paths.
+Starts local stand-ins (bench/fakes.py) for AdamBox Modbus, FocasService, the MI
+database and Supabase, serves app.py on a local port and drives a configurable
+fleet through the scenarios below, reporting throughput and p50/p99 latency.
+
+Usage (from backend/):
+    python bench/run_bench.py --machines 20 --duration 10 --concurrency 8
+    python bench/run_bench.py --scenarios machine-status,kassationer --json before.json
+    python bench/run_bench.py --compare before.json after.json
+"""
+
+import os
+import sys
+import json
+import time
+import types
+import socket
+import random
+import sqlite3
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BACKEND_DIR)
+
+from fakes import (  # noqa: E402
+    FakeModbusServer, FakeFocasService, FakeMI, FakePostgREST, seed_supabase_tables,
+)
+
+HTTP_SCENARIOS = ['machine-status', 'kassationer', 'focas-tool-offsets-range', 'focas-work-zero-offsets',
+                  'fleet-snapshot']
+CYCLE_SCENARIOS = ['check-tool-max-limits', 'compensation-monitor']
+ALL_SCENARIOS = HTTP_SCENARIOS + CYCLE_SCENARIOS
+
+
+def percentile(sorted_values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+
+def summarize(name: str, latencies: List[float], errors: int, wall_seconds: float,
+              requests: Optional[int] = None, rejected: Optional[int] = None, shed: Optional[int] = None) -> Dict:
+    """latencies are successful requests only; requests counts everything issued (default: len(latencies) + errors)"""
+    latencies = sorted(latencies)
+    ms = lambda v: round(v * 1000.0, 2) if v is not None else None  # noqa: E731
+    return {
+        "scenario": name,
+        "requests": requests if requests is not None else len(latencies) + errors,
+        "errors": errors,
+        "rejected_429": rejected,
+        "shed_503": shed,
+        "wall_seconds": round(wall_seconds, 3),
+        "throughput_per_s": round(len(latencies) / wall_seconds, 2) if wall_seconds > 0 else None,
+        "p50_ms": ms(percentile(latencies, 50)),
+        "p90_ms": ms(percentile(latencies, 90)),
+        "p99_ms": ms(percentile(latencies, 99)),
+        "max_ms": ms(latencies[-1] if latencies else None),
+    }
+
+
+def free_port(host: str = '127.0.0.1') -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind((host, 0))
+        return s.getsockname()[1]
+
+
+class Fleet:
+    """Fake machines plus the stand-in services they talk to"""
+
+    def __init__(self, args, work_dir: str):
+        self.machines: List[Dict] = []
+        self.modbus: List[FakeModbusServer] = []
+        modbus_port = free_port()
+        shared_modbus = None
+        unreachable = set()
+
+        for n in range(1, args.machines + 1):
+            machine_number = str(5100 + n)
+            ip_focas = f"10.10.0.{n}"
+            # One Modbus server per AdamBox on 127.0.0.N (Linux); fall back to a shared server elsewhere
+            ip_adambox = f"127.0.0.{n + 1}"
+            if shared_modbus is None:
+                try:
+                    self.modbus.append(FakeModbusServer(ip_adambox, modbus_port, args.modbus_latency_ms).start())
+                except OSError:
+                    shared_modbus = FakeModbusServer('127.0.0.1', modbus_port, args.modbus_latency_ms).start()
+                    self.modbus.append(shared_modbus)
+            if shared_modbus is not None:
+                ip_adambox = '127.0.0.1'
+            if n <= args.unreachable:
+                unreachable.add(ip_focas)
+            self.machines.append({
+                'id': f"00000000-0000-4000-8000-{n:012d}",
+                'maskiner_nummer': machine_number,
+                'maskin_namn': f"Maskin {machine_number}",
+                'ip_focas': ip_focas,
+                'ip_adambox': ip_adambox,
+            })
+
+        self.modbus_port = modbus_port
+        self.work_centers = [m['maskiner_nummer'] for m in self.machines]
+        self.focas = FakeFocasService(latency_ms=args.focas_latency_ms, per_tool_latency_ms=args.focas_per_tool_ms,
+                                      error_rate=args.focas_error_rate, unreachable=unreachable,
+                                      connect_timeout_s=args.connect_timeout).start()
+        self.supabase = FakePostgREST(latency_ms=args.supabase_latency_ms,
+                                      tables=seed_supabase_tables(self.machines, args.tools)).start()
+        self.mi = FakeMI(os.path.join(work_dir, 'mi.sqlite3'), self.work_centers,
+                         days=args.days, rejects_per_day=args.rejects_per_day,
+                         query_latency_ms=args.mi_latency_ms)
+
+    def stop(self):
+        for server in self.modbus:
+            server.stop()
+        self.focas.stop()
+        self.supabase.stop()
+
+
+def configure_environment(fleet: Fleet, work_dir: str, backend_url: str, args):
+    """Point app.py and compensation_monitor.py at the stand-ins (must run before importing them)"""
+    os.environ.update({
+        'FOCAS_SERVICE_URL': fleet.focas.url,
+        'VITE_SUPABASE_URL': fleet.supabase.url,
+        'VITE_SUPABASE_ANON_KEY': 'bench.anon.key',
+        'VITE_BACKEND_URL': backend_url,
+        'ADAMBOX_PORT': str(fleet.modbus_port),
+        'REFERENCE_CACHE_DIR': os.path.join(work_dir, 'reference'),
+        # State and lease files: a run must neither read nor overwrite backend/cache of a real install
+        'COMPENSATION_STATE_DIR': os.path.join(work_dir, 'monitor_state'),
+        'COMPENSATION_HISTORY_DIR': os.path.join(work_dir, 'compensation_history'),
+        'KASSATIONER_ROLLUP_DIR': os.path.join(work_dir, 'kassationer_rollup'),
+        'STOP_CODES_DIR': os.path.join(work_dir, 'stop_codes'),
+        'OEE_STATE_DIR': os.path.join(work_dir, 'oee'),
+        'WEAR_ANALYTICS_DIR': os.path.join(work_dir, 'wear_analytics'),
+        'SCHEDULER_LEASE_DB': os.path.join(work_dir, 'scheduler_leases.db'),
+        'COMPENSATION_LEASE_DB': os.path.join(work_dir, 'monitor_leases.db'),
+        'TRACE_EXPORT_FILE': os.path.join(work_dir, 'spans.jsonl'),
+        'TRACE_SAMPLE_RATE': str(args.trace_sample_rate),
+        'SUPPRESS_RECURRING_LOGS': 'true',
+        'COMPENSATION_TOOL_RANGE_START': '1',
+        'COMPENSATION_TOOL_RANGE_END': str(args.monitor_tools),
+    })
+
+
+def start_backend(app, host: str, port: int):
+    from werkzeug.serving import make_server
+    import logging
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    server = make_server(host, port, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run_http_load(name: str, make_url: Callable[[], str], concurrency: int, duration: float,
+                  max_requests: Optional[int]) -> Dict:
+    """
+    Closed-loop load: `concurrency` workers issue requests back to back until time or count runs out.
+    Each worker is its own client for admission control (X-Client-Id). Only 2xx responses count as
+    done and are timed; 429 and 503 (load shedding) are counted separately, anything else as an error.
+    """
+    import requests
+
+    latencies: List[float] = []
+    counts = {'errors': 0, 429: 0, 503: 0}
+    issued = [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker(index: int):
+        session = requests.Session()
+        session.headers['X-Client-Id'] = f"bench-{name}-{index}"
+        while time.perf_counter() < deadline:
+            with lock:
+                if max_requests is not None and issued[0] >= max_requests:
+                    return
+                issued[0] += 1
+            start = time.perf_counter()
+            try:
+                response = session.get(make_url(), timeout=120)
+                response.content  # Include body transfer in the latency
+                outcome = 'ok' if 200 <= response.status_code < 300 else response.status_code
+            except Exception:
+                outcome = 'errors'
+            elapsed = time.perf_counter() - start
+            with lock:
+                if outcome == 'ok':
+                    latencies.append(elapsed)
+                else:
+                    counts[outcome if outcome in counts else 'errors'] += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for index in range(concurrency):
+            pool.submit(worker, index)
+    return summarize(name, latencies, counts['errors'], time.perf_counter() - start,
+                     requests=issued[0], rejected=counts[429], shed=counts[503])
+
+
+def run_cycles(name: str, cycle: Callable[[], None], iterations: int) -> Dict:
+    """Time full background cycles (sequential, as the real checker/monitor loops run)"""
+    latencies: List[float] = []
+    errors = 0
+    start = time.perf_counter()
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        try:
+            cycle()
+        except Exception as e:
+            errors += 1
+            print(f"  {name} cycle failed: {e}")
+        latencies.append(time.perf_counter() - t0)
+    return summarize(name, latencies, errors, time.perf_counter() - start, requests=iterations)
+
+
+def print_table(results: List[Dict]):
+    # req/s and latencies are for successful (2xx) requests; 429/503 are admission rejections
+    header = (f"{'scenario':<28}{'reqs':>7}{'errs':>6}{'429':>6}{'503':>6}{'ok/s':>10}"
+              f"{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    print(header)
+    print("-" * len(header))
+    fmt = lambda v: '-' if v is None else f"{v:.1f}"  # noqa: E731
+    count = lambda v: '-' if v is None else str(v)  # noqa: E731
+    for r in results:
+        print(f"{r['scenario']:<28}{r['requests']:>7}{r['errors']:>6}{count(r.get('rejected_429')):>6}"
+              f"{count(r.get('shed_503')):>6}{fmt(r['throughput_per_s']):>10}"
+              f"{fmt(r['p50_ms']):>10}{fmt(r['p90_ms']):>10}{fmt(r['p99_ms']):>10}{fmt(r['max_ms']):>10}")
+
+
+def compare(before_path: str, after_path: str):
+    """Print p50/p99/throughput deltas between two --json result files"""
+    with open(before_path, encoding='utf-8') as f:
+        before = {r['scenario']: r for r in json.load(f)['results']}
+    with open(after_path, encoding='utf-8') as f:
+        after = {r['scenario']: r for r in json.load(f)['results']}
+
+    def delta(a, b):
+        if a in (None, 0) or b is None:
+            return '-'
+        return f"{(b - a) / a * 100:+.1f}%"
+
+    def rejected(r):
+        return (r.get('rejected_429') or 0) + (r.get('shed_503') or 0)
+
+    print(f"{'scenario':<28}{'p50 before':>12}{'p50 after':>12}{'p99 before':>12}{'p99 after':>12}{'ok/s':>10}"
+          f"{'429+503':>12}")
+    for name in [n for n in before if n in after]:
+        a, b = before[name], after[name]
+        print(f"{name:<28}{a['p50_ms'] or 0:>12.1f}{b['p50_ms'] or 0:>12.1f}{a['p99_ms'] or 0:>12.1f}"
+              f"{b['p99_ms'] or 0:>12.1f}{delta(a['throughput_per_s'], b['throughput_per_s']):>10}"
+              f"{f'{rejected(a)} -> {rejected(b)}':>12}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark backend hot paths against local stand-ins")
+    parser.add_argument('--machines', type=int, default=20, help='Fleet size')
+    parser.add_argument('--scenarios', default='all', help=f"Comma separated subset of: {', '.join(ALL_SCENARIOS)}")
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds per HTTP scenario')
+    parser.add_argument('--requests', type=int, default=None, help='Max requests per HTTP scenario')
+    parser.add_argument('--concurrency', type=int, default=8, help='Concurrent clients per HTTP scenario')
+    parser.add_argument('--cycles', type=int, default=1, help='Iterations of each background cycle scenario')
+    parser.add_argument('--tools', type=int, default=60, help='Tools in verktyg (check_tool_max_limits)')
+    parser.add_argument('--monitor-tools', type=int, default=100, help='Tool range read by the compensation monitor')
+    parser.add_argument('--days', type=int, default=14, help='Days of MI history to seed')
+    parser.add_argument('--rejects-per-day', type=int, default=20, help='Kassationer per machine and day')
+    parser.add_argument('--focas-latency-ms', type=float, default=20.0)
+    parser.add_argument('--focas-per-tool-ms', type=float, default=2.0, help='Extra FocasService latency per tool in range reads')
+    parser.add_argument('--focas-error-rate', type=float, default=0.0, help='Fraction of FOCAS reads failing with EW_SOCKET')
+    parser.add_argument('--unreachable', type=int, default=0, help='Number of CNCs that time out on connect')
+    parser.add_argument('--connect-timeout', type=float, default=2.0, help='Seconds an unreachable CNC blocks connect')
+    parser.add_argument('--supabase-latency-ms', type=float, default=30.0)
+    parser.add_argument('--mi-latency-ms', type=float, default=5.0)
+    parser.add_argument('--modbus-latency-ms', type=float, default=2.0)
+    parser.add_argument('--trace-sample-rate', type=float, default=0.0, help='TRACE_SAMPLE_RATE for the backend under test')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', dest='json_path', help='Write results to this file')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help='Compare two --json result files and exit')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    scenarios = ALL_SCENARIOS if args.scenarios == 'all' else [s.strip() for s in args.scenarios.split(',') if s.strip()]
+    unknown = [s for s in scenarios if s not in ALL_SCENARIOS]
+    if unknown:
+        parser.error(f"Unknown scenario(s): {', '.join(unknown)}")
+
+    random.seed(args.seed)
+    work_dir = tempfile.mkdtemp(prefix='maskinterminal-bench-')
+    print(f"Starting stand-ins for {args.machines} machines (work dir {work_dir})...")
+    fleet = Fleet(args, work_dir)
+    backend_port = free_port()
+    backend_url = f"http://127.0.0.1:{backend_port}"
+    configure_environment(fleet, work_dir, backend_url, args)
+
+    # Imported only now so module-level configuration picks up the stand-in endpoints.
+    # The MI stand-in is SQLite, so pyodbc (and libodbc) need not be installed
+    try:
+        import pyodbc
+    except ImportError:
+        pyodbc = types.ModuleType('pyodbc')
+        pyodbc.Error, pyodbc.OperationalError = sqlite3.Error, sqlite3.OperationalError
+        sys.modules['pyodbc'] = pyodbc
+    pyodbc.connect = fleet.mi.connect
+    import app as backend
+    import compensation_monitor
+
+    server = start_backend(backend.app, '127.0.0.1', backend_port)
+    print(f"Backend under test: {backend_url}")
+
+    wcs = fleet.work_centers
+    ips = [m['ip_focas'] for m in fleet.machines]
+    url_makers = {
+        'machine-status': lambda: f"{backend_url}/api/machine-status?wc={random.choice(wcs)}",
+        'kassationer': lambda: f"{backend_url}/api/kassationer?wc={random.choice(wcs)}",
+        'focas-tool-offsets-range': lambda: f"{backend_url}/api/focas/tool-offsets-range/{random.choice(ips)}/1/{args.monitor_tools}",
+        'focas-work-zero-offsets': lambda: f"{backend_url}/api/focas/work-zero-offsets-range-single/{random.choice(ips)}/1/7/54",
+        'fleet-snapshot': lambda: f"{backend_url}/api/fleet/snapshot",
+    }
+
+    def compensation_cycle():
+        for machine in compensation_monitor.get_machines_with_focas():
+            compensation_monitor.monitor_machine(machine['id'], machine['maskiner_nummer'], machine['ip_focas'])
+
+    cycles = {
+        'check-tool-max-limits': backend.check_tool_max_limits,
+        'compensation-monitor': compensation_cycle,
+    }
+
+    results = []
+    try:
+        for name in scenarios:
+            print(f"Running {name}...")
+            if name == 'fleet-snapshot':
+                backend.refresh_fleet_snapshot()  # Measure serving, not the first build
+                backend.ensure_fleet_snapshot_refresher()
+            if name in url_makers:
+                results.append(run_http_load(name, url_makers[name], args.concurrency, args.duration, args.requests))
+            else:
+                results.append(run_cycles(name, cycles[name], args.cycles))
+    finally:
+        server.shutdown()
+        fleet.stop()
+
+    print()
+    print_table(results)
+    print()
+    print(f"FocasService calls: {sum(fleet.focas.calls.values())}  Supabase calls: {sum(fleet.supabase.calls.values())}")
+
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                "config": {k: v for k, v in vars(args).items() if k not in ('json_path', 'compare')},
+                "results": results,
+                "focas_calls": fleet.focas.calls,
+                "supabase_calls": fleet.supabase.calls,
+            }, f, indent=2)
+        print(f"Results written to {args.json_path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Circuit breakers per external dependency (focas:<ip>, adam:<ip>, odbc:<dsn>, smb:<share>).
+
+After BREAKER_FAILURE_THRESHOLD consecutive failures a breaker opens and calls fail
+immediately with CircuitOpenError (503 in app.py) instead of waiting for the socket,
+HTTP or ODBC timeout. Breakers with a probe (a cheap TCP connect or directory check)
+are tested by one background thread and close as soon as the probe succeeds; breakers
+without a probe let a single request through (half-open) after BREAKER_RESET_TIMEOUT.
+"""
+
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterator, List, Optional
+
+from metrics import REGISTRY
+
+BREAKER_ENABLED = os.getenv('BREAKER_ENABLED', 'true').lower() == 'true'
+BREAKER_FAILURE_THRESHOLD = int(os.getenv('BREAKER_FAILURE_THRESHOLD', '3'))  # consecutive failures before opening
+BREAKER_RESET_TIMEOUT = float(os.getenv('BREAKER_RESET_TIMEOUT', '30'))  # seconds open before a probe or trial request
+BREAKER_PROBE_INTERVAL = float(os.getenv('BREAKER_PROBE_INTERVAL', '5'))  # how often the prober looks for open breakers
+BREAKER_PROBE_TIMEOUT = float(os.getenv('BREAKER_PROBE_TIMEOUT', '2'))  # TCP probe connect timeout
+
+CLOSED, HALF_OPEN, OPEN = 'closed', 'half_open', 'open'
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+BREAKER_STATE = REGISTRY.gauge(
+    "circuit_breaker_state", "Circuit breaker state (0=closed, 1=half open, 2=open)", ("name",))
+BREAKER_REJECTIONS = REGISTRY.counter(
+    "circuit_breaker_rejections_total", "Calls failed fast by an open circuit breaker", ("name",))
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency whose breaker is open"""
+
+    def __init__(self, breaker: 'CircuitBreaker'):
+        self.breaker = breaker
+        self.state = breaker.snapshot()
+        super().__init__(f"{breaker.name} is unavailable (circuit open after "
+                         f"{self.state['consecutive_failures']} failures: {self.state['last_error']})")
+
+
+def tcp_probe(host: str, port: int, timeout: float = BREAKER_PROBE_TIMEOUT) -> Callable[[], bool]:
+    """Probe that succeeds if a TCP connection to host:port can be opened"""
+    def probe() -> bool:
+        try:
+            with socket.create_connection((host, port), timeout=timeout):
+                return True
+        except OSError:
+            return False
+    return probe
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, probe: Optional[Callable[[], bool]] = None,
+                 failure_threshold: int = BREAKER_FAILURE_THRESHOLD, reset_timeout: float = BREAKER_RESET_TIMEOUT):
+        self.name = name
+        self.probe = probe
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.last_failure_at: Optional[float] = None
+        self.rejected = 0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+        BREAKER_STATE.set(0, name=name)
+
+    def _set_state(self, state: str):
+        if state != self.state:
+            print(f"Circuit breaker {self.name}: {self.state} -> {state}")
+        self.state = state
+        BREAKER_STATE.set(_STATE_VALUES[state], name=self.name)
+
+    def allow(self) -> bool:
+        """True if a call may go ahead; counts a rejection otherwise"""
+        if not BREAKER_ENABLED:
+            return True
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and self.probe is None and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self._set_state(HALF_OPEN)
+            if self.state == HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True  # Exactly one trial request
+                return True
+            self.rejected += 1
+        BREAKER_REJECTIONS.inc(name=self.name)
+        return False
+
+    def check(self):
+        """Raise CircuitOpenError if the call may not go ahead"""
+        if not self.allow():
+            raise CircuitOpenError(self)
+
+    def success(self):
+        with self._lock:
+            self.consecutive_failures = 0
+            self._trial_in_flight = False
+            if self.state != CLOSED:
+                self.opened_at = None
+                self._set_state(CLOSED)
+
+    def failure(self, error: Optional[str] = None):
+        with self._lock:
+            self.consecutive_failures += 1
+            self.last_error = error
+            self.last_failure_at = time.time()
+            self._trial_in_flight = False
+            if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                self._set_state(OPEN)
+
+    def release(self):
+        """End a half-open trial that neither succeeded nor failed against the dependency"""
+        with self._lock:
+            self._trial_in_flight = False
+
+    @contextmanager
+    def guard(self, failure_types=(Exception,)) -> Iterator[None]:
+        """check(), then record success, or failure for exceptions of failure_types"""
+        self.check()
+        try:
+            yield
+        except failure_types as e:
+            self.failure(str(e))
+            raise
+        except BaseException:
+            self.release()
+            raise
+        self.success()
+
+    def due_for_probe(self) -> bool:
+        with self._lock:
+            return self.state == OPEN and self.probe is not None and \
+                time.monotonic() - self.opened_at >= self.reset_timeout
+
+    def run_probe(self):
+        try:
+            ok = bool(self.probe())
+        except Exception:
+            ok = False
+        if ok:
+            self.success()
+        else:
+            with self._lock:
+                self.opened_at = time.monotonic()  # Stay open for another reset_timeout
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            retry_in = None
+            if self.state == OPEN and self.opened_at is not None:
+                retry_in = max(0.0, round(self.reset_timeout - (time.monotonic() - self.opened_at), 1))
+            return {
+                "name": self.name,
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "failure_threshold": self.failure_threshold,
+                "last_error": self.last_error,
+                "last_failure_at": datetime.fromtimestamp(self.last_failure_at, timezone.utc).isoformat()
+                if self.last_failure_at else None,
+                "retry_in_seconds": retry_in,
+                "probe": self.probe is not None,
+                "rejected": self.rejected,
+            }
+
+
+class BreakerRegistry:
+    """Breakers by dependency name, plus the background prober for open ones"""
+
+    def __init__(self, probe_interval: float = BREAKER_PROBE_INTERVAL):
+        self.probe_interval = probe_interval
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+        self._prober: Optional[threading.Thread] = None
+
+    def get(self, name: str, probe: Optional[Callable[[], bool]] = None) -> CircuitBreaker:
+        breaker = self._breakers.get(name)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.get(name)
+                if breaker is None:
+                    breaker = CircuitBreaker(name, probe)
+                    self._breakers[name] = breaker
+        if probe is not None and self._prober is None:
+            self.start_prober()
+        return breaker
+
+    def start_prober(self):
+        with self._lock:
+            if self._prober is None:
+                self._prober = threading.Thread(target=self._probe_loop, name="breaker-prober", daemon=True)
+                self._prober.start()
+
+    def _probe_loop(self):
+        while True:
+            for breaker in self.all():
+                if breaker.due_for_probe():
+                    breaker.run_probe()
+            time.sleep(self.probe_interval)
+
+    def all(self) -> List[CircuitBreaker]:
+        with self._lock:
+            return list(self._breakers.values())
+
+    def status(self) -> List[Dict]:
+        return [b.snapshot() for b in sorted(self.all(), key=lambda b: b.name)]
+
+    def reset(self, name: Optional[str] = None) -> int:
+        """Close one breaker (or all); returns how many were reset"""
+        breakers = [b for b in self.all() if name is None or b.name == name]
+        for breaker in breakers:
+            breaker.success()
+        return len(breakers)
+
+
+breakers = BreakerRegistry()
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+Local append-only columnar store for compensation snapshots.
+compensation_monitor.py appends every scan; app.py answers series, drift and
+downsampled trend queries from it without touching Supabase.
+
+Layout (one partition per machine and month, values in 0.001 mm units):
+    <COMPENSATION_HISTORY_DIR>/<machine_id>/<YYYY-MM>[_t<start>-<end>]/
+        ts.i8      int64 unix milliseconds, one per row
+        tools.i8   int64 rows x tools x 4 (TOOL_FIELDS)
+        coords.i8  int64 rows x 48 x 5 (AXIS_FIELDS)
+        meta.json  committed row count and tool range
+Rows are appended to the column files first and published by rewriting meta.json,
+so readers memory-map only complete rows.
+"""
+
+import os
+import json
+import threading
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from compensation_snapshot import (
+    MachineSnapshot, TOOL_FIELDS, AXIS_FIELDS, COORDINATE_COUNT, MISSING,
+)
+
+COMPENSATION_HISTORY_DIR = os.getenv(
+    'COMPENSATION_HISTORY_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'compensation_history')
+)
+
+TOOL_COLUMNS = [db for db, _ in TOOL_FIELDS]
+COORD_COLUMNS = list(AXIS_FIELDS)
+
+
+def _month_key(ts_ms: int) -> str:
+    return datetime.fromtimestamp(ts_ms / 1000, tz=timezone.utc).strftime('%Y-%m')
+
+
+def _month_bounds(key: str) -> Tuple[int, int]:
+    """[start, end) of a YYYY-MM partition in unix ms"""
+    year, month = (int(p) for p in key.split('-'))
+    start = datetime(year, month, 1, tzinfo=timezone.utc)
+    end = datetime(year + month // 12, month % 12 + 1, 1, tzinfo=timezone.utc)
+    return int(start.timestamp() * 1000), int(end.timestamp() * 1000)
+
+
+def parse_item(item: str) -> Tuple[str, int]:
+    """'T12' -> ('T', 12), 'P3' -> ('P', 3)"""
+    item = (item or '').strip().upper()
+    if len(item) < 2 or item[0] not in ('T', 'P') or not item[1:].isdigit():
+        raise ValueError(f"Invalid item '{item}', expected e.g. T12 or P3")
+    return item[0], int(item[1:])
+
+
+def downsample(ts: np.ndarray, values: np.ndarray, start_ms: int, end_ms: int, buckets: int) -> Dict:
+    """
+    Reduce a series to at most `buckets` equal time buckets with min/max/mean/last per bucket.
+    values is 1-D with MISSING for unread cells; empty buckets are omitted.
+    """
+    valid = values != MISSING
+    ts, values = ts[valid], values[valid].astype(np.float64)
+    if len(ts) == 0 or buckets <= 0:
+        return {"ts": [], "min": [], "max": [], "mean": [], "last": []}
+
+    edges = np.linspace(start_ms, end_ms, buckets + 1)
+    bucket = np.clip(np.searchsorted(edges, ts, side='right') - 1, 0, buckets - 1)
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    counts = np.diff(np.r_[starts, len(values)])
+    return {
+        "ts": edges[bucket[starts]].astype(np.int64).tolist(),
+        "min": np.minimum.reduceat(values, starts).tolist(),
+        "max": np.maximum.reduceat(values, starts).tolist(),
+        "mean": (np.add.reduceat(values, starts) / counts).tolist(),
+        "last": values[starts + counts - 1].tolist(),
+    }
+
+
+class _Partition:
+    def __init__(self, path: str, meta: Dict):
+        self.path = path
+        self.meta = meta
+
+    @property
+    def rows(self) -> int:
+        return int(self.meta.get('rows', 0))
+
+    @property
+    def tool_start(self) -> int:
+        return int(self.meta['tool_start'])
+
+    @property
+    def tool_count(self) -> int:
+        return int(self.meta['tool_end']) - self.tool_start + 1
+
+    def column(self, name: str, shape: Tuple[int, ...]) -> np.ndarray:
+        """Memory-map a column file (read-only), limited to committed rows"""
+        if self.rows == 0:
+            return np.empty((0,) + shape, dtype=np.int64)
+        return np.memmap(os.path.join(self.path, f"{name}.i8"), dtype=np.int64, mode='r',
+                         shape=(self.rows,) + shape)
+
+
+class CompensationHistory:
+    """Writer (compensation monitor) and reader (Flask endpoints) for the partitioned store"""
+
+    def __init__(self, base_dir: str = COMPENSATION_HISTORY_DIR):
+        self.base_dir = base_dir
+        self._lock = threading.Lock()
+
+    # Writing
+
+    def _partition_dir(self, machine_id: str, month: str, tool_start: int, tool_end: int) -> str:
+        """Default range partitions are named YYYY-MM; a changed tool range gets its own partition"""
+        machine_dir = os.path.join(self.base_dir, str(machine_id))
+        plain = os.path.join(machine_dir, month)
+        meta = self._read_meta(plain)
+        if meta is None or (meta['tool_start'], meta['tool_end']) == (tool_start, tool_end):
+            return plain
+        return os.path.join(machine_dir, f"{month}_t{tool_start}-{tool_end}")
+
+    @staticmethod
+    def _read_meta(path: str) -> Optional[Dict]:
+        try:
+            with open(os.path.join(path, 'meta.json'), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def append(self, machine_id: str, snapshot: MachineSnapshot, ts_ms: Optional[int] = None):
+        """Append one snapshot row to the machine's partition for the snapshot month"""
+        ts_ms = int(ts_ms if ts_ms is not None else snapshot.taken_at * 1000)
+        month = _month_key(ts_ms)
+        with self._lock:
+            path = self._partition_dir(machine_id, month, snapshot.tool_start, snapshot.tool_end)
+            os.makedirs(path, exist_ok=True)
+            meta = self._read_meta(path) or {
+                'machine_id': str(machine_id),
+                'month': month,
+                'tool_start': snapshot.tool_start,
+                'tool_end': snapshot.tool_end,
+                'tool_columns': TOOL_COLUMNS,
+                'coord_columns': COORD_COLUMNS,
+                'rows': 0,
+            }
+            rows = int(meta['rows'])
+            columns = {
+                'ts': np.array([ts_ms], dtype=np.int64),
+                'tools': snapshot.tools.astype(np.int64, copy=False),
+                'coords': snapshot.coords.astype(np.int64, copy=False),
+            }
+            for name, values in columns.items():
+                file_path = os.path.join(path, f"{name}.i8")
+                row_bytes = values.nbytes
+                with open(file_path, 'ab') as f:
+                    # Drop a partially written row from an interrupted append before adding ours
+                    if f.tell() != rows * row_bytes:
+                        f.truncate(rows * row_bytes)
+                        f.seek(rows * row_bytes)
+                    f.write(values.tobytes())
+            meta['rows'] = rows + 1
+            meta['last_ts'] = ts_ms
+            tmp_path = os.path.join(path, f"meta.json.{os.getpid()}.tmp")
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(meta, f, ensure_ascii=False)
+            os.replace(tmp_path, os.path.join(path, 'meta.json'))
+
+    # Reading
+
+    def machines(self) -> List[Dict]:
+        """Machines with history, row counts and covered time range"""
+        result = []
+        if not os.path.isdir(self.base_dir):
+            return result
+        for machine_id in sorted(os.listdir(self.base_dir)):
+            partitions = self._partitions(machine_id, None, None)
+            if not partitions:
+                continue
+            first = partitions[0].column('ts', ())
+            result.append({
+                "machine_id": machine_id,
+                "rows": sum(p.rows for p in partitions),
+                "first_ts": int(first[0]) if len(first) else None,
+                "last_ts": max((p.meta.get('last_ts') or 0) for p in partitions) or None,
+                "partitions": [os.path.basename(p.path) for p in partitions],
+            })
+        return result
+
+    def _partitions(self, machine_id: str, start_ms: Optional[int], end_ms: Optional[int]) -> List[_Partition]:
+        machine_dir = os.path.join(self.base_dir, str(machine_id))
+        try:
+            names = sorted(os.listdir(machine_dir))
+        except OSError:
+            return []
+        partitions = []
+        for name in names:
+            try:
+                month_start, month_end = _month_bounds(name[:7])
+            except ValueError:
+                continue  # Not a partition directory
+            if start_ms is not None and month_end <= start_ms:
+                continue
+            if end_ms is not None and month_start > end_ms:
+                continue
+            meta = self._read_meta(os.path.join(machine_dir, name))
+            if meta and int(meta.get('rows', 0)) > 0:
+                partitions.append(_Partition(os.path.join(machine_dir, name), meta))
+        # Month order first, so rows come out in time order
+        return sorted(partitions, key=lambda p: (p.meta['month'], p.meta.get('last_ts', 0)))
+
+    def series(self, machine_id: str, item: str, start_ms: int, end_ms: int) -> Tuple[np.ndarray, np.ndarray, List[str]]:
+        """
+        Raw values of one tool (T<n>) or coordinate system (P<n>) between start and end.
+        Returns (ts, values[rows x fields], field names); unread cells are MISSING.
+        """
+        kind, number = parse_item(item)
+        fields = TOOL_COLUMNS if kind == 'T' else COORD_COLUMNS
+        ts_parts, value_parts = [], []
+        for p in self._partitions(machine_id, start_ms, end_ms):
+            ts = p.column('ts', ())
+            lo, hi = np.searchsorted(ts, start_ms, 'left'), np.searchsorted(ts, end_ms, 'right')
+            if lo >= hi:
+                continue
+            if kind == 'T':
+                index = number - p.tool_start
+                if not 0 <= index < p.tool_count:
+                    continue
+                values = p.column('tools', (p.tool_count, len(TOOL_COLUMNS)))[lo:hi, index, :]
+            else:
+                if not 1 <= number <= COORDINATE_COUNT:
+                    continue
+                values = p.column('coords', (COORDINATE_COUNT, len(COORD_COLUMNS)))[lo:hi, number - 1, :]
+            ts_parts.append(np.array(ts[lo:hi]))
+            value_parts.append(np.array(values))
+        if not ts_parts:
+            return np.empty(0, dtype=np.int64), np.empty((0, len(fields)), dtype=np.int64), fields
+        return np.concatenate(ts_parts), np.concatenate(value_parts), fields
+
+    def drift(self, machine_id: str, start_ms: int, end_ms: int, kind: str = 'T') -> List[Dict]:
+        """
+        Per tool (or coordinate system) and field: first and last value in the range,
+        net drift (last - first) and cumulative movement (sum of absolute changes), in mm.
+        """
+        kind = kind.upper()
+        fields = TOOL_COLUMNS if kind == 'T' else COORD_COLUMNS
+        blocks: Dict[Tuple[int, int], List[np.ndarray]] = {}
+        for p in self._partitions(machine_id, start_ms, end_ms):
+            ts = p.column('ts', ())
+            lo, hi = np.searchsorted(ts, start_ms, 'left'), np.searchsorted(ts, end_ms, 'right')
+            if lo >= hi:
+                continue
+            if kind == 'T':
+                first_number, data = p.tool_start, p.column('tools', (p.tool_count, len(fields)))[lo:hi]
+            else:
+                first_number, data = 1, p.column('coords', (COORDINATE_COUNT, len(fields)))[lo:hi]
+            blocks.setdefault((first_number, data.shape[1]), []).append(np.array(data))
+
+        result: Dict[int, Dict] = {}
+        for (first_number, count), parts in blocks.items():
+            data = np.concatenate(parts)  # rows x items x fields
+            valid = data != MISSING
+            any_valid = valid.any(axis=0)
+            rows = np.arange(len(data))[:, None, None]
+            # First/last valid row per (item, field)
+            first_row = np.where(valid, rows, len(data)).min(axis=0)
+            last_row = np.where(valid, rows, -1).max(axis=0)
+            item_idx, field_idx = np.indices(any_valid.shape)
+            first = data[np.clip(first_row, 0, len(data) - 1), item_idx, field_idx]
+            last = data[np.clip(last_row, 0, len(data) - 1), item_idx, field_idx]
+            # Movement between consecutive rows where both were read
+            step_valid = valid[1:] & valid[:-1]
+            steps = np.where(step_valid, np.abs(np.diff(data, axis=0)), 0).sum(axis=0) if len(data) > 1 \
+                else np.zeros(any_valid.shape, dtype=np.int64)
+            changes = (step_valid & (np.diff(data, axis=0) != 0)).sum(axis=0) if len(data) > 1 \
+                else np.zeros(any_valid.shape, dtype=np.int64)
+
+            for i in np.flatnonzero(any_valid.any(axis=1)):
+                number = first_number + int(i)
+                entry = result.setdefault(number, {"item": f"{kind}{number}", "fields": {}})
+                for f in np.flatnonzero(any_valid[i]):
+                    entry["fields"][fields[f]] = {
+                        "first_mm": int(first[i, f]) / 1000.0,
+                        "last_mm": int(last[i, f]) / 1000.0,
+                        "net_drift_mm": (int(last[i, f]) - int(first[i, f])) / 1000.0,
+                        "cumulative_drift_mm": int(steps[i, f]) / 1000.0,
+                        "changes": int(changes[i, f]),
+                    }
+        return [result[n] for n in sorted(result)]
+
+
+history = CompensationHistory()
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Array-backed compensation snapshots for compensation_monitor.py.
+Offsets are kept per machine as int64 arrays in the CNC's native 0.001 mm units
+(tools x 4 fields, coordinate systems x 5 axes), so a scan is diffed against the
+previous one with a single vectorised comparison instead of float lookups per field.
+
+SnapshotStore keeps the last snapshot of each machine on disk, so a restarted monitor
+resumes from it instead of re-reading every CNC and rewriting every nuvarande row.
+"""
+
+import os
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+MONITOR_STATE_DIR = os.getenv(
+    'COMPENSATION_STATE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'monitor_state')
+)
+MONITOR_STATE_MAX_AGE = int(os.getenv('COMPENSATION_STATE_MAX_AGE', str(7 * 86400)))  # older snapshots trigger a full reload
+
+SNAPSHOT_FORMAT_VERSION = 1  # bump when the array layout (TOOL_FIELDS, AXIS_FIELDS) changes
+
+# (nuvarande/kompenseringar column, FocasService field) per tool array column
+TOOL_FIELDS = (
+    ('verktyg_radie_geometry', 'cutterRadiusGeometry'),
+    ('verktyg_radie_wear', 'cutterRadiusWear'),
+    ('verktyg_längd_geometry', 'toolLengthGeometry'),
+    ('verktyg_längd_wear', 'toolLengthWear'),
+)
+
+# Column per coordinate array column (0=X, 1=Y, 2=Z, 3=C, 4=B - same order as the FOCAS axis index - 1)
+AXIS_FIELDS = ('koord_x', 'koord_y', 'koord_z', 'koord_c', 'koord_b')
+
+COORDINATE_COUNT = 48  # P1-P48
+
+# Marks a cell that was not read (None from FocasService / NULL in Supabase)
+MISSING = np.iinfo(np.int64).min
+
+
+def to_units(mm: Optional[float]) -> int:
+    """mm value from Supabase -> 0.001 mm integer units"""
+    return MISSING if mm is None else int(round(float(mm) * 1000))
+
+
+def to_mm(units: int) -> Optional[float]:
+    """0.001 mm integer units -> mm, None for unread cells"""
+    return None if units == MISSING else int(units) / 1000.0
+
+
+def changed_cells(previous: np.ndarray, current: np.ndarray) -> np.ndarray:
+    """(row, column) indices of cells read in this scan whose value differs from the previous snapshot"""
+    return np.argwhere((current != MISSING) & (current != previous))
+
+
+class MachineSnapshot:
+    """Tool and coordinate system offsets of one machine at one point in time"""
+
+    def __init__(self, tool_start: int, tool_end: int,
+                 tools: Optional[np.ndarray] = None, coords: Optional[np.ndarray] = None):
+        self.tool_start = tool_start
+        self.tool_end = tool_end
+        self.tools = tools if tools is not None else \
+            np.full((tool_end - tool_start + 1, len(TOOL_FIELDS)), MISSING, dtype=np.int64)
+        self.coords = coords if coords is not None else \
+            np.full((COORDINATE_COUNT, len(AXIS_FIELDS)), MISSING, dtype=np.int64)
+        self.taken_at = time.time()
+
+    # Building
+
+    def set_tool_offsets(self, offsets: Dict[int, Dict]):
+        """Fill tool rows from get_current_offsets_range() output (raw 0.001 mm values)"""
+        for tool_number, values in offsets.items():
+            row = tool_number - self.tool_start
+            if not 0 <= row < len(self.tools) or not values:
+                continue
+            self.tools[row] = [MISSING if values.get(api) is None else int(values.get(api))
+                               for _, api in TOOL_FIELDS]
+
+    def set_coordinate_offsets(self, coord_offsets: Dict[int, Dict[int, int]]):
+        """Fill coordinate rows from get_work_zero_offsets_for_coordinate_systems() output"""
+        for p_num, axis_values in coord_offsets.items():
+            row = p_num - 1
+            if not 0 <= row < COORDINATE_COUNT or not axis_values:
+                continue
+            for axis, value in axis_values.items():
+                if 0 <= axis < len(AXIS_FIELDS) and value is not None:
+                    self.coords[row, axis] = int(value)
+
+    @classmethod
+    def from_stored_rows(cls, rows: Iterable[Dict], tool_start: int, tool_end: int) -> 'MachineSnapshot':
+        """Rebuild a snapshot from verktygshanteringssystem_kompenseringar_nuvarande rows (mm values)"""
+        snapshot = cls(tool_start, tool_end)
+        for row in rows:
+            num = str(row.get('verktyg_koordinat_num') or '')
+            if not num[1:].isdigit():
+                continue
+            index = int(num[1:])
+            if num.startswith('T') and tool_start <= index <= tool_end:
+                snapshot.tools[index - tool_start] = [to_units(row.get(db)) for db, _ in TOOL_FIELDS]
+            elif num.startswith('P') and 1 <= index <= COORDINATE_COUNT:
+                snapshot.coords[index - 1] = [to_units(row.get(db)) for db in AXIS_FIELDS]
+        return snapshot
+
+    def merged_with(self, previous: Optional['MachineSnapshot']) -> 'MachineSnapshot':
+        """Copy of this snapshot where cells not read in this scan keep their previous value"""
+        merged = MachineSnapshot(self.tool_start, self.tool_end, self.tools.copy(), self.coords.copy())
+        merged.taken_at = self.taken_at
+        if previous is None:
+            return merged
+        if previous.tools.shape == self.tools.shape and previous.tool_start == self.tool_start:
+            np.copyto(merged.tools, previous.tools, where=merged.tools == MISSING)
+        np.copyto(merged.coords, previous.coords, where=merged.coords == MISSING)
+        return merged
+
+    # Diffing
+
+    def tool_changes(self, previous: 'MachineSnapshot') -> List[Tuple[int, str, Optional[float], Optional[float]]]:
+        """[(tool_number, column, old_mm, new_mm)] for every changed tool cell"""
+        cells = changed_cells(previous.tools, self.tools)
+        return [
+            (self.tool_start + int(r), TOOL_FIELDS[c][0], to_mm(previous.tools[r, c]), to_mm(self.tools[r, c]))
+            for r, c in cells
+        ]
+
+    def coordinate_changes(self, previous: 'MachineSnapshot') -> List[Tuple[int, str, Optional[float], Optional[float]]]:
+        """[(p_number, column, old_mm, new_mm)] for every changed coordinate cell"""
+        cells = changed_cells(previous.coords, self.coords)
+        return [
+            (int(r) + 1, AXIS_FIELDS[c], to_mm(previous.coords[r, c]), to_mm(self.coords[r, c]))
+            for r, c in cells
+        ]
+
+    # Row views for update_current_values()
+
+    def tool_offsets(self, tool_number: int) -> Dict:
+        row = self.tools[tool_number - self.tool_start]
+        return {api: None if row[i] == MISSING else int(row[i]) for i, (_, api) in enumerate(TOOL_FIELDS)}
+
+    def coordinate_offsets(self, p_num: int) -> Dict:
+        row = self.coords[p_num - 1]
+        return {'axisOffsets': {axis: int(v) for axis, v in enumerate(row) if v != MISSING}}
+
+
+class SnapshotStore:
+    """Last known snapshot per machine as <machine_id>.npz, with format version, sequence number and time"""
+
+    def __init__(self, directory: str = MONITOR_STATE_DIR, max_age: float = MONITOR_STATE_MAX_AGE):
+        self.directory = directory
+        self.max_age = max_age
+        self._seq: Dict[str, int] = {}
+
+    def _path(self, machine_id: str) -> str:
+        return os.path.join(self.directory, f"{machine_id}.npz")
+
+    def save(self, machine_id: str, snapshot: MachineSnapshot):
+        os.makedirs(self.directory, exist_ok=True)
+        seq = self._seq.get(machine_id, 0) + 1
+        path = self._path(machine_id)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, version=SNAPSHOT_FORMAT_VERSION, seq=seq, taken_at=snapshot.taken_at,
+                     tool_range=(snapshot.tool_start, snapshot.tool_end), tools=snapshot.tools, coords=snapshot.coords)
+        os.replace(tmp_path, path)
+        self._seq[machine_id] = seq
+
+    def load(self, machine_id: str, tool_start: int, tool_end: int) -> Optional[MachineSnapshot]:
+        """Stored snapshot, or None if missing, unreadable, of another format or tool range, or older than max_age"""
+        try:
+            with np.load(self._path(machine_id)) as data:
+                if int(data['version']) != SNAPSHOT_FORMAT_VERSION:
+                    return None
+                if tuple(int(v) for v in data['tool_range']) != (tool_start, tool_end):
+                    return None
+                taken_at = float(data['taken_at'])
+                if time.time() - taken_at > self.max_age:
+                    return None
+                tools, coords = data['tools'], data['coords']
+                if coords.shape != (COORDINATE_COUNT, len(AXIS_FIELDS)) or tools.shape[1] != len(TOOL_FIELDS):
+                    return None
+                self._seq[machine_id] = int(data['seq'])
+        except (OSError, KeyError, ValueError):
+            return None
+        snapshot = MachineSnapshot(tool_start, tool_end, tools.astype(np.int64), coords.astype(np.int64))
+        snapshot.taken_at = taken_at
+        return snapshot
+
+    def status(self, machine_id: str) -> Optional[Dict]:
+        """Version, sequence number and age of the stored snapshot (for logging)"""
+        try:
+            with np.load(self._path(machine_id)) as data:
+                return {"version": int(data['version']), "seq": int(data['seq']),
+                        "age_seconds": round(time.time() - float(data['taken_at']), 1)}
+        except (OSError, KeyError, ValueError):
+            return None
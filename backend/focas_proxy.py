@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+"""
+Asyncio FOCAS proxy layer.
+FocasService calls for the auto-connect read routes are made with httpx.AsyncClient
+on one event loop thread, so a slow or unreachable CNC costs a coroutine instead of
+a Flask worker thread. Every read goes to FocasService's per-machine session routes
+(/api/focas/sessions/<ip>/...), which open a handle of their own for the CNC: reads
+for different machines run in parallel, also across backend instances.
+"""
+
+import os
+import re
+import time
+import asyncio
+import threading
+import contextvars
+import concurrent.futures
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+from metrics import FOCAS_REQUEST_DURATION, FOCAS_ERRORS
+from circuit_breaker import CLOSED, CircuitBreaker, CircuitOpenError, breakers, tcp_probe
+from response_encoding import dumps_bytes
+from tracing import span
+from traffic_capture import recorder as traffic_recorder
+
+FOCAS_PORT = 8193  # Default FOCAS port
+
+FOCAS_SERVICE_NOT_RUNNING = "FocasService is not running. Please start the FocasService on port 5999."
+
+FOCAS_PROXY_MAX_CONNECTIONS = int(os.getenv('FOCAS_PROXY_MAX_CONNECTIONS', '200'))  # Pooled connections to FocasService
+FOCAS_SESSION_OPEN_TIMEOUT = 10  # Seconds FocasService may spend opening the session handle (its default)
+
+# Streamed tool-offsets-range reads (?stream=true or Accept: application/x-ndjson)
+FOCAS_RANGE_CHUNK_SIZE = int(os.getenv('FOCAS_RANGE_CHUNK_SIZE', '20'))  # Tools per FocasService request
+FOCAS_RANGE_CHUNK_TIMEOUT = float(os.getenv('FOCAS_RANGE_CHUNK_TIMEOUT', '10'))  # Read timeout per chunk
+FOCAS_RANGE_RETRIES = int(os.getenv('FOCAS_RANGE_RETRIES', '2'))  # Extra attempts for a failed chunk
+NDJSON = 'application/x-ndjson'
+
+# FocasService errors come back as 200 with success: false - found without parsing the body
+_FOCAS_ERROR = re.compile(rb'"success"\s*:\s*false')
+_FOCAS_ERROR_CODE = re.compile(rb'"errorCode"\s*:\s*(-?\d+)')
+
+def get_focas_service_url() -> str:
+    return os.getenv('FOCAS_SERVICE_URL', 'http://localhost:5999')
+
+
+def session_path(ip_address: str, path: str) -> str:
+    """FocasService route for a read in a session of its own for the CNC, e.g. session_path(ip, 'tool-offsets/5')"""
+    return f"/api/focas/sessions/{ip_address}/{path}?port={FOCAS_PORT}"
+
+
+def is_transport_error(code) -> bool:
+    """Negative FOCAS error codes (EW_SOCKET, EW_HANDLE ...) mean the CNC could not be reached"""
+    try:
+        return int(code) < 0
+    except (TypeError, ValueError):
+        return False
+
+
+def wants_stream(query: str, accept: str) -> bool:
+    """True if a request asks for an NDJSON stream (?stream=true or Accept: application/x-ndjson)"""
+    params = dict(p.partition('=')[::2] for p in query.split('&') if p)
+    return params.get('stream', '').lower() in ('1', 'true', 'yes') or NDJSON in (accept or '')
+
+
+def focas_breaker(ip_address: str) -> CircuitBreaker:
+    """Breaker for one CNC, probed with a TCP connect to its FOCAS port"""
+    return breakers.get(f"focas:{ip_address}", probe=tcp_probe(ip_address, FOCAS_PORT))
+
+
+def breaker_payload(breaker: CircuitBreaker) -> Tuple[Dict, int]:
+    """Fast-fail response for a CNC whose breaker is open"""
+    e = CircuitOpenError(breaker)
+    return {"success": False, "error": str(e), "breaker": e.state}, 503
+
+
+def error_payload(e: Exception) -> Tuple[Dict, int]:
+    """Map an exception from a FocasService call to the JSON error body and status used by the proxy routes"""
+    if isinstance(e, httpx.ConnectError):
+        return {"success": False, "error": FOCAS_SERVICE_NOT_RUNNING}, 503
+    if isinstance(e, httpx.TimeoutException):
+        return {"success": False, "error": "FocasService request timed out"}, 504
+    if isinstance(e, (httpx.HTTPError, httpx.InvalidURL)):
+        return {"success": False, "error": f"Error communicating with FocasService: {str(e)}"}, 502
+    return {"success": False, "error": f"Unexpected error: {str(e)}"}, 500
+
+
+class RawResponse:
+    """
+    FocasService response forwarded as bytes: the body is streamed to the client
+    without being parsed and re-encoded. aclose() must be called once the body is sent.
+    """
+
+    def __init__(self, status: int, content_type: str = 'application/json', length: Optional[int] = None,
+                 body: Optional[bytes] = None, upstream: Optional[httpx.Response] = None, on_close=None,
+                 capture: bool = False):
+        self.status = status
+        self.content_type = content_type
+        self.length = length
+        self.body = body
+        self.upstream = upstream
+        self.on_close = on_close
+        self.focas_error: Optional[str] = None
+        self.captured: Optional[List[bytes]] = [] if capture else None  # Upstream chunks kept for traffic capture
+
+    @classmethod
+    def from_payload(cls, payload: Dict, status: int) -> 'RawResponse':
+        body = dumps_bytes(payload)
+        return cls(status, length=len(body), body=body)
+
+    async def chunks(self):
+        if self.body is not None:
+            yield self.body
+            return
+        first = True
+        async for chunk in self.upstream.aiter_bytes():
+            if first:
+                first = False
+                if _FOCAS_ERROR.search(chunk):
+                    code = _FOCAS_ERROR_CODE.search(chunk)
+                    self.focas_error = code.group(1).decode() if code else ""
+            if self.captured is not None:
+                self.captured.append(chunk)
+            yield chunk
+
+    async def read_all(self) -> bytes:
+        try:
+            return b''.join([chunk async for chunk in self.chunks()])
+        finally:
+            await self.aclose()
+
+    async def aclose(self):
+        on_close, self.on_close = self.on_close, None
+        if self.upstream is not None:
+            await self.upstream.aclose()
+        if on_close is not None:
+            await on_close(self)
+
+
+class AsyncFocasProxy:
+    """
+    FocasService client running on a dedicated event loop thread.
+
+    Reads use FocasService's session routes: each request opens and frees its own handle
+    for the CNC, and FocasService serialises sessions per IP. No handle is shared between
+    requests here, so nothing has to be held across calls.
+    """
+
+    def __init__(self, max_connections: int = FOCAS_PROXY_MAX_CONNECTIONS):
+        self.max_connections = max_connections
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._lock = threading.Lock()
+
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """Start the event loop thread on first use"""
+        if self._loop is not None:
+            return self._loop
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="focas-proxy-loop", daemon=True).start()
+                self._loop = loop
+        return self._loop
+
+    def _http(self) -> httpx.AsyncClient:
+        # Created lazily on the loop thread; one pool shared by all in-flight proxy calls
+        if self._client is None:
+            self._client = httpx.AsyncClient(limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=min(self.max_connections, 20)
+            ))
+        return self._client
+
+    def run_sync(self, coro):
+        """
+        Run a coroutine on the proxy loop from a worker thread and wait for it.
+        The caller's context (current trace/span) is carried over to the task.
+        """
+        ctx = contextvars.copy_context()
+        result: concurrent.futures.Future = concurrent.futures.Future()
+
+        def _start():
+            task = ctx.run(self.loop().create_task, coro)
+
+            def _done(t: asyncio.Task):
+                if t.cancelled():
+                    result.cancel()
+                elif t.exception() is not None:
+                    result.set_exception(t.exception())
+                else:
+                    result.set_result(t.result())
+            task.add_done_callback(_done)
+
+        self.loop().call_soon_threadsafe(_start)
+        return result.result()
+
+    async def call(self, method: str, operation: str, path: str, timeout: float,
+                   json_body: Optional[dict] = None) -> Tuple[httpx.Response, Optional[Dict]]:
+        """
+        Call FocasService and record latency and error metrics for the operation.
+
+        Returns:
+            (response, data): data is the parsed JSON body for 2xx responses, otherwise None.
+            httpx exceptions are re-raised after being counted.
+        """
+        start = time.perf_counter()
+        outcome = "ok"
+        with span(f"focas.{operation}", method=method):
+            try:
+                try:
+                    response = await self._http().request(
+                        method, f"{get_focas_service_url()}{path}", json=json_body, timeout=timeout
+                    )
+                except httpx.HTTPError as e:
+                    outcome = "error"
+                    FOCAS_ERRORS.inc(operation=operation, code=type(e).__name__)
+                    traffic_recorder.http('focas', method, path, start, json_body, error=type(e).__name__)
+                    raise
+                traffic_recorder.http('focas', method, path, start, json_body, response.status_code,
+                                      response.content, response.headers.get('content-type'))
+
+                if not response.is_success:
+                    outcome = "http_error"
+                    FOCAS_ERRORS.inc(operation=operation, code=f"HTTP {response.status_code}")
+                    return response, None
+
+                try:
+                    data = response.json()
+                except ValueError:
+                    outcome = "invalid_json"
+                    FOCAS_ERRORS.inc(operation=operation, code="invalid_json")
+                    return response, None
+
+                # FocasService returns 200 even on errors, with success: false and errorCode
+                if isinstance(data, dict) and data.get("success") is False:
+                    outcome = "focas_error"
+                    FOCAS_ERRORS.inc(operation=operation, code=str(data.get("errorCode", "")))
+                return response, data
+            finally:
+                FOCAS_REQUEST_DURATION.observe(time.perf_counter() - start, operation=operation, outcome=outcome)
+
+    async def read_raw(self, ip_address: str, operation: str, path: str, timeout: float) -> RawResponse:
+        """
+        Proxy a read to FocasService in a session of its own for the CNC, passing the body
+        through as bytes. path is the route after the IP (see session_path); timeout is the
+        read timeout, FOCAS_SESSION_OPEN_TIMEOUT is added for opening the session. Breaker
+        and upstream HTTP errors are returned as small JSON bodies (see error_payload).
+        """
+        breaker = focas_breaker(ip_address)
+        if not breaker.allow():
+            return RawResponse.from_payload(*breaker_payload(breaker))
+        url_path = session_path(ip_address, path)
+        try:
+            start = time.perf_counter()
+            with span(f"focas.{operation}", method='GET'):
+                try:
+                    upstream = await self._http().send(
+                        self._http().build_request('GET', f"{get_focas_service_url()}{url_path}",
+                                                   timeout=timeout + FOCAS_SESSION_OPEN_TIMEOUT),
+                        stream=True
+                    )
+                except httpx.HTTPError as e:
+                    FOCAS_ERRORS.inc(operation=operation, code=type(e).__name__)
+                    FOCAS_REQUEST_DURATION.observe(time.perf_counter() - start, operation=operation, outcome="error")
+                    traffic_recorder.http('focas', 'GET', url_path, start, error=type(e).__name__)
+                    raise
+
+            if not upstream.is_success:
+                await upstream.aread()
+                await upstream.aclose()
+                traffic_recorder.http('focas', 'GET', url_path, start, status=upstream.status_code, body=upstream.content,
+                                      content_type=upstream.headers.get('content-type'))
+                FOCAS_ERRORS.inc(operation=operation, code=f"HTTP {upstream.status_code}")
+                FOCAS_REQUEST_DURATION.observe(time.perf_counter() - start, operation=operation, outcome="http_error")
+                upstream.raise_for_status()
+
+            async def finish(raw: RawResponse):
+                outcome = "ok"
+                if raw.focas_error is not None:
+                    outcome = "focas_error"
+                    FOCAS_ERRORS.inc(operation=operation, code=raw.focas_error)
+                FOCAS_REQUEST_DURATION.observe(time.perf_counter() - start, operation=operation, outcome=outcome)
+                if raw.captured is not None:
+                    traffic_recorder.http('focas', 'GET', url_path, start, status=200, body=b''.join(raw.captured),
+                                          content_type=raw.content_type)
+                # Only transport errors count against the CNC; a bad tool number does not
+                if is_transport_error(raw.focas_error):
+                    breaker.failure(f"FOCAS error {raw.focas_error}")
+                else:
+                    breaker.success()
+
+            length = upstream.headers.get('content-length')
+            return RawResponse(
+                200, upstream.headers.get('content-type', 'application/json'),
+                int(length) if length and 'content-encoding' not in upstream.headers else None,
+                upstream=upstream, on_close=finish, capture=traffic_recorder.enabled
+            )
+
+        except Exception as e:
+            payload, status = error_payload(e)
+            if status == 504:
+                breaker.failure(payload["error"])
+            return RawResponse.from_payload(payload, status)
+
+    async def _read_tool_chunk(self, ip_address: str, start: int, end: int) -> Tuple[Optional[List], Optional[Tuple[Dict, int]]]:
+        """One tool-offsets-range request in its own session; returns (tools, None) or (None, error)"""
+        try:
+            response, data = await self.call(
+                'GET', 'tool-offsets-range', session_path(ip_address, f"tool-offsets-range/{start}/{end}"),
+                timeout=FOCAS_RANGE_CHUNK_TIMEOUT + FOCAS_SESSION_OPEN_TIMEOUT
+            )
+            response.raise_for_status()
+            if data is None:
+                raise ValueError("Invalid JSON response from FocasService")
+            if not data.get("success"):
+                return None, ({"success": False, "error": data.get("error", "Unknown error"),
+                               "errorCode": data.get("errorCode")}, 502)
+            return (data.get("data") or {}).get("tools", []), None
+        except Exception as e:
+            return None, error_payload(e)
+
+    async def stream_tool_offsets_range(self, ip_address: str, start_tool: int, end_tool: int,
+                                        chunk_size: int = FOCAS_RANGE_CHUNK_SIZE,
+                                        retries: int = FOCAS_RANGE_RETRIES):
+        """
+        Read a tool range in chunks, yielding one record per chunk:
+            {"type": "chunk", "start", "end", "attempts", "tools": [...]}
+            {"type": "error", "start", "end", "attempts", "status", "error"}
+        and a final {"type": "done", "success", "received", "failed_chunks", "duration_ms"}.
+        Each chunk is its own FocasService session, so other reads of the same CNC get a turn
+        between chunks. A failed chunk is retried on its own; the other chunks are kept. Once
+        the CNC cannot be reached (negative FOCAS error code, timeout) the rest is reported as failed.
+        """
+        started = time.perf_counter()
+        chunk_size = max(1, chunk_size)
+        chunks = [(s, min(s + chunk_size - 1, end_tool)) for s in range(start_tool, end_tool + 1, chunk_size)]
+        failed: List[List[int]] = []
+        received = 0
+        breaker = focas_breaker(ip_address)
+        if not breaker.allow():
+            # Nothing can be read; report every chunk as failed
+            payload, status = breaker_payload(breaker)
+            failed = [[s, e] for s, e in chunks]
+            yield {"type": "error", "start": start_tool, "end": end_tool, "attempts": 1,
+                   "status": status, "error": payload["error"], "breaker": payload["breaker"]}
+            chunks = []
+
+        for index, (start, end) in enumerate(chunks):
+            for attempt in range(1, retries + 2):
+                tools, error = await self._read_tool_chunk(ip_address, start, end)
+                unreachable = error is not None and (error[1] == 504 or is_transport_error(error[0].get("errorCode")))
+                if error is None or error[1] == 503 or unreachable:
+                    break  # Done, or FocasService / the CNC is down and retrying will not help
+            if error is None:
+                breaker.success()
+                received += len(tools)
+                yield {"type": "chunk", "start": start, "end": end, "attempts": attempt, "tools": tools}
+                continue
+            failed.append([start, end])
+            if unreachable:
+                breaker.failure(error[0]["error"])
+            yield {"type": "error", "start": start, "end": end, "attempts": attempt,
+                   "status": error[1], "error": error[0].get("error")}
+            if error[1] == 503 or unreachable or breaker.state != CLOSED:
+                failed.extend([s, e] for s, e in chunks[index + 1:])
+                break
+
+        yield {"type": "done", "success": not failed, "received": received, "failed_chunks": failed,
+               "duration_ms": round((time.perf_counter() - started) * 1000, 1)}
+
+    def iter_sync(self, agen):
+        """Drive an async generator on the proxy loop from a worker thread (Flask streaming responses)"""
+        try:
+            while True:
+                try:
+                    yield self.run_sync(agen.__anext__())
+                except StopAsyncIteration:
+                    return
+        finally:
+            self.run_sync(agen.aclose())
+
+
+proxy = AsyncFocasProxy()
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+Hourly kassationer rollups in a local SQLite store.
+
+The rollup job (app.py: background_kassationer_rollup) aggregates MI rows per work center and
+UTC hour into two tables:
+- rejected_hourly: rejected pieces and events per rejected_code, part_number and operator_id
+  (material_work_log_item + manual_work_log_item, same sources as SQL_KASSATIONER)
+- produced_hourly: reported and rejected quantities per part_number (report_item, same source as
+  SQL_KASSATIONER_SUMMARY)
+
+Each hour row also stores its Europe/Stockholm day and ISO week, so day/week/month reports over any
+window are a GROUP BY over a few thousand local rows instead of a scan of MI history. The trailing
+KASSATIONER_ROLLUP_RECOMPUTE_HOURS are re-aggregated on every run to pick up late reports.
+The job runs on the instance holding the 'kassationer-rollup' leader lease; the others read the same
+database, so KASSATIONER_ROLLUP_DIR must be shared between them.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+KASSATIONER_ROLLUP_DIR = os.getenv(
+    'KASSATIONER_ROLLUP_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'kassationer_rollup')
+)
+# WAL needs shared memory; use DELETE when KASSATIONER_ROLLUP_DIR is on a share used by several hosts
+KASSATIONER_ROLLUP_JOURNAL_MODE = os.getenv('KASSATIONER_ROLLUP_JOURNAL_MODE', 'WAL')
+KASSATIONER_ROLLUP_INTERVAL = int(os.getenv('KASSATIONER_ROLLUP_INTERVAL', '900'))  # seconds between rollup runs
+KASSATIONER_ROLLUP_BACKFILL_DAYS = int(os.getenv('KASSATIONER_ROLLUP_BACKFILL_DAYS', '400'))  # history rolled up on first run
+KASSATIONER_ROLLUP_RECOMPUTE_HOURS = int(os.getenv('KASSATIONER_ROLLUP_RECOMPUTE_HOURS', '72'))  # late MI reports
+KASSATIONER_ROLLUP_CHUNK_DAYS = int(os.getenv('KASSATIONER_ROLLUP_CHUNK_DAYS', '7'))  # MI window per query
+
+LOCAL_TZ = ZoneInfo('Europe/Stockholm')  # Same zone as event_time_local in SQL_KASSATIONER
+
+GRANULARITIES = ('day', 'week', 'month')
+GROUP_BY_COLUMNS = {'code': 'rejected_code', 'part': 'part_number', 'operator': 'operator_id'}
+
+# Period label per granularity, from the local day/week stored with each hour
+_PERIOD_SQL = {'day': 'local_day', 'week': 'local_week', 'month': 'substr(local_day, 1, 7)'}
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS rejected_hourly (
+    work_center TEXT NOT NULL,
+    hour_utc INTEGER NOT NULL,
+    local_day TEXT NOT NULL,
+    local_week TEXT NOT NULL,
+    rejected_code TEXT NOT NULL,
+    part_number TEXT NOT NULL,
+    operator_id TEXT NOT NULL,
+    rejected_qty REAL NOT NULL,
+    events INTEGER NOT NULL,
+    PRIMARY KEY (work_center, hour_utc, rejected_code, part_number, operator_id)
+);
+CREATE TABLE IF NOT EXISTS produced_hourly (
+    work_center TEXT NOT NULL,
+    hour_utc INTEGER NOT NULL,
+    local_day TEXT NOT NULL,
+    local_week TEXT NOT NULL,
+    part_number TEXT NOT NULL,
+    produced_qty INTEGER NOT NULL,
+    rejected_qty INTEGER NOT NULL,
+    PRIMARY KEY (work_center, hour_utc, part_number)
+);
+CREATE INDEX IF NOT EXISTS rejected_hourly_hour ON rejected_hourly (hour_utc);
+CREATE INDEX IF NOT EXISTS produced_hourly_hour ON produced_hourly (hour_utc);
+CREATE TABLE IF NOT EXISTS rollup_state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+'''
+
+
+def hour_start(value: datetime) -> datetime:
+    """Start of the UTC hour containing value (naive datetimes are UTC, as returned by the rollup SQL)"""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def local_labels(hour_utc: datetime) -> Tuple[str, str]:
+    """Europe/Stockholm day ('2024-03-31') and ISO week ('2024-W13') of an hour"""
+    local = hour_utc.astimezone(LOCAL_TZ)
+    year, week, _ = local.isocalendar()
+    return local.strftime('%Y-%m-%d'), f"{year}-W{week:02d}"
+
+
+def parse_local_datetime(value: str) -> datetime:
+    """ISO date or datetime; without an offset it is Swedish local time, like the kassationer reports"""
+    parsed = datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=LOCAL_TZ)
+
+
+def _text(value) -> str:
+    return '' if value is None else str(value).strip()
+
+
+class KassationerRollup:
+    def __init__(self, directory: str = KASSATIONER_ROLLUP_DIR):
+        self.directory = directory
+        self.path = os.path.join(directory, 'rollup.db')
+        self._refresh_lock = threading.Lock()
+        self._schema_ready = False
+        self.last_run: Dict = {}
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._schema_ready:
+            os.makedirs(self.directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30)
+        if not self._schema_ready:
+            # WAL: readers are not blocked by the rollup job
+            conn.execute(f'PRAGMA journal_mode={KASSATIONER_ROLLUP_JOURNAL_MODE}')
+            conn.executescript(_SCHEMA)
+            self._schema_ready = True
+        return conn
+
+    def watermark(self) -> Optional[datetime]:
+        """Time up to which MI has been rolled up"""
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT value FROM rollup_state WHERE key = 'watermark'").fetchone()
+        finally:
+            conn.close()
+        return datetime.fromisoformat(row[0]) if row else None
+
+    # Rollup job
+
+    def refresh(self, fetch: Callable[[datetime, datetime], Tuple[Iterable, Iterable]],
+                now: Optional[datetime] = None, rebuild: bool = False) -> Dict:
+        """
+        Roll up MI from the watermark (less the recompute window) to now, KASSATIONER_ROLLUP_CHUNK_DAYS
+        at a time. fetch(start, end) returns (rejected_rows, produced_rows) aggregated per hour:
+        rejected rows (hour_utc, work_center, part_number, rejected_code, operator_id, rejected_qty, events),
+        produced rows (hour_utc, work_center, part_number, produced_qty, rejected_qty).
+        """
+        with self._refresh_lock:
+            started = time.perf_counter()
+            now = now or datetime.now(timezone.utc)
+            watermark = None if rebuild else self.watermark()
+            if watermark is None:
+                start = hour_start(now - timedelta(days=KASSATIONER_ROLLUP_BACKFILL_DAYS))
+            else:
+                start = hour_start(min(watermark, now) - timedelta(hours=KASSATIONER_ROLLUP_RECOMPUTE_HOURS))
+
+            rows = 0
+            chunks = 0
+            chunk_start = start
+            while chunk_start < now:
+                chunk_end = min(chunk_start + timedelta(days=KASSATIONER_ROLLUP_CHUNK_DAYS), now)
+                rejected, produced = fetch(chunk_start, chunk_end)
+                rows += self._replace(chunk_start, chunk_end, rejected, produced, rebuild and chunks == 0)
+                chunks += 1
+                chunk_start = chunk_end
+
+            self.last_run = {
+                "from": start.isoformat(),
+                "to": now.isoformat(),
+                "chunks": chunks,
+                "rows": rows,
+                "rebuild": rebuild,
+                "duration_seconds": round(time.perf_counter() - started, 3),
+                "finished_at": datetime.now(timezone.utc).isoformat(),
+            }
+            return self.last_run
+
+    def _replace(self, start: datetime, end: datetime, rejected: Iterable, produced: Iterable,
+                 clear_all: bool = False) -> int:
+        """Swap the hours of [start, end) for freshly aggregated rows and advance the watermark, in one transaction.
+        The hour containing end is partial and is recomputed on the next run."""
+        start_ts, end_ts = int(start.timestamp()), int(end.timestamp())
+        labels: Dict[datetime, Tuple[str, str]] = {}
+
+        def hour_columns(value) -> Tuple[int, str, str]:
+            hour = hour_start(value)
+            if hour not in labels:
+                labels[hour] = local_labels(hour)
+            return (int(hour.timestamp()),) + labels[hour]
+
+        rejected_rows = [
+            (_text(wc), *hour_columns(hour), _text(code), _text(part), _text(operator), float(qty or 0), int(events or 0))
+            for hour, wc, part, code, operator, qty, events in rejected
+        ]
+        produced_rows = [
+            (_text(wc), *hour_columns(hour), _text(part), int(produced_qty or 0), int(rejected_qty or 0))
+            for hour, wc, part, produced_qty, rejected_qty in produced
+        ]
+
+        conn = self._connect()
+        try:
+            with conn:
+                if clear_all:
+                    conn.execute('DELETE FROM rejected_hourly')
+                    conn.execute('DELETE FROM produced_hourly')
+                conn.execute('DELETE FROM rejected_hourly WHERE hour_utc >= ? AND hour_utc < ?', (start_ts, end_ts))
+                conn.execute('DELETE FROM produced_hourly WHERE hour_utc >= ? AND hour_utc < ?', (start_ts, end_ts))
+                # Upserts sum rows that differ only in untrimmed text (the MI GROUP BY sees them as distinct)
+                conn.executemany(
+                    'INSERT INTO rejected_hourly VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) '
+                    'ON CONFLICT (work_center, hour_utc, rejected_code, part_number, operator_id) DO UPDATE '
+                    'SET rejected_qty = rejected_qty + excluded.rejected_qty, '
+                    'events = events + excluded.events',
+                    rejected_rows
+                )
+                conn.executemany(
+                    'INSERT INTO produced_hourly VALUES (?, ?, ?, ?, ?, ?, ?) '
+                    'ON CONFLICT (work_center, hour_utc, part_number) DO UPDATE '
+                    'SET produced_qty = produced_qty + excluded.produced_qty, '
+                    'rejected_qty = rejected_qty + excluded.rejected_qty',
+                    produced_rows
+                )
+                conn.execute("INSERT OR REPLACE INTO rollup_state VALUES ('watermark', ?)", (end.isoformat(),))
+        finally:
+            conn.close()
+        return len(rejected_rows) + len(produced_rows)
+
+    # Queries
+
+    def query(self, work_center: str, start: datetime, end: datetime, granularity: str = 'day',
+              group_by: Optional[str] = None) -> Dict:
+        """Producerade/kasserade per period in [start, end), optionally split by code, part or operator"""
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"granularity must be one of {', '.join(GRANULARITIES)}")
+        if group_by is not None and group_by not in GROUP_BY_COLUMNS:
+            raise ValueError(f"group_by must be one of {', '.join(GROUP_BY_COLUMNS)}")
+
+        period = _PERIOD_SQL[granularity]
+        group = GROUP_BY_COLUMNS[group_by] if group_by else "''"
+        # Hours are whole UTC hours; a window edge inside an hour includes that hour
+        params = (work_center, int(hour_start(start).timestamp()), int(end.timestamp()))
+        where = 'work_center = ? AND hour_utc >= ? AND hour_utc < ?'
+
+        conn = self._connect()
+        try:
+            rejected = conn.execute(
+                f'SELECT {period}, {group}, SUM(rejected_qty), SUM(events) FROM rejected_hourly '
+                f'WHERE {where} GROUP BY 1, 2', params
+            ).fetchall()
+            produced_group = 'part_number' if group_by == 'part' else "''"
+            produced = conn.execute(
+                f'SELECT {period}, {produced_group}, SUM(produced_qty), SUM(rejected_qty) FROM produced_hourly '
+                f'WHERE {where} GROUP BY 1, 2', params
+            ).fetchall()
+        finally:
+            conn.close()
+
+        periods: Dict[str, Dict] = {}
+
+        def period_entry(label: str) -> Dict:
+            if label not in periods:
+                periods[label] = {"period": label, "producerade": 0, "kasserade": 0, "rejected_qty": 0.0,
+                                  "events": 0, "groups": {}}
+            return periods[label]
+
+        for label, key, qty, events in rejected:
+            entry = period_entry(label)
+            entry["rejected_qty"] += qty
+            entry["events"] += events
+            if group_by:
+                g = entry["groups"].setdefault(key, {"key": key, "rejected_qty": 0.0, "events": 0})
+                g["rejected_qty"] += qty
+                g["events"] += events
+        for label, key, produced_qty, rejected_qty in produced:
+            entry = period_entry(label)
+            entry["producerade"] += produced_qty
+            entry["kasserade"] += rejected_qty
+            if group_by == 'part':
+                g = entry["groups"].setdefault(key, {"key": key, "rejected_qty": 0.0, "events": 0})
+                g["producerade"] = g.get("producerade", 0) + produced_qty
+                g["kasserade"] = g.get("kasserade", 0) + rejected_qty
+
+        result: List[Dict] = []
+        for label in sorted(periods):
+            entry = periods[label]
+            groups = sorted(entry.pop("groups").values(), key=lambda g: (-g["rejected_qty"], g["key"]))
+            if group_by:
+                entry["groups"] = groups
+            result.append(entry)
+
+        return {
+            "producerade": sum(p["producerade"] for p in result),
+            "kasserade": sum(p["kasserade"] for p in result),
+            "rejected_qty": sum(p["rejected_qty"] for p in result),
+            "periods": result,
+        }
+
+    def status(self) -> Dict:
+        conn = self._connect()
+        try:
+            rejected_rows, first, last = conn.execute(
+                'SELECT COUNT(*), MIN(hour_utc), MAX(hour_utc) FROM rejected_hourly').fetchone()
+            produced_rows = conn.execute('SELECT COUNT(*) FROM produced_hourly').fetchone()[0]
+            work_centers = conn.execute(
+                'SELECT COUNT(DISTINCT work_center) FROM produced_hourly').fetchone()[0]
+        finally:
+            conn.close()
+        watermark = self.watermark()
+        return {
+            "path": self.path,
+            "watermark": watermark.isoformat() if watermark else None,
+            "rejected_rows": rejected_rows,
+            "produced_rows": produced_rows,
+            "work_centers": work_centers,
+            "first_hour": datetime.fromtimestamp(first, timezone.utc).isoformat() if first is not None else None,
+            "last_hour": datetime.fromtimestamp(last, timezone.utc).isoformat() if last is not None else None,
+            "last_run": self.last_run or None,
+        }
+
+
+rollup = KassationerRollup()
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+Single-leader scheduling for background jobs when several backend instances run app.py.
+
+Every instance competes for a named lease in a shared SQLite database (SCHEDULER_LEASE_DB -
+a file on a share for several hosts, or the default local file for several processes on one
+host). The holder renews it every SCHEDULER_HEARTBEAT_INTERVAL seconds and runs the job; the
+other instances stay on hot standby and take over once the lease has not been renewed for
+SCHEDULER_LEASE_TTL seconds. Each takeover increments the term, so the log shows leader changes.
+
+The database also records when the job last ran, so a new leader continues the schedule
+instead of running the job again straight after the previous leader did, and which one-off
+notifications the job has sent, so a new leader does not send them again.
+"""
+
+import os
+import socket
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from metrics import REGISTRY
+
+SCHEDULER_LEADER_ELECTION = os.getenv('SCHEDULER_LEADER_ELECTION', 'true').lower() == 'true'
+SCHEDULER_LEASE_DB = os.getenv(
+    'SCHEDULER_LEASE_DB',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'scheduler_leases.db')
+)
+SCHEDULER_LEASE_TTL = float(os.getenv('SCHEDULER_LEASE_TTL', '60'))  # seconds without renewal before another instance takes over
+SCHEDULER_HEARTBEAT_INTERVAL = float(os.getenv('SCHEDULER_HEARTBEAT_INTERVAL', '15'))
+SCHEDULER_INSTANCE_ID = os.getenv('SCHEDULER_INSTANCE_ID', f"{socket.gethostname()}-{os.getpid()}")
+
+IS_LEADER = REGISTRY.gauge("scheduler_is_leader", "1 if this instance holds the job's leader lease", ["job"])
+LEADER_CHANGES = REGISTRY.counter("scheduler_leader_changes_total", "Leader lease acquired or lost by this instance", ["job", "change"])
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS leaders (
+    name TEXT PRIMARY KEY,
+    holder TEXT NOT NULL,
+    host TEXT,
+    term INTEGER NOT NULL,
+    acquired_at REAL NOT NULL,
+    expires_at REAL NOT NULL,
+    last_run_at REAL
+);
+CREATE TABLE IF NOT EXISTS sent_notifications (
+    name TEXT NOT NULL,
+    key TEXT NOT NULL,
+    sent_at REAL NOT NULL,
+    PRIMARY KEY (name, key)
+);
+'''
+
+
+class LeaderElection:
+    """Leader lease for one job name; is_leader() is True on exactly one instance at a time"""
+
+    def __init__(self, name: str, path: str = SCHEDULER_LEASE_DB, instance_id: str = SCHEDULER_INSTANCE_ID,
+                 ttl: float = SCHEDULER_LEASE_TTL, heartbeat_interval: float = SCHEDULER_HEARTBEAT_INTERVAL,
+                 enabled: bool = SCHEDULER_LEADER_ELECTION):
+        self.name = name
+        self.path = path
+        self.instance_id = instance_id
+        self.ttl = ttl
+        self.heartbeat_interval = heartbeat_interval
+        self.enabled = enabled
+        self.term: Optional[int] = None
+        self.holder: Optional[str] = None
+        self.holder_expires_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self._expires_at = 0.0  # local lease expiry; 0 when not leader
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._schema_ready = False
+        self._sent: Dict[str, float] = {}  # sent notifications with leader election disabled
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._schema_ready:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        # Default rollback journal - WAL needs shared memory and does not work on a network share
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        if not self._schema_ready:
+            conn.executescript(_SCHEMA)
+            self._schema_ready = True
+        return conn
+
+    def heartbeat(self):
+        """Take the lease if it is free or expired, renew it if held, otherwise note the current holder"""
+        if not self.enabled:
+            return
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute('SELECT holder, term, expires_at FROM leaders WHERE name = ?', (self.name,)).fetchone()
+            holder, term, expires_at = row if row else (None, 0, 0.0)
+            if holder == self.instance_id or holder is None or expires_at < now:
+                if holder != self.instance_id:
+                    term += 1
+                conn.execute(
+                    'INSERT INTO leaders (name, holder, host, term, acquired_at, expires_at) VALUES (?, ?, ?, ?, ?, ?) '
+                    'ON CONFLICT (name) DO UPDATE SET holder = excluded.holder, host = excluded.host, term = excluded.term, '
+                    'expires_at = excluded.expires_at, '
+                    'acquired_at = CASE WHEN leaders.holder = excluded.holder THEN leaders.acquired_at ELSE excluded.acquired_at END',
+                    (self.name, self.instance_id, socket.gethostname(), term, now, now + self.ttl)
+                )
+                holder, expires_at = self.instance_id, now + self.ttl
+            conn.execute('COMMIT')
+        except Exception:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+
+        leader = holder == self.instance_id
+        with self._lock:
+            was_leader = self._expires_at > 0
+            # Renewal is counted from before the transaction, so the local view never outlives the stored lease
+            self._expires_at = now + self.ttl if leader else 0.0
+            self.term, self.holder, self.holder_expires_at = term, holder, expires_at
+            self.last_error = None
+        IS_LEADER.set(1 if leader else 0, job=self.name)
+        if leader != was_leader:
+            LEADER_CHANGES.inc(job=self.name, change='acquired' if leader else 'lost')
+            if leader:
+                print(f"Leader ({self.name}): {self.instance_id} is leader, term {term}")
+            else:
+                print(f"Leader ({self.name}): {self.instance_id} on standby, leader is {holder}")
+
+    def start(self):
+        """Compete for the lease and keep renewing it in a background thread"""
+        if not self.enabled or self._thread is not None:
+            return
+        try:
+            self.heartbeat()
+        except Exception as e:
+            self._heartbeat_failed(e)
+        self._thread = threading.Thread(target=self._heartbeat_loop, name=f"leader-{self.name}", daemon=True)
+        self._thread.start()
+
+    def _heartbeat_loop(self):
+        while not self._stop.wait(self.heartbeat_interval):
+            try:
+                self.heartbeat()
+            except Exception as e:
+                self._heartbeat_failed(e)
+
+    def _heartbeat_failed(self, e: Exception):
+        # Keep the local lease until it expires - the database may only be briefly locked or unreachable
+        with self._lock:
+            self.last_error = str(e)
+        print(f"Warning: Leader heartbeat ({self.name}) failed: {e}")
+
+    def resign(self):
+        """Stop renewing and release the lease so a standby instance takes over at once"""
+        self._stop.set()
+        if not self.enabled:
+            return
+        with self._lock:
+            self._expires_at = 0.0
+        IS_LEADER.set(0, job=self.name)
+        conn = self._connect()
+        try:
+            conn.execute('UPDATE leaders SET expires_at = 0 WHERE name = ? AND holder = ?', (self.name, self.instance_id))
+        finally:
+            conn.close()
+
+    def is_leader(self) -> bool:
+        """True while this instance holds an unexpired lease (always True with leader election disabled)"""
+        if not self.enabled:
+            return True
+        with self._lock:
+            return self._expires_at > time.time()
+
+    # Schedule shared between leaders
+
+    def last_run(self) -> Optional[float]:
+        """Time the job last finished on any instance"""
+        if not self.enabled:
+            return None
+        conn = self._connect()
+        try:
+            row = conn.execute('SELECT last_run_at FROM leaders WHERE name = ?', (self.name,)).fetchone()
+        finally:
+            conn.close()
+        return row[0] if row else None
+
+    def record_run(self, finished_at: float):
+        if not self.enabled:
+            return
+        conn = self._connect()
+        try:
+            conn.execute('UPDATE leaders SET last_run_at = ? WHERE name = ? AND holder = ?',
+                         (finished_at, self.name, self.instance_id))
+        finally:
+            conn.close()
+
+    def notification_sent_at(self, key: str) -> Optional[float]:
+        """Time a notification with this key was last sent by any instance"""
+        if not self.enabled:
+            with self._lock:
+                return self._sent.get(key)
+        conn = self._connect()
+        try:
+            row = conn.execute('SELECT sent_at FROM sent_notifications WHERE name = ? AND key = ?',
+                               (self.name, key)).fetchone()
+        finally:
+            conn.close()
+        return row[0] if row else None
+
+    def record_notification(self, key: str, sent_at: float):
+        if not self.enabled:
+            with self._lock:
+                self._sent[key] = sent_at
+            return
+        conn = self._connect()
+        try:
+            conn.execute('INSERT INTO sent_notifications (name, key, sent_at) VALUES (?, ?, ?) '
+                         'ON CONFLICT (name, key) DO UPDATE SET sent_at = excluded.sent_at',
+                         (self.name, key, sent_at))
+        finally:
+            conn.close()
+
+    def run_periodically(self, interval: float, job: Callable[[], None]):
+        """
+        Run job every interval seconds on the leader only (blocks; run in a thread). Standby instances
+        wait for the lease, and a new leader continues from the last recorded run.
+        """
+        self.start()
+        while True:
+            if not self.is_leader():
+                time.sleep(self.heartbeat_interval)
+                continue
+            try:
+                last_run = self.last_run()
+            except Exception as e:
+                print(f"Warning: Could not read last run of {self.name}: {e}")
+                last_run = None
+            wait = last_run + interval - time.time() if last_run else 0
+            if wait > 0:
+                time.sleep(min(wait, self.heartbeat_interval))
+                continue
+
+            try:
+                job()
+            except Exception as e:
+                print(f"Error in {self.name}: {str(e)}")
+            try:
+                self.record_run(time.time())
+            except Exception as e:
+                print(f"Warning: Could not record run of {self.name}: {e}")
+            time.sleep(interval)
+
+    def status(self) -> Dict:
+        leader = self.is_leader()
+        with self._lock:
+            return {
+                "job": self.name,
+                "enabled": self.enabled,
+                "instance_id": self.instance_id,
+                "is_leader": leader,
+                "leader": self.holder if self.enabled else self.instance_id,
+                "term": self.term,
+                "lease_expires_at": self.holder_expires_at,
+                "lease_ttl_seconds": self.ttl,
+                "last_error": self.last_error,
+            }
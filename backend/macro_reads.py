@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Macro variable range reads (e.g. #500-#999) with a short-lived cache per machine.
+
+FocasService reads the whole range in one session (GET /api/focas/sessions/<ip>/macros/<start>/<end>).
+A read of a machine within MACRO_CACHE_TTL seconds of the last one that covered the range is answered from
+the cache. Concurrent reads of the same machine wait for the read already running and do not open another
+session. Each fresh read is compared with the values last read from that machine, so the
+response also shows what changed on the control since then (e.g. after a fleet-wide parameter push).
+"""
+
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+
+from metrics import REGISTRY
+
+MACRO_CACHE_TTL = float(os.getenv('MACRO_CACHE_TTL', '15'))  # seconds a range read is served from the cache
+MACRO_RANGE_MAX = int(os.getenv('MACRO_RANGE_MAX', '1000'))  # variables per read (FocasService allows at most 1000)
+MACRO_READ_TIMEOUT = float(os.getenv('MACRO_READ_TIMEOUT', '30'))
+
+MACRO_READS = REGISTRY.counter("macro_range_reads_total", "Macro range reads by source (cache, focas, error)", ["source"])
+
+
+def _iso(ts: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat() if ts else None
+
+
+class MacroCache:
+    """Latest range reads per machine plus the last known value of every variable read, for diffs"""
+
+    def __init__(self, read: Callable[[str, int, int], List[Dict]], ttl: float = MACRO_CACHE_TTL):
+        # read(ip, start, end) -> FocasService variables [{"number", "mcrVal", "decVal", "value"}]
+        self.read = read
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._machine_locks: Dict[str, threading.Lock] = {}
+        self._reads: Dict[str, Dict[Tuple[int, int], Dict]] = {}  # ip -> (start, end) -> read
+        self._known: Dict[str, Dict[int, Tuple[Optional[float], float]]] = {}  # ip -> number -> (value, read_at)
+
+    def _machine_lock(self, ip: str) -> threading.Lock:
+        with self._lock:
+            return self._machine_locks.setdefault(ip, threading.Lock())
+
+    def get(self, ip: str, start: int, end: int, max_age: Optional[float] = None) -> Dict:
+        """Variables #start-#end and the diff against the previous read; max_age=0 always reads the control"""
+        max_age = self.ttl if max_age is None else max_age
+        with self._machine_lock(ip):
+            now = time.time()
+            reads = self._reads.setdefault(ip, {})
+            for (s, e), entry in list(reads.items()):
+                if now - entry['read_at'] > self.ttl:
+                    del reads[(s, e)]
+                elif s <= start and end <= e and now - entry['read_at'] <= max_age:
+                    MACRO_READS.inc(source='cache')
+                    return self._view(ip, entry, start, end, cached=True)
+
+            try:
+                variables = self.read(ip, start, end)
+            except Exception:
+                MACRO_READS.inc(source='error')
+                raise
+            MACRO_READS.inc(source='focas')
+            entry = self._store(ip, start, end, variables, time.time())
+            reads[(start, end)] = entry
+            return self._view(ip, entry, start, end, cached=False)
+
+    def invalidate(self, ip: str):
+        """Drop the cached range reads of one machine (after a macro write); the last known values stay for diffs"""
+        with self._machine_lock(ip):
+            self._reads.pop(ip, None)
+
+    def _store(self, ip: str, start: int, end: int, variables: List[Dict], read_at: float) -> Dict:
+        known = self._known.setdefault(ip, {})
+        values = {}
+        changed = []
+        compared = set()
+        previous_at = None
+        for v in variables:
+            number, value = int(v['number']), v.get('value')
+            values[number] = {"number": number, "value": value, "mcr_val": v.get('mcrVal'), "dec_val": v.get('decVal')}
+            if number in known:
+                before, before_at = known[number]
+                compared.add(number)
+                previous_at = max(previous_at or 0, before_at)
+                if before != value:
+                    changed.append({"number": number, "before": before, "after": value, "before_read_at": _iso(before_at)})
+            known[number] = (value, read_at)
+        return {"start": start, "end": end, "read_at": read_at, "values": values,
+                "changed": changed, "compared": compared, "previous_read_at": previous_at}
+
+    def _view(self, ip: str, entry: Dict, start: int, end: int, cached: bool) -> Dict:
+        in_range = lambda number: start <= number <= end  # noqa: E731
+        return {
+            "ip_address": ip,
+            "start": start,
+            "end": end,
+            "read_at": _iso(entry['read_at']),
+            "age_seconds": round(time.time() - entry['read_at'], 3),
+            "cached": cached,
+            "variables": [v for n, v in entry['values'].items() if in_range(n)],
+            "diff": {
+                "previous_read_at": _iso(entry['previous_read_at']),
+                "compared": sum(1 for n in entry['compared'] if in_range(n)),  # variables with an earlier value
+                "changed": [c for c in entry['changed'] if in_range(c['number'])],
+            },
+        }
+
+    def status(self) -> Dict:
+        with self._lock:
+            machines = list(self._machine_locks)
+        return {
+            "ttl_seconds": self.ttl,
+            "machines": {ip: sorted(f"#{s}-#{e}" for s, e in list(self._reads.get(ip, {}))) for ip in machines},
+        }
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Minimal Prometheus-style metrics (counters and histograms) without external dependencies.
+app.py serves render() on /metrics; compensation_monitor.py can write it to a textfile.
+"""
+
+import os
+import time
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Latency buckets in seconds - FOCAS range reads can take up to 30 s
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_labels(names: Sequence[str], values: Tuple[str, ...], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = []
+    for k, v in pairs:
+        v = str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        escaped.append(f'{k}="{v}"')
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format_value(v: float) -> str:
+    if v == float('inf'):
+        return "+Inf"
+    if float(v).is_integer():
+        return str(int(v))
+    return repr(float(v))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, object]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            for key, v in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}")
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        # key -> [bucket counts..., sum, count]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = [0] * len(self.buckets) + [0.0, 0]
+                self._values[key] = state
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        """Observe the duration of the with-block, also when it raises"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            for key, state in sorted(self._values.items()):
+                cumulative = 0
+                for i, bound in enumerate(self.buckets):
+                    cumulative += state[i]
+                    le = ("le", _format_value(bound))
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {_format_value(state[-2])}")
+                lines.append(f"{self.name}_count{labels} {state[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, documentation, labelnames=()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path: str):
+        """Write metrics atomically for a node_exporter textfile collector"""
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+
+REGISTRY = Registry()
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Metrics shared by every backend process
+
+HTTP_REQUEST_DURATION = REGISTRY.histogram(
+    "http_request_duration_seconds", "Flask route latency", ("method", "route", "status"))
+ODBC_QUERY_DURATION = REGISTRY.histogram(
+    "odbc_query_duration_seconds", "pyodbc execute+fetch time per SQL constant", ("query", "outcome"))
+ODBC_CONNECT_DURATION = REGISTRY.histogram(
+    "odbc_connect_duration_seconds", "pyodbc connection time per DSN", ("dsn", "outcome"))
+FOCAS_REQUEST_DURATION = REGISTRY.histogram(
+    "focas_request_duration_seconds", "FocasService call latency", ("operation", "outcome"))
+FOCAS_ERRORS = REGISTRY.counter(
+    "focas_errors_total", "FocasService failures by operation and error code", ("operation", "code"))
+MODBUS_READ_DURATION = REGISTRY.histogram(
+    "modbus_read_duration_seconds", "AdamBox Modbus read latency", ("ip", "outcome"))
+FILE_SHARE_READ_DURATION = REGISTRY.histogram(
+    "file_share_read_duration_seconds", "SMB share access latency", ("share", "operation", "outcome"))
+SUPABASE_REQUESTS = REGISTRY.counter(
+    "supabase_requests_total", "Supabase query builder calls per table", ("table",))
+BACKGROUND_CYCLE_DURATION = REGISTRY.histogram(
+    "background_cycle_duration_seconds", "Duration of background checker cycles", ("job",),
+    buckets=(1.0, 5.0, 15.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0, 3600.0))
+
+
+@contextmanager
+def timed(histogram: Histogram, **labels) -> Iterator[Dict[str, str]]:
+    """
+    Observe a with-block with an 'outcome' label: 'ok' unless the block raises
+    or sets outcome['outcome'] on the yielded dict.
+    """
+    outcome = {"outcome": "ok"}
+    start = time.perf_counter()
+    try:
+        yield outcome
+    except Exception:
+        outcome["outcome"] = "error"
+        raise
+    finally:
+        histogram.observe(time.perf_counter() - start, outcome=outcome["outcome"], **labels)
+
+
+class InstrumentedSupabase:
+    """Wrap a Supabase client so every table() call is counted per table"""
+
+    def __init__(self, client):
+        self._client = client
+
+    def table(self, name: str):
+        SUPABASE_REQUESTS.inc(table=name)
+        return self._client.table(name)
+
+    def __getattr__(self, item):
+        return getattr(self._client, item)
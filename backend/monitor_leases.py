@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Lease-based machine ownership for running several compensation_monitor.py instances.
+
+Instances register in a shared SQLite database (COMPENSATION_LEASE_DB - a file on a share
+for several hosts, or a local file for several processes on one host) and heartbeat every
+COMPENSATION_HEARTBEAT_INTERVAL seconds. Machines are divided between the live instances by
+rendezvous hashing, so each instance gets an equal share and adding or losing an instance only
+moves the machines that hash to it. An instance scans a machine only while it holds the lease,
+which it renews on every heartbeat; the leases of an instance that dies expire after
+COMPENSATION_LEASE_TTL seconds and are taken over by the survivors.
+
+The database also records when each machine was last scanned, so an instance that gets a
+machine back does not diff against a local snapshot older than another instance's scan.
+"""
+
+import os
+import hashlib
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Set
+
+from metrics import REGISTRY
+
+COMPENSATION_SHARDING = os.getenv('COMPENSATION_SHARDING', 'false').lower() == 'true'
+COMPENSATION_LEASE_DB = os.getenv(
+    'COMPENSATION_LEASE_DB',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'monitor_leases.db')
+)
+COMPENSATION_LEASE_TTL = float(os.getenv('COMPENSATION_LEASE_TTL', '120'))  # seconds without heartbeat before leases move
+COMPENSATION_HEARTBEAT_INTERVAL = float(os.getenv('COMPENSATION_HEARTBEAT_INTERVAL', '30'))
+COMPENSATION_INSTANCE_ID = os.getenv('COMPENSATION_INSTANCE_ID', f"{socket.gethostname()}-{os.getpid()}")
+
+LEASES_OWNED = REGISTRY.gauge("compensation_monitor_leases_owned", "Machines leased by this monitor instance")
+LIVE_INSTANCES = REGISTRY.gauge("compensation_monitor_live_instances", "Monitor instances with a recent heartbeat")
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS members (
+    instance_id TEXT PRIMARY KEY,
+    host TEXT,
+    started_at REAL NOT NULL,
+    heartbeat_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS leases (
+    machine_id TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    acquired_at REAL NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS scans (
+    machine_id TEXT PRIMARY KEY,
+    instance_id TEXT NOT NULL,
+    taken_at REAL NOT NULL
+);
+'''
+
+
+def rendezvous_owner(machine_id: str, members: Iterable[str]) -> Optional[str]:
+    """Member with the highest hash score for the machine (highest random weight hashing)"""
+    best, best_score = None, None
+    for member in members:
+        score = hashlib.sha1(f"{member}/{machine_id}".encode('utf-8')).digest()
+        if best_score is None or score > best_score:
+            best, best_score = member, score
+    return best
+
+
+class LeaseManager:
+    def __init__(self, path: str = COMPENSATION_LEASE_DB, instance_id: str = COMPENSATION_INSTANCE_ID,
+                 ttl: float = COMPENSATION_LEASE_TTL, heartbeat_interval: float = COMPENSATION_HEARTBEAT_INTERVAL):
+        self.path = path
+        self.instance_id = instance_id
+        self.ttl = ttl
+        self.heartbeat_interval = heartbeat_interval
+        self.machine_ids: List[str] = []  # set by the monitor loop each cycle
+        self.live_members: List[str] = []
+        self._owned: Dict[str, float] = {}  # machine_id -> lease expiry
+        self._new: Set[str] = set()  # acquired since the last take_new()
+        self._busy: Set[str] = set()  # being scanned; not released until the scan ends
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._schema_ready = False
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._schema_ready:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        # Default rollback journal - WAL needs shared memory and does not work on a network share
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        if not self._schema_ready:
+            conn.executescript(_SCHEMA)
+            self._schema_ready = True
+        return conn
+
+    # Membership and rebalancing
+
+    def heartbeat(self):
+        """Renew membership, then take, renew or hand over leases according to the live members"""
+        now = time.time()
+        machine_ids = list(self.machine_ids)
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')  # One instance rebalances at a time
+            conn.execute(
+                'INSERT INTO members VALUES (?, ?, ?, ?) '
+                'ON CONFLICT (instance_id) DO UPDATE SET heartbeat_at = excluded.heartbeat_at',
+                (self.instance_id, socket.gethostname(), now, now)
+            )
+            conn.execute('DELETE FROM members WHERE heartbeat_at < ?', (now - 10 * self.ttl,))
+            live = sorted(row[0] for row in conn.execute(
+                'SELECT instance_id FROM members WHERE heartbeat_at >= ?', (now - self.ttl,)))
+            current = {row[0]: (row[1], row[2]) for row in conn.execute('SELECT machine_id, owner, expires_at FROM leases')}
+
+            with self._lock:
+                busy = set(self._busy)
+            owned: Dict[str, float] = {}
+            for machine_id in machine_ids:
+                owner, expires_at = current.get(machine_id, (None, 0.0))
+                if rendezvous_owner(machine_id, live) == self.instance_id or (machine_id in busy and owner == self.instance_id):
+                    if owner == self.instance_id or owner is None or expires_at < now:
+                        conn.execute(
+                            'INSERT INTO leases VALUES (?, ?, ?, ?) ON CONFLICT (machine_id) DO UPDATE SET '
+                            'owner = excluded.owner, expires_at = excluded.expires_at, '
+                            'acquired_at = CASE WHEN leases.owner = excluded.owner THEN leases.acquired_at ELSE excluded.acquired_at END',
+                            (machine_id, self.instance_id, now, now + self.ttl)
+                        )
+                        owned[machine_id] = now + self.ttl
+                elif owner == self.instance_id:
+                    # Another live instance is the owner now; hand the machine over
+                    conn.execute('DELETE FROM leases WHERE machine_id = ? AND owner = ?', (machine_id, self.instance_id))
+            conn.execute('COMMIT')
+        except Exception:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+
+        with self._lock:
+            gained = set(owned) - set(self._owned)
+            lost = set(self._owned) - set(owned)
+            self._new |= gained
+            self._new -= lost
+            self._owned = owned
+            self.live_members = live
+        LEASES_OWNED.set(len(owned))
+        LIVE_INSTANCES.set(len(live))
+        if gained or lost:
+            print(f"Leases ({self.instance_id}): {len(owned)} machine(s) of {len(machine_ids)}, "
+                  f"{len(live)} live instance(s), +{len(gained)} -{len(lost)}")
+
+    def start(self):
+        """Join and keep heartbeating in a background thread"""
+        self.heartbeat()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._heartbeat_loop, name="monitor-leases", daemon=True)
+            self._thread.start()
+
+    def _heartbeat_loop(self):
+        while not self._stop.wait(self.heartbeat_interval):
+            try:
+                self.heartbeat()
+            except Exception as e:
+                print(f"Warning: Lease heartbeat failed: {e}")
+
+    def leave(self):
+        """Stop heartbeating and release all leases so the other instances take over at once"""
+        self._stop.set()
+        conn = self._connect()
+        try:
+            conn.execute('DELETE FROM leases WHERE owner = ?', (self.instance_id,))
+            conn.execute('DELETE FROM members WHERE instance_id = ?', (self.instance_id,))
+        finally:
+            conn.close()
+        with self._lock:
+            self._owned = {}
+
+    # Scanning
+
+    def holds(self, machine_id: str) -> bool:
+        with self._lock:
+            return self._owned.get(machine_id, 0.0) > time.time()
+
+    def take_new(self) -> Set[str]:
+        """Machines acquired since the last call (their in-memory baseline may be stale)"""
+        with self._lock:
+            new, self._new = self._new, set()
+        return new
+
+    @contextmanager
+    def scanning(self, machine_id: str) -> Iterator[bool]:
+        """Yields True if the lease is held; the lease is then kept until the block ends"""
+        with self._lock:
+            held = self._owned.get(machine_id, 0.0) > time.time()
+            if held:
+                self._busy.add(machine_id)
+        try:
+            yield held
+        finally:
+            with self._lock:
+                self._busy.discard(machine_id)
+
+    def record_scan(self, machine_id: str, taken_at: float):
+        conn = self._connect()
+        try:
+            conn.execute(
+                'INSERT INTO scans VALUES (?, ?, ?) ON CONFLICT (machine_id) DO UPDATE SET '
+                'instance_id = excluded.instance_id, taken_at = excluded.taken_at',
+                (machine_id, self.instance_id, taken_at)
+            )
+        finally:
+            conn.close()
+
+    def last_scan(self, machine_id: str) -> Optional[float]:
+        """Time of the newest scan of the machine by any instance"""
+        conn = self._connect()
+        try:
+            row = conn.execute('SELECT taken_at FROM scans WHERE machine_id = ?', (machine_id,)).fetchone()
+        finally:
+            conn.close()
+        return row[0] if row else None
+
+    def status(self) -> Dict:
+        with self._lock:
+            return {
+                "instance_id": self.instance_id,
+                "live_members": list(self.live_members),
+                "owned": sorted(self._owned),
+                "machines": len(self.machine_ids),
+            }
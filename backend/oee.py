@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+"""
+Incremental OEE per work center and shift.
+
+The fleet snapshot refresher feeds one sample per machine and refresh: the MI status (from
+SQL_CURRENT, as in /api/machine-status), the active order's part number and the AdamBox part
+counter. Each sample adds the time since the previous one to the state the machine was in and
+the counter delta to the shift it falls in, so the engine only keeps running sums per shift and
+never re-reads MI to answer a request.
+
+- Availability: running time / planned time (everything except planned stops and time without data)
+- Performance: ideal cycle time x parts counted by the AdamBox / running time
+- Quality: (producerade - kasserade) / producerade for the shift from the kassationer rollup
+
+Shifts are local Europe/Stockholm times (OEE_SHIFTS). Ideal cycle times come from
+OEE_IDEAL_CYCLE_FILE (per part number, then per work center) with OEE_IDEAL_CYCLE_SECONDS as
+fallback. Running sums are saved to OEE_STATE_DIR, so a restart does not lose the current shift.
+"""
+
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from kassationer_rollup import LOCAL_TZ
+from metrics import REGISTRY
+from wear_analytics import counter_step
+
+OEE_SHIFTS = os.getenv('OEE_SHIFTS', 'Dag=06:00-14:00,Kväll=14:00-22:00,Natt=22:00-06:00')  # local time, name=HH:MM-HH:MM
+OEE_MAX_GAP = float(os.getenv('OEE_MAX_GAP', '120'))  # seconds between samples before the gap counts as without data
+OEE_RETAIN_DAYS = int(os.getenv('OEE_RETAIN_DAYS', '14'))  # shifts kept in memory
+OEE_QUALITY_TTL = float(os.getenv('OEE_QUALITY_TTL', '300'))  # seconds a shift's kassationer lookup is reused
+OEE_SAVE_INTERVAL = float(os.getenv('OEE_SAVE_INTERVAL', '60'))
+OEE_IDEAL_CYCLE_SECONDS = os.getenv('OEE_IDEAL_CYCLE_SECONDS')  # fallback ideal cycle time per part
+OEE_IDEAL_CYCLE_FILE = os.getenv(
+    'OEE_IDEAL_CYCLE_FILE',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'oee_ideal_cycle.json')
+)
+OEE_STATE_DIR = os.getenv(
+    'OEE_STATE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'oee')
+)
+
+# MI status (build_machine_status) -> time category
+STATUS_CATEGORIES = {
+    "Running": "running",
+    "Setup (Running)": "setup",
+    "Setup": "setup",
+    "ShortStop": "short_stop",
+    "Stopped": "stopped",
+    "PlannedStop": "planned_stop",
+}
+CATEGORIES = ("running", "setup", "short_stop", "stopped", "planned_stop", "unknown")
+
+OEE_SAMPLES = REGISTRY.counter("oee_samples_total", "Machine samples folded into the OEE running sums")
+
+
+class Shift(NamedTuple):
+    key: str  # '2024-03-31/Dag' (local date the shift starts)
+    name: str
+    day: str
+    start: float  # unix seconds
+    end: float
+
+
+def parse_shifts(value: str) -> List[Tuple[str, int, int]]:
+    """'Dag=06:00-14:00,...' -> [(name, start_minute, end_minute)]; end <= start runs past midnight"""
+    shifts = []
+    for part in value.split(','):
+        if not part.strip():
+            continue
+        name, _, span = part.partition('=')
+        start, _, end = span.partition('-')
+        minutes = []
+        for clock in (start, end):
+            hours, _, mins = clock.strip().partition(':')
+            minutes.append(int(hours) * 60 + int(mins or 0))
+        shifts.append((name.strip(), minutes[0], minutes[1]))
+    if not shifts:
+        raise ValueError("OEE_SHIFTS defines no shifts")
+    return shifts
+
+
+class ShiftCalendar:
+    def __init__(self, shifts: str = OEE_SHIFTS):
+        self.shifts = parse_shifts(shifts)
+
+    def _instances(self, when: float) -> List[Shift]:
+        """Shifts starting the local day before, on and after `when`"""
+        day = datetime.fromtimestamp(when, LOCAL_TZ).date()
+        result = []
+        for offset in (-1, 0, 1):
+            d = day + timedelta(days=offset)
+            midnight = datetime(d.year, d.month, d.day, tzinfo=LOCAL_TZ)
+            for name, start_min, end_min in self.shifts:
+                end_day = midnight + timedelta(days=1) if end_min <= start_min else midnight
+                # Wall-clock arithmetic, then to UTC: DST days get 23/25 hour shifts where they span the change
+                start = (midnight + timedelta(minutes=start_min)).timestamp()
+                end = (end_day + timedelta(minutes=end_min)).timestamp()
+                result.append(Shift(f"{d.isoformat()}/{name}", name, d.isoformat(), start, end))
+        return sorted(result, key=lambda s: s.start)
+
+    def at(self, when: float) -> Optional[Shift]:
+        for shift in self._instances(when):
+            if shift.start <= when < shift.end:
+                return shift
+        return None
+
+    def next_boundary(self, when: float) -> float:
+        edges = [t for s in self._instances(when) for t in (s.start, s.end) if t > when]
+        return min(edges) if edges else when + 86400
+
+    def between(self, start: float, end: float) -> List[Shift]:
+        """Shifts overlapping [start, end)"""
+        shifts: Dict[str, Shift] = {}
+        t = start
+        while t < end:
+            for shift in self._instances(t):
+                if shift.start < end and shift.end > start:
+                    shifts[shift.key] = shift
+            t += 86400
+        for shift in self._instances(end):
+            if shift.start < end and shift.end > start:
+                shifts[shift.key] = shift
+        return sorted(shifts.values(), key=lambda s: s.start)
+
+
+class IdealCycleTimes:
+    """{"parts": {"<part_number>": seconds}, "work_centers": {"<wc>": seconds}, "default": seconds}, reloaded when the file changes"""
+
+    def __init__(self, path: str = OEE_IDEAL_CYCLE_FILE, default: Optional[str] = OEE_IDEAL_CYCLE_SECONDS):
+        self.path = path
+        self.default = float(default) if default else None
+        self._mtime: Optional[float] = None
+        self._data: Dict = {}
+
+    def _load(self):
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            self._data, self._mtime = {}, None
+            return
+        if mtime != self._mtime:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self._data = json.load(f)
+                self._mtime = mtime
+            except (OSError, ValueError) as e:
+                print(f"Warning: Could not read {self.path}: {e}")
+
+    def get(self, work_center: str, part_number: Optional[str]) -> Optional[float]:
+        self._load()
+        if part_number and part_number in self._data.get('parts', {}):
+            return float(self._data['parts'][part_number])
+        if work_center in self._data.get('work_centers', {}):
+            return float(self._data['work_centers'][work_center])
+        if self._data.get('default') is not None:
+            return float(self._data['default'])
+        return self.default
+
+
+def _new_totals() -> Dict:
+    totals = {category: 0.0 for category in CATEGORIES}
+    totals.update({"parts": 0, "ideal_seconds": 0.0, "parts_without_ideal_cycle": 0, "samples": 0})
+    return totals
+
+
+def _ratio(numerator: float, denominator: float) -> Optional[float]:
+    return round(numerator / denominator, 4) if denominator > 0 else None
+
+
+class OeeEngine:
+    """
+    Running sums per (work center, shift). quality(wc, start, end) returns (producerade, kasserade)
+    for a window, or None if unknown.
+    """
+
+    def __init__(self, quality: Optional[Callable[[str, datetime, datetime], Optional[Tuple[float, float]]]] = None,
+                 calendar: Optional[ShiftCalendar] = None, ideal_cycles: Optional[IdealCycleTimes] = None,
+                 state_dir: str = OEE_STATE_DIR, max_gap: float = OEE_MAX_GAP):
+        self.quality = quality
+        self.calendar = calendar or ShiftCalendar()
+        self.ideal_cycles = ideal_cycles or IdealCycleTimes()
+        self.state_path = os.path.join(state_dir, 'state.json')
+        self.max_gap = max_gap
+        self._totals: Dict[str, Dict[str, Dict]] = {}  # wc -> shift key -> totals
+        self._last: Dict[str, Dict] = {}  # wc -> {"t", "category", "count", "part_number"}
+        self._quality_cache: Dict[Tuple[str, str], Tuple[float, Optional[Tuple[float, float]]]] = {}
+        self._lock = threading.Lock()
+        self._saved_at = time.monotonic()
+        self._dirty = False
+        self._load()
+
+    # Persistence
+
+    def _load(self):
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            self._totals = state.get('totals', {})
+            self._last = state.get('last', {})
+        except (OSError, ValueError):
+            pass
+
+    def save(self):
+        with self._lock:
+            state = json.dumps({"totals": self._totals, "last": self._last})
+            self._dirty = False
+        os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+        tmp_path = f"{self.state_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(state)
+        os.replace(tmp_path, self.state_path)
+        self._saved_at = time.monotonic()
+
+    # Folding in samples
+
+    def record(self, work_center: str, when: float, status: Optional[str], part_number: Optional[str],
+               count: Optional[int]):
+        """One sample: MI status string (None if unavailable), active part number, AdamBox counter (None if unread)"""
+        category = STATUS_CATEGORIES.get(status or '', 'unknown')
+        with self._lock:
+            last = self._last.get(work_center)
+            shifts = self._totals.setdefault(work_center, {})
+            if last is not None and when > last["t"]:
+                # Time since the previous sample belongs to the state seen then, split at shift boundaries
+                gap = when - last["t"]
+                held = last["category"] if gap <= self.max_gap else 'unknown'
+                t = max(last["t"], when - OEE_RETAIN_DAYS * 86400)
+                while t < when:
+                    segment_end = min(when, self.calendar.next_boundary(t))
+                    shift = self.calendar.at(t)
+                    if shift is not None:
+                        shifts.setdefault(shift.key, _new_totals())[held] += segment_end - t
+                    t = segment_end
+
+            shift = self.calendar.at(when)
+            previous_count = last.get("count") if last else None
+            if shift is not None:
+                totals = shifts.setdefault(shift.key, _new_totals())
+                totals["samples"] += 1
+                # Across a 16-bit wrap or a counter reset, as in wear_analytics.monotonic_counter
+                parts = counter_step(previous_count, count) if count is not None and previous_count is not None else 0
+                if parts > 0:
+                    totals["parts"] += parts
+                    ideal = self.ideal_cycles.get(work_center, part_number)
+                    if ideal is None:
+                        totals["parts_without_ideal_cycle"] += parts
+                    else:
+                        totals["ideal_seconds"] += parts * ideal
+
+            self._last[work_center] = {
+                "t": max(when, last["t"]) if last else when,
+                "category": category,
+                "count": count if count is not None else previous_count,
+                "part_number": part_number,
+            }
+            self._dirty = True
+        OEE_SAMPLES.inc()
+
+    def after_refresh(self):
+        """Drop shifts older than OEE_RETAIN_DAYS and save the running sums every OEE_SAVE_INTERVAL seconds"""
+        cutoff = (datetime.now(LOCAL_TZ) - timedelta(days=OEE_RETAIN_DAYS)).date().isoformat()
+        with self._lock:
+            for shifts in self._totals.values():
+                for key in [k for k in shifts if k.split('/')[0] < cutoff]:
+                    del shifts[key]
+            now = time.monotonic()
+            for key in [k for k, (at, _) in self._quality_cache.items()
+                        if k[1].split('/')[0] < cutoff or now - at >= OEE_QUALITY_TTL]:
+                del self._quality_cache[key]
+            due = self._dirty and time.monotonic() - self._saved_at >= OEE_SAVE_INTERVAL
+        if due:
+            try:
+                self.save()
+            except OSError as e:
+                print(f"Warning: Could not save OEE state: {e}")
+
+    # Reading
+
+    def _quality(self, work_center: str, shift: Shift) -> Optional[Tuple[float, float]]:
+        if self.quality is None:
+            return None
+        key = (work_center, shift.key)
+        with self._lock:
+            cached = self._quality_cache.get(key)
+        if cached is not None and time.monotonic() - cached[0] < OEE_QUALITY_TTL:
+            return cached[1]
+        # The kassationer lookup runs without the lock, so samples are not held up by MI
+        try:
+            value = self.quality(work_center,
+                                 datetime.fromtimestamp(shift.start, timezone.utc),
+                                 datetime.fromtimestamp(shift.end, timezone.utc))
+        except Exception as e:
+            print(f"Warning: Could not read kassationer for OEE ({work_center} {shift.key}): {e}")
+            value = None
+        with self._lock:
+            self._quality_cache[key] = (time.monotonic(), value)
+        return value
+
+    def shift_report(self, work_center: str, shift: Shift) -> Optional[Dict]:
+        with self._lock:
+            totals = dict(self._totals.get(work_center, {}).get(shift.key) or {})
+        if not totals:
+            return None
+        seconds = {category: round(totals[category], 1) for category in CATEGORIES}
+        planned = totals["running"] + totals["setup"] + totals["short_stop"] + totals["stopped"]
+        availability = _ratio(totals["running"], planned)
+        performance = None
+        if totals["parts_without_ideal_cycle"] == 0 and totals["parts"] > 0:
+            performance = _ratio(totals["ideal_seconds"], totals["running"])
+        produced = self._quality(work_center, shift)
+        producerade, kasserade = produced if produced else (None, None)
+        quality = _ratio(producerade - kasserade, producerade) if producerade else None
+        oee = None
+        if None not in (availability, performance, quality):
+            oee = round(availability * performance * quality, 4)
+        return {
+            "work_center": work_center,
+            "shift": shift.name,
+            "date": shift.day,
+            "start": datetime.fromtimestamp(shift.start, LOCAL_TZ).isoformat(),
+            "end": datetime.fromtimestamp(shift.end, LOCAL_TZ).isoformat(),
+            "in_progress": shift.start <= time.time() < shift.end,
+            "seconds": seconds,
+            "planned_seconds": round(planned, 1),
+            "parts": totals["parts"],
+            "ideal_seconds": round(totals["ideal_seconds"], 1),
+            "parts_without_ideal_cycle": totals["parts_without_ideal_cycle"],
+            "producerade": producerade,
+            "kasserade": kasserade,
+            "availability": availability,
+            "performance": performance,
+            "quality": quality,
+            "oee": oee,
+        }
+
+    def work_centers(self) -> List[str]:
+        with self._lock:
+            return sorted(self._totals)
+
+    def report(self, work_centers: Optional[List[str]], start: float, end: float) -> List[Dict]:
+        """Shift reports for shifts overlapping [start, end), oldest first per work center"""
+        shifts = self.calendar.between(start, end)
+        result = []
+        for wc in work_centers or self.work_centers():
+            for shift in shifts:
+                entry = self.shift_report(wc, shift)
+                if entry is not None:
+                    result.append(entry)
+        return result
+
+    def current_shift(self) -> Optional[Shift]:
+        return self.calendar.at(time.time())
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Local read-through cache for Supabase reference tables (maskiner, verktyg).
+Shared by app.py and compensation_monitor.py via a snapshot directory on disk.
+"""
+
+import os
+import json
+import time
+import threading
+from typing import Callable, Dict, List, Optional
+
+REFERENCE_CACHE_DIR = os.getenv(
+    'REFERENCE_CACHE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'reference')
+)
+REFERENCE_CACHE_TTL = int(os.getenv('REFERENCE_CACHE_TTL', '900'))  # 15 minutes default
+# maxgräns is edited in the UI straight against Supabase; the UI invalidates the cache after saving,
+# this shorter TTL bounds how long an edit made elsewhere (e.g. the Supabase dashboard) goes unseen
+REFERENCE_CACHE_TOOLS_TTL = int(os.getenv('REFERENCE_CACHE_TOOLS_TTL', '120'))
+SUPPRESS_RECURRING_LOGS = os.getenv('SUPPRESS_RECURRING_LOGS', 'false').lower() == 'true'
+
+MACHINES_TABLE = 'verktygshanteringssystem_maskiner'
+TOOLS_TABLE = 'verktygshanteringssystem_verktyg'
+
+# Columns cached per table - union of what app.py and compensation_monitor.py need
+REFERENCE_TABLES = {
+    MACHINES_TABLE: 'id, maskiner_nummer, maskin_namn, ip_focas, ip_adambox',
+    TOOLS_TABLE: 'id, plats, benämning, maxgräns, maxgräns_varning',
+}
+
+# Local stand-in for a Supabase realtime change feed: {table: version}.
+# Any process that knows a table changed bumps the version; readers compare it
+# against the version their snapshot was fetched at.
+CHANGE_FEED_FILE = 'changes.json'
+
+
+class ReferenceCache:
+    """TTL cache with disk snapshots and explicit invalidation for reference tables"""
+
+    def __init__(self, client_getter: Callable[[], object],
+                 cache_dir: str = REFERENCE_CACHE_DIR, ttl: int = REFERENCE_CACHE_TTL):
+        self._client_getter = client_getter
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.ttls = {TOOLS_TABLE: min(ttl, REFERENCE_CACHE_TOOLS_TTL)}
+        self._entries: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._fetch_locks = {table: threading.Lock() for table in REFERENCE_TABLES}
+        self._feed_mtime = None
+        self._feed: Dict[str, int] = {}
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "fetches": 0, "stale_fallbacks": 0}
+
+    # Change feed
+
+    def _feed_path(self) -> str:
+        return os.path.join(self.cache_dir, CHANGE_FEED_FILE)
+
+    def _snapshot_path(self, table: str) -> str:
+        return os.path.join(self.cache_dir, f"{table}.json")
+
+    def _read_feed(self) -> Dict[str, int]:
+        """Read change feed versions, re-parsing the file only when its mtime changes"""
+        try:
+            mtime = os.stat(self._feed_path()).st_mtime_ns
+        except OSError:
+            self._feed_mtime = None
+            self._feed = {}
+            return self._feed
+
+        if mtime != self._feed_mtime:
+            try:
+                with open(self._feed_path(), 'r', encoding='utf-8') as f:
+                    self._feed = {k: int(v) for k, v in json.load(f).items()}
+                self._feed_mtime = mtime
+            except (OSError, ValueError):
+                # Half-written by another process; keep previous view and retry next call
+                pass
+        return self._feed
+
+    def _write_json(self, path: str, payload: Dict):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(payload, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def notify_change(self, table: Optional[str] = None):
+        """Publish a change for one table (or all) so every process drops its copy"""
+        tables = [table] if table else list(REFERENCE_TABLES)
+        with self._lock:
+            feed = dict(self._read_feed())
+            version = time.time_ns()
+            for t in tables:
+                feed[t] = version
+                self._entries.pop(t, None)
+            try:
+                self._write_json(self._feed_path(), feed)
+            except OSError as e:
+                print(f"Warning: Could not write reference cache change feed: {e}")
+
+    invalidate = notify_change
+
+    # Snapshots
+
+    def _is_fresh(self, entry: Optional[Dict], feed_version: int) -> bool:
+        if not entry:
+            return False
+        if entry.get('feed_version', 0) < feed_version:
+            return False
+        ttl = self.ttls.get(entry.get('table'), self.ttl)
+        return (time.time() - entry.get('fetched_at', 0)) < ttl
+
+    def _load_snapshot(self, table: str) -> Optional[Dict]:
+        try:
+            with open(self._snapshot_path(table), 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            if isinstance(entry.get('rows'), list):
+                return entry
+        except (OSError, ValueError):
+            pass
+        return None
+
+    def _fetch(self, table: str, feed_version: int) -> Dict:
+        client = self._client_getter()
+        if client is None:
+            raise RuntimeError("Supabase client not available")
+        response = client.table(table).select(REFERENCE_TABLES[table]).execute()
+        entry = {
+            'table': table,
+            'fetched_at': time.time(),
+            'feed_version': feed_version,
+            'rows': response.data or [],
+        }
+        self.stats["fetches"] += 1
+        try:
+            self._write_json(self._snapshot_path(table), entry)
+        except OSError as e:
+            print(f"Warning: Could not write reference cache snapshot for {table}: {e}")
+        return entry
+
+    def get(self, table: str) -> List[Dict]:
+        """Return cached rows for a reference table, fetching from Supabase only when stale"""
+        if table not in REFERENCE_TABLES:
+            raise KeyError(f"Not a cached reference table: {table}")
+
+        entry, snapshot, feed_version = self._lookup(table)
+        if entry is not None:
+            return entry['rows']
+        stale = self._entries.get(table) or snapshot
+
+        # The Supabase round trip runs outside self._lock, so reads of other tables (and of
+        # this one, while a stale copy exists) are not held up by it. One fetch per table at a time.
+        fetch_lock = self._fetch_locks[table]
+        if not fetch_lock.acquire(blocking=stale is None):
+            self.stats["stale_fallbacks"] += 1
+            return stale['rows']
+        try:
+            # The fetch we waited for may already have refreshed the table
+            entry, snapshot, feed_version = self._lookup(table)
+            if entry is not None:
+                return entry['rows']
+            try:
+                entry = self._fetch(table, feed_version)
+            except Exception as e:
+                # Serve stale data rather than nothing while Supabase is unreachable
+                if stale:
+                    self.stats["stale_fallbacks"] += 1
+                    if not SUPPRESS_RECURRING_LOGS:
+                        print(f"Warning: Using stale reference cache for {table}: {e}")
+                    return stale['rows']
+                raise
+            with self._lock:
+                # An invalidation published during the fetch wins; the next read fetches again
+                if self._read_feed().get(table, 0) == feed_version:
+                    self._entries[table] = entry
+            return entry['rows']
+        finally:
+            fetch_lock.release()
+
+    def _lookup(self, table: str):
+        """(fresh entry or None, disk snapshot, feed version) for a table"""
+        with self._lock:
+            feed_version = self._read_feed().get(table, 0)
+
+            entry = self._entries.get(table)
+            if self._is_fresh(entry, feed_version):
+                self.stats["memory_hits"] += 1
+                return entry, None, feed_version
+
+            # Another process (or our previous run) may already have a fresh snapshot
+            snapshot = self._load_snapshot(table)
+            if self._is_fresh(snapshot, feed_version):
+                self._entries[table] = snapshot
+                self.stats["disk_hits"] += 1
+                return snapshot, snapshot, feed_version
+            return None, snapshot, feed_version
+
+    def get_machines(self) -> List[Dict]:
+        return self.get(MACHINES_TABLE)
+
+    def get_tools(self) -> List[Dict]:
+        return self.get(TOOLS_TABLE)
+
+    def status(self) -> Dict:
+        """Cache state per table for the status endpoint"""
+        with self._lock:
+            feed = self._read_feed()
+            tables = {}
+            for table in REFERENCE_TABLES:
+                entry = self._entries.get(table)
+                tables[table] = {
+                    "cached_rows": len(entry['rows']) if entry else None,
+                    "age_seconds": round(time.time() - entry['fetched_at'], 1) if entry else None,
+                    "fresh": self._is_fresh(entry, feed.get(table, 0)),
+                }
+            return {
+                "ttl_seconds": self.ttl,
+                "table_ttl_seconds": dict(self.ttls),
+                "cache_dir": self.cache_dir,
+                "tables": tables,
+                "stats": dict(self.stats),
+            }
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+JSON encoding and response compression shared by the Flask app and the async front end.
+
+- FastJSONProvider: Flask JSON provider backed by orjson when installed (JSON_ENCODER=orjson|std),
+  with Decimal, datetime/date/time and UUID handled by the encoder instead of per-value conversion
+- ResponseEncoder: negotiated br/gzip compression (Accept-Encoding) for bodies above
+  COMPRESS_MIN_BYTES, usable one-shot or per chunk for streamed responses
+"""
+
+import os
+import re
+import json
+import gzip
+import zlib
+import uuid
+import decimal
+from datetime import date, datetime, time as dt_time
+from typing import Any, Optional
+
+from flask import request
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # Optional - falls back to the standard library encoder
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # Optional - gzip only without it
+    brotli = None
+
+JSON_ENCODER = os.getenv('JSON_ENCODER', 'orjson' if orjson else 'std')  # orjson or std
+COMPRESS_MIN_BYTES = int(os.getenv('COMPRESS_MIN_BYTES', '1024'))  # smaller bodies are sent as is
+COMPRESS_ENABLED = os.getenv('COMPRESS_ENABLED', 'true').lower() == 'true'
+GZIP_LEVEL = int(os.getenv('GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.getenv('BROTLI_QUALITY', '5'))  # 5 compresses close to 11 at a fraction of the CPU
+
+# Already compressed or not worth compressing
+_INCOMPRESSIBLE = ('image/', 'video/', 'audio/', 'application/zip', 'application/gzip', 'application/octet-stream')
+
+
+def json_default(value: Any):
+    """Types pyodbc and Supabase hand us that the encoders do not know"""
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date, dt_time)):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return bytes(value).decode('utf-8', errors='replace')
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps_bytes(value: Any) -> bytes:
+    """Compact UTF-8 JSON"""
+    if JSON_ENCODER == 'orjson' and orjson is not None:
+        # OPT_PASSTHROUGH_DATETIME keeps datetime output identical to isoformat() in json_default
+        return orjson.dumps(value, default=json_default,
+                            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(value, default=json_default, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """app.json provider; jsonify() output is compact, key order is kept"""
+
+    sort_keys = False
+    compact = True
+
+    def dumps(self, obj: Any, **kwargs) -> str:
+        if kwargs:
+            return json.dumps(obj, default=json_default, **kwargs)
+        return dumps_bytes(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs) -> Any:
+        if JSON_ENCODER == 'orjson' and orjson is not None and not kwargs:
+            return orjson.loads(s)
+        return json.loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps_bytes(obj) + b'\n', mimetype=self.mimetype)
+
+
+def _accepted(accept_encoding: str, coding: str) -> bool:
+    """True if coding is listed in Accept-Encoding with a non-zero q value"""
+    for part in (accept_encoding or '').lower().split(','):
+        name, _, params = part.strip().partition(';')
+        if name.strip() == coding:
+            m = re.search(r'q=([0-9.]+)', params)
+            return not m or float(m.group(1)) > 0
+    return False
+
+
+def negotiate(accept_encoding: str) -> Optional[str]:
+    """Preferred content coding we can produce for the client: br, gzip or None"""
+    if not COMPRESS_ENABLED:
+        return None
+    if brotli is not None and _accepted(accept_encoding, 'br'):
+        return 'br'
+    if _accepted(accept_encoding, 'gzip'):
+        return 'gzip'
+    return None
+
+
+def compressible(content_type: str, length: Optional[int]) -> bool:
+    content_type = (content_type or '').lower()
+    if any(content_type.startswith(t) for t in _INCOMPRESSIBLE):
+        return False
+    return length is None or length >= COMPRESS_MIN_BYTES
+
+
+def compress(data: bytes, coding: str) -> bytes:
+    """One-shot compression of a complete body"""
+    if coding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+class ResponseEncoder:
+    """Incremental br/gzip encoder for streamed bodies; every chunk is flushed so clients see it at once"""
+
+    def __init__(self, coding: str):
+        self.coding = coding
+        if coding == 'br':
+            self._br = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self._z = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # gzip container
+
+    def chunk(self, data: bytes) -> bytes:
+        if self.coding == 'br':
+            return self._br.process(data) + self._br.flush()
+        return self._z.compress(data) + self._z.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self.coding == 'br':
+            return self._br.finish()
+        return self._z.flush(zlib.Z_FINISH)
+
+
+def install(app):
+    """Use FastJSONProvider for jsonify() and compress eligible Flask responses"""
+    app.json_provider_class = FastJSONProvider
+    app.json = FastJSONProvider(app)
+
+    @app.after_request
+    def compress_response(response):
+        if response.direct_passthrough or response.is_streamed or 'Content-Encoding' in response.headers \
+                or response.status_code < 200 or response.status_code in (204, 304):
+            return response
+        response.vary.add('Accept-Encoding')
+        coding = negotiate(request.headers.get('Accept-Encoding', ''))
+        if coding is None or not compressible(response.mimetype, response.content_length):
+            return response
+        response.set_data(compress(response.get_data(), coding))
+        response.headers['Content-Encoding'] = coding
+        return response
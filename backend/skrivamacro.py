@@ -1,12 +1,35 @@
 #!/usr/bin/env python3
 """
 Skript för att skriva macro-variabler till Fanuc CNC via FocasService.
-Användning: python skrivamacro.py
+
+Utan argument skrivs MACRO_VALUE till #700 på 192.168.3.105 (som tidigare). Med en CSV- eller
+JSON-fil skrivs en lista med (ip, macro_number, value, dec) till flera maskiner: skrivningarna
+grupperas per CNC, maskinerna körs parallellt (högst --parallel åt gången) och varje maskin
+skrivs i en egen session i FocasService (POST /api/focas/sessions/{ip}/write-macros).
+
+Användning:
+    python skrivamacro.py
+    python skrivamacro.py skrivningar.csv --dry-run
+    python skrivamacro.py skrivningar.csv --parallel 8 --retries 2 --json resultat.json
+
+CSV: rubrikrad ip,macro_number,value,dec (dec är valfri). JSON: lista med objekt med samma nycklar.
+value är heltalet som skrivs och dec antalet decimaler (value 125 med dec 1 ger 12.5);
+utan dec får value anges med decimaler ("12.5").
 """
 
-import requests
-import sys
 import os
+import sys
+import csv
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from decimal import Decimal, InvalidOperation
+from statistics import median
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import requests
 
 # Konfiguration
 FOCAS_SERVICE_URL = os.getenv('FOCAS_SERVICE_URL', 'http://localhost:5999')
@@ -15,111 +38,286 @@ CNC_PORT = 8193
 MACRO_NUMBER = 700
 MACRO_VALUE = int(os.getenv('MACRO_VALUE', '1'))  # Läs från miljövariabel, default 1
 MACRO_DEC_VAL = 0  # Antal decimaler (0 för heltal)
+MACRO_WRITE_PARALLEL = int(os.getenv('MACRO_WRITE_PARALLEL', '8'))  # Max antal maskiner som skrivs samtidigt
+MACRO_WRITE_RETRIES = int(os.getenv('MACRO_WRITE_RETRIES', '2'))  # Omförsök per maskin efter första försöket
+MACRO_WRITE_TIMEOUT = float(os.getenv('MACRO_WRITE_TIMEOUT', '30'))  # Sekunder per maskin och försök
+
+print_lock = threading.Lock()
+# Äldre FocasService utan sessioner har ett enda globalt handtag - då skrivs en maskin i taget
+legacy_lock = threading.Lock()
+
+
+class MacroWrite(NamedTuple):
+    ip: str
+    number: int
+    mcr_val: int
+    dec_val: int
+    source: str  # Rad i indatafilen, för felmeddelanden
+
+
+def parse_value(value, dec) -> Tuple[int, int]:
+    """(mcrVal, decVal) från value och dec; utan dec räknas decimalerna från value"""
+    if dec not in (None, ''):
+        dec_val = int(dec)
+        mcr_val = int(str(value).strip())
+    else:
+        try:
+            number = Decimal(str(value).strip())
+        except InvalidOperation:
+            raise ValueError(f"value är inte ett tal: {value!r}")
+        dec_val = max(0, -number.normalize().as_tuple().exponent)
+        mcr_val = int(number.scaleb(dec_val))
+    if not 0 <= dec_val <= 8:
+        raise ValueError(f"dec måste vara 0-8: {dec_val}")
+    if not -2 ** 31 <= mcr_val < 2 ** 31:
+        raise ValueError(f"value ryms inte i 32 bitar: {mcr_val}")
+    return mcr_val, dec_val
 
-def connect_to_cnc(ip_address, port):
-    """Anslut till CNC-maskin via FocasService"""
+
+def parse_write(item: Dict, source: str) -> MacroWrite:
     try:
-        response = requests.post(
-            f"{FOCAS_SERVICE_URL}/api/focas/connect",
-            json={"ipAddress": ip_address, "port": port},
-            timeout=10
-        )
-        
-        if not response.ok:
-            print(f"Fel vid anslutning: HTTP {response.status_code}")
-            print(f"Svar: {response.text}")
-            return False
-        
-        data = response.json()
-        if not data.get("success"):
-            print(f"Kunde inte ansluta till CNC: {data.get('error', 'Okänt fel')}")
-            return False
-        
-        print(f"✓ Ansluten till CNC {ip_address}:{port}")
-        return True
-    except requests.exceptions.ConnectionError:
-        print(f"Fel: Kunde inte ansluta till FocasService på {FOCAS_SERVICE_URL}")
-        print("Kontrollera att FocasService körs.")
-        return False
-    except Exception as e:
-        print(f"Fel vid anslutning: {e}")
-        return False
-
-def write_macro(number, mcr_val, dec_val=0):
-    """Skriv macro-variabel till CNC"""
+        ip = str(item.get('ip') or '').strip()
+        if not ip:
+            raise ValueError("ip saknas")
+        number = int(str(item.get('macro_number')).strip())
+        if not 1 <= number <= 32767:
+            raise ValueError(f"macro_number måste vara 1-32767: {number}")
+        if item.get('value') in (None, ''):
+            raise ValueError("value saknas")
+        mcr_val, dec_val = parse_value(item['value'], item.get('dec'))
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"{source}: {e}")
+    return MacroWrite(ip, number, mcr_val, dec_val, source)
+
+
+def load_writes(path: str) -> List[MacroWrite]:
+    """Läs skrivningar från en CSV- eller JSON-fil"""
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        if path.lower().endswith('.json'):
+            items = json.load(f)
+            if not isinstance(items, list):
+                raise ValueError(f"{path}: JSON-filen ska innehålla en lista")
+            return [parse_write(item, f"{path}[{i}]") for i, item in enumerate(items)]
+        reader = csv.DictReader(f)
+        # Rad 1 är rubrikraden
+        return [parse_write(row, f"{path}:{line}") for line, row in enumerate(reader, start=2)
+                if any((v or '').strip() for v in row.values())]
+
+
+def format_value(write: MacroWrite) -> str:
+    return f"{write.mcr_val / 10 ** write.dec_val:.{write.dec_val}f}"
+
+
+def is_retryable(result: Dict) -> bool:
+    # Negativa FOCAS-felkoder är kommunikations-/systemfel (EW_SOCKET, EW_HANDLE, EW_BUSY ...);
+    # positiva (EW_NUMBER, EW_DATA ...) beror på själva skrivningen och blir inte bättre av ett nytt försök
+    return result.get('error_code') is None or result['error_code'] < 0
+
+
+def response_json(response: requests.Response) -> Dict:
+    # FocasService svarar med JSON även vid fel (t.ex. 400 från connect)
     try:
-        response = requests.post(
-            f"{FOCAS_SERVICE_URL}/api/focas/write-macro",
-            json={
-                "number": number,
-                "mcrVal": mcr_val,
-                "decVal": dec_val
-            },
-            timeout=10
-        )
-        
-        if not response.ok:
-            print(f"Fel vid skrivning: HTTP {response.status_code}")
-            print(f"Svar: {response.text}")
-            return False
-        
         data = response.json()
-        if data.get("success"):
-            print(f"✓ Macro-variabel #{number} satt till {mcr_val}")
-            if dec_val != 0:
-                print(f"  (Decimaler: {dec_val})")
-            return True
+    except ValueError:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def write_session(session: requests.Session, ip: str, writes: List[MacroWrite], timeout: float) -> Optional[List[Dict]]:
+    """Skriv alla macro-variabler till en maskin i en egen session; None om FocasService saknar sessioner"""
+    response = session.post(
+        f"{FOCAS_SERVICE_URL}/api/focas/sessions/{ip}/write-macros",
+        json={"port": CNC_PORT, "writes": [
+            {"number": w.number, "mcrVal": w.mcr_val, "decVal": w.dec_val} for w in writes
+        ]},
+        timeout=timeout
+    )
+    if response.status_code == 404:
+        return None
+    if not response.ok:
+        return [{"error": f"HTTP {response.status_code}: {response.text[:200]}", "error_code": None}] * len(writes)
+
+    data = response_json(response)
+    items = data.get('data') or []
+    results = []
+    for i, write in enumerate(writes):
+        if i < len(items):
+            item = items[i]
+            results.append({
+                "success": bool(item.get('success')),
+                "error": item.get('error'),
+                "error_code": item.get('errorCode') if not item.get('success') else 0,
+                "elapsed_ms": round(item.get('elapsedMs') or 0, 1),
+            })
         else:
-            error_msg = data.get('error', 'Okänt fel')
-            error_code = data.get('errorCode', '')
-            print(f"✗ Kunde inte skriva macro-variabel: {error_msg}")
-            if error_code:
-                print(f"  Felkod: {error_code}")
-            return False
-    except Exception as e:
-        print(f"Fel vid skrivning: {e}")
-        return False
-
-def disconnect():
-    """Koppla från CNC"""
-    try:
-        response = requests.post(
-            f"{FOCAS_SERVICE_URL}/api/focas/disconnect",
-            timeout=5
-        )
-        if response.ok:
-            print("✓ Frånkopplad från CNC")
-    except:
-        pass  # Ignorera disconnect-fel
+            # Anslutningen misslyckades, eller avbröts innan den här skrivningen
+            results.append({"error": data.get('error') or 'Inte skriven', "error_code": data.get('errorCode')})
+    return results
+
+
+def write_legacy(session: requests.Session, ip: str, writes: List[MacroWrite], timeout: float) -> List[Dict]:
+    """connect / write-macro / disconnect mot FocasService utan sessioner"""
+    with legacy_lock:
+        response = session.post(f"{FOCAS_SERVICE_URL}/api/focas/connect",
+                                json={"ipAddress": ip, "port": CNC_PORT}, timeout=timeout)
+        data = response_json(response)
+        if not data.get('success'):
+            error = data.get('error') or f"HTTP {response.status_code}: {response.text[:200]}"
+            return [{"error": f"Kunde inte ansluta: {error}", "error_code": data.get('errorCode')}] * len(writes)
+        try:
+            results = []
+            for write in writes:
+                started = time.perf_counter()
+                response = session.post(f"{FOCAS_SERVICE_URL}/api/focas/write-macro", json={
+                    "number": write.number, "mcrVal": write.mcr_val, "decVal": write.dec_val
+                }, timeout=timeout)
+                data = response_json(response)
+                results.append({
+                    "success": bool(data.get('success')),
+                    "error": data.get('error') or (None if response.ok else f"HTTP {response.status_code}"),
+                    "error_code": data.get('errorCode', 0) if response.ok else None,
+                    "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+                })
+            return results
+        finally:
+            try:
+                session.post(f"{FOCAS_SERVICE_URL}/api/focas/disconnect", timeout=5)
+            except requests.exceptions.RequestException:
+                pass  # Ignorera disconnect-fel
+
+
+def write_machine(ip: str, writes: List[MacroWrite], retries: int, retry_delay: float, timeout: float) -> Dict:
+    """Skriv en maskins macro-variabler med omförsök för de skrivningar som misslyckades av kommunikationsfel"""
+    started = time.perf_counter()
+    results: Dict[int, Dict] = {}
+    pending = list(range(len(writes)))
+    legacy = False
+    with requests.Session() as session:
+        for attempt in range(1, retries + 2):
+            if attempt > 1:
+                time.sleep(retry_delay * (attempt - 1))
+            batch = [writes[i] for i in pending]
+            try:
+                outcome = None if legacy else write_session(session, ip, batch, timeout)
+                if outcome is None:
+                    legacy = True
+                    outcome = write_legacy(session, ip, batch, timeout)
+            except requests.exceptions.RequestException as e:
+                outcome = [{"error": f"{type(e).__name__}: {e}", "error_code": None}] * len(batch)
+            for i, result in zip(pending, outcome):
+                results[i] = {"success": False, **result, "attempts": attempt}
+            pending = [i for i in pending if not results[i]['success'] and is_retryable(results[i])]
+            if not pending:
+                break
+    return {
+        "ip": ip,
+        "results": [results[i] for i in range(len(writes))],
+        "elapsed_s": round(time.perf_counter() - started, 3),
+        "legacy": legacy,
+    }
+
+
+def print_plan(by_ip: Dict[str, List[MacroWrite]]):
+    for ip, writes in by_ip.items():
+        print(f"{ip}:")
+        for w in writes:
+            print(f"  #{w.number} = {format_value(w)}  (mcrVal {w.mcr_val}, decVal {w.dec_val})")
+
+
+def print_machine(machine: Dict, writes: List[MacroWrite]):
+    with print_lock:
+        print(f"{machine['ip']} ({machine['elapsed_s']:.2f} s{', utan sessioner' if machine['legacy'] else ''}):")
+        for w, r in zip(writes, machine['results']):
+            retry = f", försök {r['attempts']}" if r['attempts'] > 1 else ''
+            if r['success']:
+                print(f"  ✓ #{w.number} = {format_value(w)} ({r.get('elapsed_ms', 0):.0f} ms{retry})")
+            else:
+                code = f" (felkod {r['error_code']})" if r.get('error_code') not in (None, 0) else ''
+                print(f"  ✗ #{w.number} = {format_value(w)}: {r.get('error') or 'Okänt fel'}{code}{retry}")
+
 
 def main():
     """Huvudfunktion"""
+    parser = argparse.ArgumentParser(description="Skriv macro-variabler till en eller flera Fanuc CNC via FocasService")
+    parser.add_argument('file', nargs='?', help='CSV- eller JSON-fil med ip, macro_number, value, dec '
+                                               f'(utan fil: #{MACRO_NUMBER} = MACRO_VALUE på {CNC_IP})')
+    parser.add_argument('--parallel', type=int, default=MACRO_WRITE_PARALLEL, help='Max antal maskiner samtidigt')
+    parser.add_argument('--retries', type=int, default=MACRO_WRITE_RETRIES, help='Omförsök vid kommunikationsfel')
+    parser.add_argument('--retry-delay', type=float, default=2.0, help='Sekunder före första omförsöket (ökar per försök)')
+    parser.add_argument('--timeout', type=float, default=MACRO_WRITE_TIMEOUT, help='Sekunder per maskin och försök')
+    parser.add_argument('--dry-run', action='store_true', help='Visa vad som skulle skrivas utan att ansluta')
+    parser.add_argument('--json', dest='json_path', help='Skriv resultatet per skrivning till den här filen')
+    args = parser.parse_args()
+
+    if args.file:
+        try:
+            writes = load_writes(args.file)
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+    else:
+        writes = [MacroWrite(CNC_IP, MACRO_NUMBER, MACRO_VALUE, MACRO_DEC_VAL, 'MACRO_VALUE')]
+    if not writes:
+        parser.error("Inga skrivningar")
+
+    by_ip: Dict[str, List[MacroWrite]] = {}
+    for w in writes:
+        by_ip.setdefault(w.ip, []).append(w)
+
     print("=" * 60)
-    print("Skriv Macro-variabel till Fanuc CNC")
+    print("Skriv Macro-variabler till Fanuc CNC")
     print("=" * 60)
     print(f"FocasService: {FOCAS_SERVICE_URL}")
-    print(f"CNC IP: {CNC_IP}:{CNC_PORT}")
-    print(f"Macro-variabel: #{MACRO_NUMBER}")
-    print(f"Värde: {MACRO_VALUE}")
+    print(f"Skrivningar: {len(writes)} till {len(by_ip)} maskin(er), högst {args.parallel} samtidigt")
     print("=" * 60)
     print()
-    
-    # Anslut till CNC
-    if not connect_to_cnc(CNC_IP, CNC_PORT):
-        sys.exit(1)
-    
-    try:
-        # Skriv macro-variabel
-        if not write_macro(MACRO_NUMBER, MACRO_VALUE, MACRO_DEC_VAL):
-            sys.exit(1)
-        
+
+    if args.dry_run:
+        print_plan(by_ip)
         print()
-        print("✓ Klart!")
-        
-    finally:
-        # Koppla från
-        disconnect()
+        print("Torrkörning - inget skrevs.")
+        return
+
+    started = time.perf_counter()
+    machines = []
+    with ThreadPoolExecutor(max_workers=max(1, args.parallel)) as pool:
+        futures = {
+            pool.submit(write_machine, ip, machine_writes, args.retries, args.retry_delay, args.timeout): ip
+            for ip, machine_writes in by_ip.items()
+        }
+        for future in as_completed(futures):
+            machine = future.result()
+            print_machine(machine, by_ip[machine['ip']])
+            machines.append(machine)
+    elapsed = time.perf_counter() - started
+
+    results = [r for m in machines for r in m['results']]
+    ok = sum(1 for r in results if r['success'])
+    retried = sum(1 for r in results if r['attempts'] > 1)
+    durations = [m['elapsed_s'] for m in machines]
+    failed_machines = sum(1 for m in machines if not all(r['success'] for r in m['results']))
+    print()
+    print("=" * 60)
+    print(f"Skrivningar: {ok} ok, {len(results) - ok} fel ({retried} med omförsök)")
+    print(f"Maskiner: {len(machines) - failed_machines} ok, {failed_machines} med fel")
+    print(f"Tid: {elapsed:.2f} s totalt, per maskin median {median(durations):.2f} s, max {max(durations):.2f} s")
+    print("=" * 60)
+
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                "elapsed_s": round(elapsed, 3),
+                "writes": [
+                    {"ip": w.ip, "macro_number": w.number, "value": format_value(w), "mcr_val": w.mcr_val,
+                     "dec": w.dec_val, "source": w.source, **r}
+                    for m in machines for w, r in zip(by_ip[m['ip']], m['results'])
+                ],
+                "machines": [{"ip": m['ip'], "elapsed_s": m['elapsed_s'], "legacy": m['legacy']} for m in machines],
+            }, f, indent=2, ensure_ascii=False)
+        print(f"Resultat sparat i {args.json_path}")
+
+    if ok < len(results):
+        sys.exit(1)
+
 
 if __name__ == "__main__":
     main()
-
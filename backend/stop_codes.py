@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+Stop-code downtime from MI work_log_item in a local SQLite store.
+
+The ingest job (app.py: background_stop_codes) reads work_log_item rows after a high-water mark
+on report_time, for all work centers in one query. A row's indirect_code holds until the next row
+of the same work center, so each change of code closes an interval: intervals with a code are
+stored in stop_intervals (the timeline), and their durations are summed per work center,
+Europe/Stockholm day and code in stop_daily (the Pareto). The interval still open per work center
+is kept in stop_open, so the next run continues where the previous one stopped.
+
+Rows are read up to STOP_CODES_SETTLE_SECONDS before now, so rows with the same report_time are
+never split between runs; rows reported later than that with an older report_time are only
+picked up by a rebuild.
+The job runs on the instance holding the 'stop-codes' leader lease; the others read the same
+database, so STOP_CODES_DIR must be shared between them.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from kassationer_rollup import LOCAL_TZ
+
+STOP_CODES_DIR = os.getenv(
+    'STOP_CODES_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'stop_codes')
+)
+STOP_CODES_JOURNAL_MODE = os.getenv('STOP_CODES_JOURNAL_MODE', 'WAL')  # DELETE when STOP_CODES_DIR is on a network share
+STOP_CODES_INTERVAL = int(os.getenv('STOP_CODES_INTERVAL', '120'))  # seconds between ingest runs
+STOP_CODES_BACKFILL_DAYS = int(os.getenv('STOP_CODES_BACKFILL_DAYS', '90'))  # history read on first run
+STOP_CODES_CHUNK_DAYS = int(os.getenv('STOP_CODES_CHUNK_DAYS', '7'))  # MI window per query
+STOP_CODES_SETTLE_SECONDS = int(os.getenv('STOP_CODES_SETTLE_SECONDS', '120'))  # newest rows left for the next run
+STOP_CODES_FETCH_SIZE = int(os.getenv('STOP_CODES_FETCH_SIZE', '5000'))  # rows per fetchmany
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS stop_intervals (
+    work_center TEXT NOT NULL,
+    start_utc REAL NOT NULL,
+    end_utc REAL NOT NULL,
+    code TEXT NOT NULL,
+    PRIMARY KEY (work_center, start_utc)
+);
+CREATE TABLE IF NOT EXISTS stop_daily (
+    work_center TEXT NOT NULL,
+    local_day TEXT NOT NULL,
+    code TEXT NOT NULL,
+    seconds REAL NOT NULL,
+    stops INTEGER NOT NULL,
+    PRIMARY KEY (work_center, local_day, code)
+);
+CREATE INDEX IF NOT EXISTS stop_daily_day ON stop_daily (local_day);
+CREATE TABLE IF NOT EXISTS stop_open (
+    work_center TEXT PRIMARY KEY,
+    code TEXT NOT NULL,
+    since_utc REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS stop_state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+'''
+
+
+def split_by_local_day(start: float, end: float) -> List[Tuple[str, float]]:
+    """[(local_day, seconds)] for the part of [start, end) on each Europe/Stockholm day"""
+    result = []
+    t = start
+    while t < end:
+        local = datetime.fromtimestamp(t, LOCAL_TZ)
+        next_day = local.date() + timedelta(days=1)
+        midnight = datetime(next_day.year, next_day.month, next_day.day, tzinfo=LOCAL_TZ).timestamp()
+        segment_end = min(end, midnight)
+        result.append((local.date().isoformat(), segment_end - t))
+        t = segment_end
+    return result
+
+
+def _utc_seconds(value) -> float:
+    """MI report_time (naive UTC from the ingest SQL) -> unix seconds"""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def _code(value) -> str:
+    return '' if value is None else str(value).strip()
+
+
+class StopCodeStore:
+    def __init__(self, directory: str = STOP_CODES_DIR):
+        self.directory = directory
+        self.path = os.path.join(directory, 'stop_codes.db')
+        self._refresh_lock = threading.Lock()
+        self._schema_ready = False
+        self.last_run: Dict = {}
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._schema_ready:
+            os.makedirs(self.directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30)
+        if not self._schema_ready:
+            # WAL: readers are not blocked by the ingest job
+            conn.execute(f'PRAGMA journal_mode={STOP_CODES_JOURNAL_MODE}')
+            conn.executescript(_SCHEMA)
+            self._schema_ready = True
+        return conn
+
+    def watermark(self) -> Optional[datetime]:
+        """report_time up to which work_log_item has been read"""
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT value FROM stop_state WHERE key = 'watermark'").fetchone()
+        finally:
+            conn.close()
+        return datetime.fromisoformat(row[0]) if row else None
+
+    # Ingest job
+
+    def refresh(self, fetch: Callable[[datetime, datetime], Iterable], now: Optional[datetime] = None,
+                rebuild: bool = False) -> Dict:
+        """
+        Read work_log_item from the watermark to now - STOP_CODES_SETTLE_SECONDS, STOP_CODES_CHUNK_DAYS at a
+        time. fetch(start, end) returns rows (work_center, report_time_utc, indirect_code) with
+        start < report_time <= end, ordered by report_time.
+        """
+        with self._refresh_lock:
+            started = time.perf_counter()
+            now = now or datetime.now(timezone.utc)
+            upper = now - timedelta(seconds=STOP_CODES_SETTLE_SECONDS)
+            watermark = None if rebuild else self.watermark()
+            start = watermark if watermark is not None else upper - timedelta(days=STOP_CODES_BACKFILL_DAYS)
+
+            rows = 0
+            chunks = 0
+            chunk_start = start
+            while chunk_start < upper:
+                chunk_end = min(chunk_start + timedelta(days=STOP_CODES_CHUNK_DAYS), upper)
+                rows += self._ingest(chunk_end, fetch(chunk_start, chunk_end), rebuild and chunks == 0)
+                chunks += 1
+                chunk_start = chunk_end
+
+            self.last_run = {
+                "from": start.isoformat(),
+                "to": upper.isoformat(),
+                "chunks": chunks,
+                "rows": rows,
+                "rebuild": rebuild,
+                "duration_seconds": round(time.perf_counter() - started, 3),
+                "finished_at": datetime.now(timezone.utc).isoformat(),
+            }
+            return self.last_run
+
+    def _ingest(self, end: datetime, rows: Iterable, clear_all: bool = False) -> int:
+        """Fold one window of rows into the intervals and daily sums and advance the watermark, in one transaction"""
+        conn = self._connect()
+        try:
+            with conn:
+                if clear_all:
+                    for table in ('stop_intervals', 'stop_daily', 'stop_open'):
+                        conn.execute(f'DELETE FROM {table}')
+                open_codes = {wc: (code, since) for wc, code, since in
+                              conn.execute('SELECT work_center, code, since_utc FROM stop_open')}
+                intervals = []
+                daily: Dict[Tuple[str, str, str], List] = {}
+                count = 0
+                for wc, report_time, code in rows:
+                    count += 1
+                    wc, code, t = _code(wc), _code(code), _utc_seconds(report_time)
+                    current = open_codes.get(wc)
+                    if current is not None and current[0] == code:
+                        continue  # Same code reported again
+                    if current is not None and t <= current[1]:
+                        open_codes[wc] = (code, current[1])  # Several codes at one report_time: the last one holds
+                        continue
+                    if current is not None and current[0]:
+                        intervals.append((wc, current[1], t, current[0]))
+                        for i, (day, seconds) in enumerate(split_by_local_day(current[1], t)):
+                            entry = daily.setdefault((wc, day, current[0]), [0.0, 0])
+                            entry[0] += seconds
+                            entry[1] += 1 if i == 0 else 0  # A stop counts on the day it starts
+                    open_codes[wc] = (code, t)
+
+                conn.executemany('INSERT OR REPLACE INTO stop_intervals VALUES (?, ?, ?, ?)', intervals)
+                conn.executemany(
+                    'INSERT INTO stop_daily VALUES (?, ?, ?, ?, ?) '
+                    'ON CONFLICT (work_center, local_day, code) DO UPDATE '
+                    'SET seconds = seconds + excluded.seconds, stops = stops + excluded.stops',
+                    [(wc, day, code, seconds, stops) for (wc, day, code), (seconds, stops) in daily.items()]
+                )
+                conn.executemany('INSERT OR REPLACE INTO stop_open VALUES (?, ?, ?)',
+                                 [(wc, code, since) for wc, (code, since) in open_codes.items()])
+                conn.execute("INSERT OR REPLACE INTO stop_state VALUES ('watermark', ?)", (end.isoformat(),))
+        finally:
+            conn.close()
+        return count
+
+    # Queries
+
+    def _open_stops(self, conn: sqlite3.Connection, work_centers: Optional[List[str]]) -> List[Tuple[str, str, float]]:
+        rows = conn.execute("SELECT work_center, code, since_utc FROM stop_open WHERE code != ''").fetchall()
+        return [row for row in rows if not work_centers or row[0] in work_centers]
+
+    def pareto(self, work_centers: Optional[List[str]], first_day: str, last_day: str,
+               by_day: bool = False, now: Optional[float] = None) -> Dict:
+        """Downtime per code over local days [first_day, last_day], largest first, with cumulative share.
+        Stops still open count up to now."""
+        now = now or time.time()
+        where = 'local_day >= ? AND local_day <= ?'
+        params: List = [first_day, last_day]
+        if work_centers:
+            where += f" AND work_center IN ({','.join('?' * len(work_centers))})"
+            params += work_centers
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                f'SELECT local_day, code, SUM(seconds), SUM(stops) FROM stop_daily WHERE {where} GROUP BY 1, 2', params
+            ).fetchall()
+            open_stops = self._open_stops(conn, work_centers)
+        finally:
+            conn.close()
+
+        rows = [list(row) for row in rows]
+        for wc, code, since in open_stops:
+            for i, (day, seconds) in enumerate(split_by_local_day(since, now)):
+                if first_day <= day <= last_day:
+                    rows.append([day, code, seconds, 1 if i == 0 else 0])
+
+        codes: Dict[str, Dict] = {}
+        days: Dict[str, Dict[str, float]] = {}
+        for day, code, seconds, stops in rows:
+            entry = codes.setdefault(code, {"code": code, "seconds": 0.0, "stops": 0})
+            entry["seconds"] += seconds
+            entry["stops"] += stops
+            if by_day:
+                days.setdefault(day, {}).setdefault(code, 0.0)
+                days[day][code] += seconds
+
+        total = sum(c["seconds"] for c in codes.values())
+        ordered = sorted(codes.values(), key=lambda c: (-c["seconds"], c["code"]))
+        cumulative = 0.0
+        for entry in ordered:
+            cumulative += entry["seconds"]
+            entry["seconds"] = round(entry["seconds"], 1)
+            entry["share"] = round(entry["seconds"] / total, 4) if total else None
+            entry["cumulative_share"] = round(cumulative / total, 4) if total else None
+            entry["mean_stop_seconds"] = round(entry["seconds"] / entry["stops"], 1) if entry["stops"] else None
+        result = {"total_seconds": round(total, 1), "codes": ordered}
+        if by_day:
+            result["days"] = [
+                {"day": day, "total_seconds": round(sum(values.values()), 1),
+                 "codes": {code: round(seconds, 1) for code, seconds in sorted(values.items(), key=lambda kv: -kv[1])}}
+                for day, values in sorted(days.items())
+            ]
+        return result
+
+    def timeline(self, work_center: str, start: float, end: float, now: Optional[float] = None) -> List[Dict]:
+        """Stops of one work center overlapping [start, end), oldest first; an open stop ends at now"""
+        now = now or time.time()
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                'SELECT start_utc, end_utc, code FROM stop_intervals '
+                'WHERE work_center = ? AND start_utc < ? AND end_utc > ? ORDER BY start_utc',
+                (work_center, end, start)
+            ).fetchall()
+            rows = [(s, e, code, False) for s, e, code in rows]
+            rows += [(since, now, code, True) for _, code, since in self._open_stops(conn, [work_center])
+                     if since < end and now > start]
+        finally:
+            conn.close()
+        return [
+            {
+                "code": code,
+                "start": datetime.fromtimestamp(s, LOCAL_TZ).isoformat(),
+                "end": None if ongoing else datetime.fromtimestamp(e, LOCAL_TZ).isoformat(),
+                "duration_seconds": round(e - s, 1),
+                "ongoing": ongoing,
+            }
+            for s, e, code, ongoing in rows
+        ]
+
+    def status(self) -> Dict:
+        conn = self._connect()
+        try:
+            intervals, first, last = conn.execute(
+                'SELECT COUNT(*), MIN(start_utc), MAX(end_utc) FROM stop_intervals').fetchone()
+            daily_rows = conn.execute('SELECT COUNT(*) FROM stop_daily').fetchone()[0]
+            open_stops = conn.execute("SELECT COUNT(*) FROM stop_open WHERE code != ''").fetchone()[0]
+        finally:
+            conn.close()
+        watermark = self.watermark()
+        return {
+            "path": self.path,
+            "watermark": watermark.isoformat() if watermark else None,
+            "intervals": intervals,
+            "daily_rows": daily_rows,
+            "open_stops": open_stops,
+            "first_stop": datetime.fromtimestamp(first, timezone.utc).isoformat() if first is not None else None,
+            "last_stop_end": datetime.fromtimestamp(last, timezone.utc).isoformat() if last is not None else None,
+            "last_run": self.last_run or None,
+        }
+
+
+store = StopCodeStore()
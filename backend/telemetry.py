@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+Continuous CNC telemetry: feedrate, spindle speed and absolute axis positions per machine.
+
+One collector samples every machine with ip_focas every TELEMETRY_INTERVAL seconds through
+FocasService's telemetry endpoint, which keeps a FOCAS session open per machine. Samples go
+into fixed-size numpy ring buffers per machine: the raw samples for the last
+TELEMETRY_RAW_SECONDS, and min/max/mean per TELEMETRY_BUCKET_SECONDS bucket for the last
+TELEMETRY_HISTORY_HOURS. Memory per machine is fixed, and clients read the buffers instead
+of polling the CNC themselves.
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from metrics import REGISTRY
+
+TELEMETRY_ENABLED = os.getenv('TELEMETRY_ENABLED', 'true').lower() == 'true'
+TELEMETRY_INTERVAL = float(os.getenv('TELEMETRY_INTERVAL', '1.0'))  # seconds between samples per machine
+TELEMETRY_WORKERS = int(os.getenv('TELEMETRY_WORKERS', '8'))  # machines sampled in parallel
+TELEMETRY_TIMEOUT = float(os.getenv('TELEMETRY_TIMEOUT', '5'))  # FocasService request timeout per sample
+TELEMETRY_RAW_SECONDS = int(os.getenv('TELEMETRY_RAW_SECONDS', '3600'))  # raw samples kept
+TELEMETRY_BUCKET_SECONDS = int(os.getenv('TELEMETRY_BUCKET_SECONDS', '60'))
+TELEMETRY_HISTORY_HOURS = int(os.getenv('TELEMETRY_HISTORY_HOURS', '168'))  # decimated buckets kept
+TELEMETRY_AXES = int(os.getenv('TELEMETRY_AXES', '5'))  # axis positions stored per sample (X, Y, Z, C, B)
+
+SAMPLE_DTYPE = np.dtype([
+    ('ts', 'i8'),  # unix ms
+    ('feedrate', 'i4'),
+    ('spindle_speed', 'i4'),
+    ('position', 'i4', (TELEMETRY_AXES,)),  # 0.001 mm
+])
+
+BUCKET_DTYPE = np.dtype([
+    ('ts', 'i8'),  # bucket start, unix ms
+    ('samples', 'i4'),
+    ('feedrate_min', 'i4'), ('feedrate_max', 'i4'), ('feedrate_mean', 'f4'),
+    ('spindle_speed_min', 'i4'), ('spindle_speed_max', 'i4'), ('spindle_speed_mean', 'f4'),
+    ('position', 'i4', (TELEMETRY_AXES,)),  # last position in the bucket
+])
+
+TELEMETRY_SAMPLES = REGISTRY.counter("telemetry_samples_total", "CNC telemetry samples by outcome", ["outcome"])
+TELEMETRY_SAMPLE_DURATION = REGISTRY.histogram(
+    "telemetry_sample_duration_seconds", "Time to read one telemetry sample from FocasService",
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+)
+TELEMETRY_MACHINES = REGISTRY.gauge("telemetry_machines", "Machines sampled by the telemetry collector")
+
+
+class Ring:
+    """Fixed-capacity ring of numpy records; `total` counts every record ever appended"""
+
+    def __init__(self, dtype: np.dtype, capacity: int):
+        self.data = np.zeros(max(1, capacity), dtype=dtype)
+        self.total = 0
+
+    def append(self, record: tuple):
+        self.data[self.total % len(self.data)] = record
+        self.total += 1
+
+    def __len__(self) -> int:
+        return min(self.total, len(self.data))
+
+    def ordered(self) -> np.ndarray:
+        """Records oldest first (a copy)"""
+        n = len(self)
+        if self.total <= len(self.data):
+            return self.data[:n].copy()
+        split = self.total % len(self.data)
+        return np.concatenate((self.data[split:], self.data[:split]))
+
+    def between(self, start_ms: int, end_ms: int) -> np.ndarray:
+        records = self.ordered()
+        lo, hi = np.searchsorted(records['ts'], [start_ms, end_ms], side='left')
+        return records[lo:hi]
+
+    def since(self, seq: int) -> np.ndarray:
+        """Records appended after the first `seq` (as many as are still in the ring)"""
+        records = self.ordered()
+        missing = self.total - max(seq, 0)
+        return records[len(records) - min(missing, len(records)):] if missing > 0 else records[:0]
+
+    def oldest_ts(self) -> Optional[int]:
+        if not len(self):
+            return None
+        return int(self.data[0 if self.total <= len(self.data) else self.total % len(self.data)]['ts'])
+
+
+class MachineTelemetry:
+    """Raw and decimated rings for one machine, plus the bucket being filled"""
+
+    def __init__(self, machine_id: str, raw_capacity: int, bucket_capacity: int, bucket_ms: int):
+        self.machine_id = machine_id
+        self.raw = Ring(SAMPLE_DTYPE, raw_capacity)
+        self.buckets = Ring(BUCKET_DTYPE, bucket_capacity)
+        self.bucket_ms = bucket_ms
+        self.changed = threading.Condition()  # notified on every sample (live streams wait on it)
+        self.last_sample_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.last_error_at: Optional[float] = None
+        self.errors = 0
+        self.axis_count: Optional[int] = None
+        self._open: Optional[List] = None  # [bucket_ts, samples, feed_min, feed_max, feed_sum, spindle_min, spindle_max, spindle_sum, position]
+
+    def add(self, ts_ms: int, feedrate: int, spindle_speed: int, position: Iterable[int], axis_count: Optional[int] = None):
+        pos = (list(position) + [0] * TELEMETRY_AXES)[:TELEMETRY_AXES]
+        with self.changed:
+            if self.raw.total and ts_ms <= int(self.raw.data[(self.raw.total - 1) % len(self.raw.data)]['ts']):
+                return  # Out of order (clock step); keep the ring sorted
+            self.raw.append((ts_ms, feedrate, spindle_speed, pos))
+            self._add_to_bucket(ts_ms, feedrate, spindle_speed, pos)
+            self.last_sample_at = ts_ms / 1000.0
+            if axis_count is not None:
+                self.axis_count = axis_count
+            self.changed.notify_all()
+
+    def _add_to_bucket(self, ts_ms: int, feedrate: int, spindle_speed: int, pos: List[int]):
+        bucket_ts = ts_ms - ts_ms % self.bucket_ms
+        b = self._open
+        if b is not None and b[0] != bucket_ts:
+            self._close_bucket()
+            b = None
+        if b is None:
+            self._open = [bucket_ts, 1, feedrate, feedrate, feedrate, spindle_speed, spindle_speed, spindle_speed, pos]
+            return
+        b[1] += 1
+        b[2], b[3], b[4] = min(b[2], feedrate), max(b[3], feedrate), b[4] + feedrate
+        b[5], b[6], b[7] = min(b[5], spindle_speed), max(b[6], spindle_speed), b[7] + spindle_speed
+        b[8] = pos
+
+    def _close_bucket(self):
+        b = self._open
+        self.buckets.append((b[0], b[1], b[2], b[3], b[4] / b[1], b[5], b[6], b[7] / b[1], b[8]))
+        self._open = None
+
+    def error(self, message: str):
+        with self.changed:
+            self.errors += 1
+            self.last_error = message
+            self.last_error_at = time.time()
+
+    def samples(self, start_ms: int, end_ms: int) -> np.ndarray:
+        with self.changed:
+            return self.raw.between(start_ms, end_ms)
+
+    def bucket_view(self, start_ms: int, end_ms: int) -> np.ndarray:
+        """Closed buckets in the range, plus the bucket being filled"""
+        with self.changed:
+            closed = self.buckets.between(start_ms, end_ms)
+            b = self._open
+            if b is None or not start_ms <= b[0] < end_ms:
+                return closed
+            current = np.array([(b[0], b[1], b[2], b[3], b[4] / b[1], b[5], b[6], b[7] / b[1], b[8])], dtype=BUCKET_DTYPE)
+        return np.concatenate((closed, current))
+
+    def raw_covers(self, start_ms: int) -> bool:
+        """True if no sample from start_ms onwards has been dropped from the raw ring"""
+        with self.changed:
+            if self.raw.total <= len(self.raw.data):
+                return True
+            return start_ms >= self.raw.oldest_ts()
+
+    def wait_for_samples(self, seq: int, timeout: float) -> Tuple[np.ndarray, int]:
+        """(samples after `seq`, new seq); blocks up to timeout if there are none yet"""
+        with self.changed:
+            if self.raw.total <= seq:
+                self.changed.wait(timeout)
+            return self.raw.since(seq), self.raw.total
+
+    def status(self) -> Dict:
+        with self.changed:
+            return {
+                "machine_id": self.machine_id,
+                "samples": len(self.raw),
+                "buckets": len(self.buckets),
+                "oldest_sample_ms": self.raw.oldest_ts(),
+                "oldest_bucket_ms": self.buckets.oldest_ts(),
+                "last_sample_at": self.last_sample_at,
+                "axis_count": self.axis_count,
+                "errors": self.errors,
+                "last_error": self.last_error,
+                "last_error_at": self.last_error_at,
+            }
+
+
+def sample_records(records: np.ndarray, axes: int = TELEMETRY_AXES) -> Dict:
+    """Raw samples as columns"""
+    return {
+        "ts": records['ts'].tolist(),
+        "feedrate": records['feedrate'].tolist(),
+        "spindle_speed": records['spindle_speed'].tolist(),
+        "position": records['position'][:, :axes].tolist(),
+    }
+
+
+def bucket_records(records: np.ndarray, axes: int = TELEMETRY_AXES) -> Dict:
+    """Buckets as columns"""
+    result = {name: records[name].tolist() for name in BUCKET_DTYPE.names if name != 'position'}
+    for name in ('feedrate_mean', 'spindle_speed_mean'):
+        result[name] = [round(v, 2) for v in result[name]]
+    result["position"] = records['position'][:, :axes].tolist()
+    return result
+
+
+class TelemetryCollector:
+    """
+    Samples every machine at a fixed rate into per-machine rings.
+    read(ip) returns FocasService telemetry data ({"feedrate", "spindleSpeed", "positions", "axisType"})
+    or raises; machines() returns the machine rows to sample (id, ip_focas). Ticks where active()
+    is False are skipped (standby instance).
+    """
+
+    def __init__(self, read: Callable[[str], Dict], machines: Callable[[], List[Dict]],
+                 interval: float = TELEMETRY_INTERVAL, workers: int = TELEMETRY_WORKERS,
+                 raw_seconds: int = TELEMETRY_RAW_SECONDS, bucket_seconds: int = TELEMETRY_BUCKET_SECONDS,
+                 history_hours: int = TELEMETRY_HISTORY_HOURS, active: Callable[[], bool] = lambda: True):
+        self.read = read
+        self.machines = machines
+        self.active = active
+        self.interval = interval
+        self.workers = workers
+        self.raw_capacity = int(raw_seconds / interval) + 1
+        self.bucket_ms = bucket_seconds * 1000
+        self.bucket_capacity = int(history_hours * 3600 / bucket_seconds) + 1
+        self.error: Optional[str] = None
+        self._machines: Dict[str, MachineTelemetry] = {}
+        self._in_flight: Set[str] = set()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="telemetry-collector", daemon=True)
+                self._thread.start()
+
+    def get(self, machine_id: str) -> Optional[MachineTelemetry]:
+        with self._lock:
+            return self._machines.get(str(machine_id))
+
+    def _machine(self, machine_id: str) -> MachineTelemetry:
+        with self._lock:
+            telemetry = self._machines.get(machine_id)
+            if telemetry is None:
+                telemetry = MachineTelemetry(machine_id, self.raw_capacity, self.bucket_capacity, self.bucket_ms)
+                self._machines[machine_id] = telemetry
+            return telemetry
+
+    def _run(self):
+        executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="telemetry")
+        next_tick = time.monotonic()
+        while True:
+            try:
+                machines = [m for m in self.machines() if m.get('ip_focas')] if self.active() else []
+                self.error = None
+            except Exception as e:
+                machines = []
+                self.error = str(e)
+            TELEMETRY_MACHINES.set(len(machines))
+            for machine in machines:
+                machine_id = str(machine['id'])
+                with self._lock:
+                    if machine_id in self._in_flight:
+                        # The previous sample is still waiting on the CNC; don't queue another one
+                        TELEMETRY_SAMPLES.inc(outcome='skipped')
+                        continue
+                    self._in_flight.add(machine_id)
+                executor.submit(self._sample, machine_id, machine['ip_focas'])
+
+            next_tick += self.interval
+            delay = next_tick - time.monotonic()
+            if delay < 0:
+                next_tick = time.monotonic()  # Fell behind; don't burst to catch up
+            else:
+                time.sleep(delay)
+
+    def _sample(self, machine_id: str, ip_address: str):
+        telemetry = self._machine(machine_id)
+        try:
+            start = time.perf_counter()
+            ts_ms = int(time.time() * 1000)
+            data = self.read(ip_address)
+            TELEMETRY_SAMPLE_DURATION.observe(time.perf_counter() - start)
+            telemetry.add(ts_ms, int(data.get('feedrate') or 0), int(data.get('spindleSpeed') or 0),
+                          data.get('positions') or [], data.get('axisType'))
+            TELEMETRY_SAMPLES.inc(outcome='ok')
+        except Exception as e:
+            telemetry.error(str(e))
+            TELEMETRY_SAMPLES.inc(outcome='error')
+        finally:
+            with self._lock:
+                self._in_flight.discard(machine_id)
+
+    def status(self) -> Dict:
+        with self._lock:
+            machines = list(self._machines.values())
+            running = self._thread is not None and self._thread.is_alive()
+        return {
+            "running": running,
+            "active": self.active(),
+            "interval_seconds": self.interval,
+            "raw_seconds": round(self.raw_capacity * self.interval),
+            "bucket_seconds": self.bucket_ms // 1000,
+            "error": self.error,
+            "machines": [m.status() for m in machines],
+        }
@@ -0,0 +1,115 @@
+"""Per-client limits, priority order and eviction in admission.py"""
+
+import os
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from admission import (BACKGROUND, INTERACTIVE, NORMAL, AdmissionRejected,  # noqa: E402
+                       ConcurrencyLimiter, Ticket, parse_priority)
+
+
+def enter(limiter: ConcurrencyLimiter, priority: int, client: str, woken: list):
+    """Queue a request without blocking; returns its waiter, or None if it got a slot at once"""
+    with limiter._lock:
+        waiter = limiter._try_enter(priority, client, lambda: woken.append(client))
+    return waiter
+
+
+class PerClientLimitTest(unittest.TestCase):
+    def test_third_request_from_one_client_gets_429(self):
+        limiter = ConcurrencyLimiter('test', 4, per_client=2)
+        first = limiter.acquire(client='10.0.0.5')
+        limiter.acquire(client='10.0.0.5')
+        with self.assertRaises(AdmissionRejected) as raised:
+            limiter.acquire(client='10.0.0.5')
+        self.assertEqual((raised.exception.status, raised.exception.reason), (429, 'client_limit'))
+        limiter.acquire(client='10.0.0.6').release()  # Other clients are unaffected
+        first.release()
+        limiter.acquire(client='10.0.0.5')
+        self.assertEqual(limiter.stats()['rejected_client_limit'], 1)
+
+    def test_queued_requests_count_against_the_client(self):
+        limiter = ConcurrencyLimiter('test', 1, per_client=2)
+        limiter.acquire(client='a')
+        self.assertIsNotNone(enter(limiter, NORMAL, 'a', []))
+        with self.assertRaises(AdmissionRejected) as raised:
+            enter(limiter, INTERACTIVE, 'a', [])
+        self.assertEqual(raised.exception.status, 429)
+
+
+class PriorityTest(unittest.TestCase):
+    def test_released_slot_goes_to_the_highest_priority_waiter(self):
+        limiter = ConcurrencyLimiter('test', 1, queue_size=8)
+        ticket = limiter.acquire(client='holder')
+        woken = []
+        for priority, client in [(NORMAL, 'n1'), (BACKGROUND, 'bg'), (INTERACTIVE, 'write'), (NORMAL, 'n2')]:
+            enter(limiter, priority, client, woken)
+        for _ in range(4):
+            ticket.release()
+            self.assertEqual(limiter.stats()['active'], 1)
+            ticket = Ticket(limiter, woken[-1])
+        self.assertEqual(woken, ['write', 'n1', 'n2', 'bg'])
+        self.assertEqual(limiter.stats()['queued'], 0)
+
+    def test_full_queue_evicts_the_lowest_priority_waiter(self):
+        limiter = ConcurrencyLimiter('test', 1, queue_size=2)
+        limiter.acquire(client='holder')
+        woken = []
+        background = enter(limiter, BACKGROUND, 'monitor', woken)
+        enter(limiter, NORMAL, 'n1', woken)
+        enter(limiter, INTERACTIVE, 'write', woken)
+        self.assertEqual(woken, ['monitor'])
+        with limiter._lock:
+            error = limiter._abandon(background)
+        self.assertEqual((error.status, error.reason), (503, 'queue_full'))
+        stats = limiter.stats()
+        self.assertEqual((stats['evicted'], stats['queued']), (1, 2))
+        self.assertNotIn('monitor', limiter._per_client)
+
+    def test_full_queue_sheds_requests_of_equal_or_lower_priority(self):
+        limiter = ConcurrencyLimiter('test', 1, queue_size=1)
+        limiter.acquire(client='holder')
+        enter(limiter, NORMAL, 'n1', [])
+        for priority in (NORMAL, BACKGROUND):
+            with self.assertRaises(AdmissionRejected) as raised:
+                enter(limiter, priority, 'n2', [])
+            self.assertEqual((raised.exception.status, raised.exception.reason), (503, 'queue_full'))
+        self.assertGreaterEqual(raised.exception.retry_after, 1)
+
+
+class BlockingAcquireTest(unittest.TestCase):
+    def test_wait_times_out_with_503(self):
+        limiter = ConcurrencyLimiter('test', 1, queue_timeout=0.05)
+        limiter.acquire(client='holder')
+        with self.assertRaises(AdmissionRejected) as raised:
+            limiter.acquire(client='late')
+        self.assertEqual((raised.exception.status, raised.exception.reason), (503, 'timeout'))
+        self.assertEqual(limiter.stats()['queued'], 0)
+
+    def test_waiting_thread_is_admitted_on_release(self):
+        limiter = ConcurrencyLimiter('test', 1, queue_timeout=5)
+        ticket = limiter.acquire(client='holder')
+        admitted = []
+        thread = threading.Thread(target=lambda: admitted.append(limiter.acquire(client='next')))
+        thread.start()
+        while not limiter.stats()['queued']:
+            threading.Event().wait(0.01)
+        ticket.release()
+        thread.join(5)
+        self.assertEqual([t.client for t in admitted], ['next'])
+        self.assertEqual(limiter.stats()['active'], 1)
+
+
+class ParsePriorityTest(unittest.TestCase):
+    def test_names_and_default(self):
+        self.assertEqual(parse_priority(' Background '), BACKGROUND)
+        self.assertEqual(parse_priority('interactive'), INTERACTIVE)
+        self.assertEqual(parse_priority('urgent'), NORMAL)
+        self.assertEqual(parse_priority(None, BACKGROUND), BACKGROUND)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+"""Opening, the half-open trial and probe recovery in circuit_breaker.py, without real dependencies"""
+
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError  # noqa: E402
+
+
+def opened(probe=None) -> CircuitBreaker:
+    """A breaker opened by three failures, with its reset timeout already passed"""
+    breaker = CircuitBreaker('test:10.0.0.1', probe, failure_threshold=3, reset_timeout=30)
+    for _ in range(3):
+        breaker.failure('timed out')
+    breaker.opened_at -= 31
+    return breaker
+
+
+class OpeningTest(unittest.TestCase):
+    def test_opens_after_consecutive_failures(self):
+        breaker = CircuitBreaker('test:10.0.0.1', failure_threshold=3, reset_timeout=30)
+        breaker.failure('timed out')
+        breaker.failure('timed out')
+        self.assertTrue(breaker.allow())
+        breaker.failure('timed out')
+        self.assertEqual(breaker.state, OPEN)
+        with self.assertRaises(CircuitOpenError) as raised:
+            breaker.check()
+        self.assertEqual(raised.exception.state['consecutive_failures'], 3)
+        self.assertEqual(breaker.snapshot()['rejected'], 1)
+
+    def test_success_resets_the_failure_count(self):
+        breaker = CircuitBreaker('test:10.0.0.1', failure_threshold=3, reset_timeout=30)
+        breaker.failure('timed out')
+        breaker.failure('timed out')
+        breaker.success()
+        breaker.failure('timed out')
+        self.assertEqual(breaker.state, CLOSED)
+
+    def test_disabled_breakers_always_allow(self):
+        breaker = opened()
+        breaker.opened_at += 31
+        with mock.patch('circuit_breaker.BREAKER_ENABLED', False):
+            self.assertTrue(breaker.allow())
+
+
+class HalfOpenTest(unittest.TestCase):
+    def test_stays_open_until_the_reset_timeout(self):
+        breaker = opened()
+        breaker.opened_at += 31
+        self.assertFalse(breaker.allow())
+        self.assertEqual(breaker.state, OPEN)
+
+    def test_single_trial_request(self):
+        breaker = opened()
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.state, HALF_OPEN)
+        self.assertFalse(breaker.allow())  # A second caller while the trial is in flight
+        self.assertEqual(breaker.rejected, 1)
+
+    def test_failed_trial_reopens(self):
+        breaker = opened()
+        self.assertTrue(breaker.allow())
+        breaker.failure('refused')
+        self.assertEqual(breaker.state, OPEN)
+        self.assertFalse(breaker.allow())  # A new reset timeout has started
+        self.assertEqual(breaker.snapshot()['last_error'], 'refused')
+
+    def test_successful_trial_closes(self):
+        breaker = opened()
+        self.assertTrue(breaker.allow())
+        breaker.success()
+        self.assertEqual(breaker.state, CLOSED)
+        self.assertIsNone(breaker.opened_at)
+        self.assertTrue(breaker.allow())
+        self.assertTrue(breaker.allow())
+
+    def test_released_trial_lets_the_next_request_try(self):
+        breaker = opened()
+        with self.assertRaises(KeyError):
+            with breaker.guard(failure_types=(OSError,)):
+                raise KeyError('not a dependency failure')
+        self.assertEqual(breaker.state, HALF_OPEN)
+        self.assertTrue(breaker.allow())
+
+
+class ProbeTest(unittest.TestCase):
+    def test_probed_breaker_never_lets_requests_through(self):
+        breaker = opened(probe=lambda: True)
+        self.assertFalse(breaker.allow())
+        self.assertEqual(breaker.state, OPEN)
+        self.assertTrue(breaker.due_for_probe())
+
+    def test_failed_probe_keeps_it_open_for_another_timeout(self):
+        breaker = opened(probe=lambda: False)
+        breaker.run_probe()
+        self.assertEqual(breaker.state, OPEN)
+        self.assertFalse(breaker.due_for_probe())
+
+    def test_probe_exception_counts_as_failed(self):
+        def probe():
+            raise OSError('no route to host')
+        breaker = opened(probe=probe)
+        breaker.run_probe()
+        self.assertEqual(breaker.state, OPEN)
+        self.assertFalse(breaker.due_for_probe())
+
+    def test_successful_probe_closes(self):
+        breaker = opened(probe=lambda: True)
+        breaker.run_probe()
+        self.assertEqual(breaker.state, CLOSED)
+        self.assertEqual(breaker.consecutive_failures, 0)
+        self.assertTrue(breaker.allow())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,145 @@
+"""Hourly upserts, recompute and local day/week labels in kassationer_rollup.py, on synthetic MI rows"""
+
+import os
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from kassationer_rollup import KassationerRollup, hour_start, local_labels  # noqa: E402
+
+NOW = datetime(2026, 7, 15, 12, 30, tzinfo=timezone.utc)
+
+
+def utc(value: str) -> datetime:
+    return datetime.fromisoformat(value).replace(tzinfo=timezone.utc)
+
+
+def fetcher(rejections, productions):
+    """
+    fetch(start, end) aggregating per UTC hour like the rollup SQL, for events in [start, end):
+    rejections (time, wc, part, code, operator, qty), productions (time, wc, part, produced, rejected)
+    """
+    def fetch(start, end):
+        rejected, produced = {}, {}
+        for t, wc, part, code, operator, qty in rejections:
+            if start <= t < end:
+                key = (hour_start(t).replace(tzinfo=None), wc, part, code, operator)
+                qty_sum, events = rejected.get(key, (0.0, 0))
+                rejected[key] = (qty_sum + qty, events + 1)
+        for t, wc, part, produced_qty, rejected_qty in productions:
+            if start <= t < end:
+                key = (hour_start(t).replace(tzinfo=None), wc, part)
+                p, r = produced.get(key, (0, 0))
+                produced[key] = (p + produced_qty, r + rejected_qty)
+        return ([k + v for k, v in rejected.items()], [k + v for k, v in produced.items()])
+    return fetch
+
+
+class LocalLabelsTest(unittest.TestCase):
+    def test_summer_evening_hour_belongs_to_the_next_local_day(self):
+        # 22:00 UTC is 00:00 CEST
+        self.assertEqual(local_labels(utc('2026-07-14T22:00:00')), ('2026-07-15', '2026-W29'))
+        self.assertEqual(local_labels(utc('2026-07-14T21:00:00')), ('2026-07-14', '2026-W29'))
+
+    def test_iso_week_at_the_turn_of_the_year(self):
+        # 2025-12-31 23:00 UTC is new year's day locally, in ISO week 1 of 2026
+        self.assertEqual(local_labels(utc('2025-12-31T23:00:00')), ('2026-01-01', '2026-W01'))
+        self.assertEqual(local_labels(utc('2024-12-30T10:00:00')), ('2024-12-30', '2025-W01'))
+
+    def test_hours_around_the_spring_dst_change(self):
+        # 01:00 UTC on 2026-03-29 is 03:00 CEST; the local hour 02:00 does not exist
+        self.assertEqual(local_labels(utc('2026-03-29T00:00:00'))[0], '2026-03-29')
+        self.assertEqual(local_labels(utc('2026-03-28T22:00:00'))[0], '2026-03-28')
+
+
+class RollupTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.rollup = KassationerRollup(self.dir.name)
+        self.rejections = [
+            (utc('2026-07-14T08:10:00'), '5701', 'P1', 'A1', '7', 2.0),
+            (utc('2026-07-14T08:50:00'), '5701', 'P1', 'A1', '7', 1.0),
+            (utc('2026-07-14T08:20:00'), '5701', 'P1', 'A1 ', '7', 4.0),  # Untrimmed code from MI
+            (utc('2026-07-14T22:15:00'), '5701', 'P2', 'B2', '8', 5.0),  # 00:15 local on the 15th
+            (utc('2026-07-01T10:00:00'), '5702', 'P1', 'A1', '7', 1.0),
+        ]
+        self.productions = [
+            (utc('2026-07-14T08:00:00'), '5701', 'P1', 100, 7),
+            (utc('2026-07-14T22:30:00'), '5701', 'P2', 50, 5),
+        ]
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def refresh(self, now=NOW, **kwargs):
+        return self.rollup.refresh(fetcher(self.rejections, self.productions), now=now, **kwargs)
+
+    def day_report(self, **kwargs):
+        return self.rollup.query('5701', utc('2026-07-13T22:00:00'), utc('2026-07-15T22:00:00'), **kwargs)
+
+    def test_rows_differing_in_untrimmed_text_are_summed(self):
+        self.refresh()
+        report = self.day_report(group_by='code')
+        day = report['periods'][0]
+        self.assertEqual(day['period'], '2026-07-14')
+        self.assertEqual(day['groups'], [{"key": 'A1', "rejected_qty": 7.0, "events": 3}])
+
+    def test_local_day_labels(self):
+        self.refresh()
+        report = self.day_report()
+        self.assertEqual([(p['period'], p['rejected_qty'], p['producerade'], p['kasserade']) for p in report['periods']],
+                         [('2026-07-14', 7.0, 100, 7), ('2026-07-15', 5.0, 50, 5)])
+        self.assertEqual((report['producerade'], report['kasserade']), (150, 12))
+
+    def test_week_and_month_periods(self):
+        self.refresh()
+        self.assertEqual([p['period'] for p in self.day_report(granularity='week')['periods']], ['2026-W29'])
+        month = self.day_report(granularity='month')['periods']
+        self.assertEqual([(p['period'], p['rejected_qty']) for p in month], [('2026-07', 12.0)])
+
+    def test_window_edge_inside_an_hour_includes_the_hour(self):
+        self.refresh()
+        report = self.rollup.query('5701', utc('2026-07-14T08:45:00'), utc('2026-07-14T09:00:00'))
+        self.assertEqual(report['rejected_qty'], 7.0)
+
+    def test_recompute_replaces_late_reported_hours_instead_of_adding(self):
+        self.refresh()
+        # A late MI report for an hour already rolled up, inside the recompute window
+        self.rejections.append((utc('2026-07-14T08:55:00'), '5701', 'P1', 'A1', '7', 10.0))
+        self.refresh(now=NOW + timedelta(hours=1))
+        day = self.day_report()['periods'][0]
+        self.assertEqual((day['rejected_qty'], day['events']), (17.0, 4))
+        # A second run without new reports leaves the sums unchanged
+        self.refresh(now=NOW + timedelta(hours=2))
+        self.assertEqual(self.day_report()['periods'][0]['rejected_qty'], 17.0)
+
+    def test_rebuild_clears_rows_outside_the_backfill(self):
+        self.refresh()
+        self.rejections = [r for r in self.rejections if r[1] != '5702']
+        self.refresh(rebuild=True)
+        report = self.rollup.query('5702', utc('2026-06-30T22:00:00'), utc('2026-07-02T22:00:00'))
+        self.assertEqual(report['periods'], [])
+
+    def test_chunked_refresh_equals_one_window(self):
+        with mock.patch('kassationer_rollup.KASSATIONER_ROLLUP_CHUNK_DAYS', 1):
+            self.refresh()
+        whole = KassationerRollup(os.path.join(self.dir.name, 'whole'))
+        with mock.patch('kassationer_rollup.KASSATIONER_ROLLUP_CHUNK_DAYS', 500):
+            whole.refresh(fetcher(self.rejections, self.productions), now=NOW)
+        for granularity in ('day', 'week', 'month'):
+            self.assertEqual(self.day_report(granularity=granularity, group_by='part'),
+                             whole.query('5701', utc('2026-07-13T22:00:00'), utc('2026-07-15T22:00:00'),
+                                         granularity=granularity, group_by='part'))
+
+    def test_watermark_advances_to_now(self):
+        self.refresh()
+        self.assertEqual(self.rollup.watermark(), NOW)
+        self.assertEqual(self.rollup.status()['work_centers'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
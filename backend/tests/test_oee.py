@@ -0,0 +1,89 @@
+"""Part counting across counter wraps and resets, and the kassationer cache in oee.py"""
+
+import os
+import sys
+import tempfile
+import time
+import unittest
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from kassationer_rollup import LOCAL_TZ  # noqa: E402
+from oee import IdealCycleTimes, OeeEngine, ShiftCalendar  # noqa: E402
+from wear_analytics import counter_step  # noqa: E402
+
+
+def engine(state_dir: str, quality=None) -> OeeEngine:
+    # One shift per local day, 10 s ideal cycle for every part
+    return OeeEngine(quality, calendar=ShiftCalendar('Dygn=00:00-00:00'),
+                     ideal_cycles=IdealCycleTimes(os.path.join(state_dir, 'missing.json'), default='10'),
+                     state_dir=state_dir)
+
+
+class CounterStepTest(unittest.TestCase):
+    def test_wrap_near_the_top(self):
+        self.assertEqual(counter_step(65500, 100), 136)
+
+    def test_drop_far_from_the_top_is_a_reset(self):
+        self.assertEqual(counter_step(1200, 50), 50)
+
+    def test_unchanged(self):
+        self.assertEqual(counter_step(300, 300), 0)
+
+
+class RecordTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.engine = engine(self.dir.name)
+        self.t0 = datetime(2026, 3, 10, 12, tzinfo=LOCAL_TZ).timestamp()
+        self.shift = self.engine.calendar.at(self.t0)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def record_counts(self, counts):
+        for i, count in enumerate(counts):
+            self.engine.record('5701', self.t0 + 10 * i, 'Running', 'P1', count)
+        return self.engine._totals['5701'][self.shift.key]
+
+    def test_parts_across_a_16_bit_wrap(self):
+        totals = self.record_counts([65000, 65500, 100, 600])
+        self.assertEqual(totals["parts"], 500 + 136 + 500)
+        self.assertEqual(totals["ideal_seconds"], 1136 * 10)
+
+    def test_parts_after_a_reset_are_counted(self):
+        totals = self.record_counts([1000, 1200, 50, 80])
+        self.assertEqual(totals["parts"], 200 + 50 + 30)
+
+    def test_unread_counter_keeps_the_previous_value(self):
+        totals = self.record_counts([100, None, 150])
+        self.assertEqual(totals["parts"], 50)
+
+
+class QualityCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.calls = []
+        self.engine = engine(self.dir.name, quality=lambda wc, start, end: self.calls.append(wc) or (100.0, 5.0))
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_lookup_is_reused(self):
+        shift = self.engine.calendar.at(time.time())
+        self.engine._quality('5701', shift)
+        self.engine._quality('5701', shift)
+        self.assertEqual(self.calls, ['5701'])
+
+    def test_old_shifts_are_evicted_on_refresh(self):
+        old = self.engine.calendar.at((datetime.now(LOCAL_TZ) - timedelta(days=60)).timestamp())
+        current = self.engine.calendar.at(time.time())
+        self.engine._quality('5701', old)
+        self.engine._quality('5701', current)
+        self.engine.after_refresh()
+        self.assertEqual(list(self.engine._quality_cache), [('5701', current.key)])
+
+
+if __name__ == '__main__':
+    unittest.main()
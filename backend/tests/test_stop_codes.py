@@ -0,0 +1,119 @@
+"""Interval folding and daily sums in stop_codes.py, on synthetic work_log_item rows"""
+
+import os
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from kassationer_rollup import LOCAL_TZ  # noqa: E402
+from stop_codes import StopCodeStore, split_by_local_day  # noqa: E402
+
+NOW = datetime(2026, 4, 10, 12, 0, tzinfo=timezone.utc)
+
+
+def utc(local: str) -> datetime:
+    """Local Europe/Stockholm time -> naive UTC, as the ingest SQL returns report_time"""
+    value = datetime.fromisoformat(local).replace(tzinfo=LOCAL_TZ)
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def fetcher(rows):
+    """fetch(start, end) over a row list: start < report_time <= end, ordered by report_time"""
+    def fetch(start, end):
+        start, end = start.replace(tzinfo=None), end.replace(tzinfo=None)
+        return sorted((r for r in rows if start < r[1] <= end), key=lambda r: r[1])
+    return fetch
+
+
+class StopCodeStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def refresh(self, rows, chunk_days: int, name: str = 'db') -> StopCodeStore:
+        store = StopCodeStore(os.path.join(self.dir.name, name))
+        with mock.patch('stop_codes.STOP_CODES_CHUNK_DAYS', chunk_days):
+            store.refresh(fetcher(rows), now=NOW)
+        return store
+
+    def test_stop_across_chunk_boundaries_is_one_interval(self):
+        rows = [
+            ('5701', utc('2026-04-01T10:00:00'), 'A1'),
+            ('5701', utc('2026-04-03T10:00:00'), ''),  # Two days later: spans several 1-day chunks
+            ('5701', utc('2026-04-03T11:00:00'), 'B2'),
+            ('5701', utc('2026-04-03T11:30:00'), ''),
+        ]
+        chunked = self.refresh(rows, chunk_days=1, name='chunked')
+        whole = self.refresh(rows, chunk_days=365, name='whole')
+
+        start, end = utc('2026-04-01T00:00:00').replace(tzinfo=timezone.utc), NOW
+        timeline = chunked.timeline('5701', start.timestamp(), end.timestamp(), now=NOW.timestamp())
+        self.assertEqual([(s['code'], s['duration_seconds']) for s in timeline], [('A1', 48 * 3600.0), ('B2', 1800.0)])
+        self.assertEqual(timeline, whole.timeline('5701', start.timestamp(), end.timestamp(), now=NOW.timestamp()))
+
+        pareto = chunked.pareto(['5701'], '2026-04-01', '2026-04-10', by_day=True, now=NOW.timestamp())
+        self.assertEqual(pareto, whole.pareto(['5701'], '2026-04-01', '2026-04-10', by_day=True, now=NOW.timestamp()))
+        a1 = next(c for c in pareto['codes'] if c['code'] == 'A1')
+        self.assertEqual((a1['seconds'], a1['stops']), (48 * 3600.0, 1))
+        self.assertEqual([d['codes'].get('A1') for d in pareto['days']], [14 * 3600.0, 24 * 3600.0, 10 * 3600.0])
+
+    def test_several_codes_at_one_report_time_last_one_holds(self):
+        t = utc('2026-04-05T08:00:00')
+        rows = [
+            ('5701', t, 'A1'),
+            ('5701', t, 'B2'),
+            ('5701', t + timedelta(minutes=10), ''),
+        ]
+        store = self.refresh(rows, chunk_days=7)
+        timeline = store.timeline('5701', 0, NOW.timestamp(), now=NOW.timestamp())
+        self.assertEqual([(s['code'], s['duration_seconds']) for s in timeline], [('B2', 600.0)])
+
+    def test_same_code_reported_again_extends_the_stop(self):
+        t = utc('2026-04-05T08:00:00')
+        rows = [('5701', t, 'A1'), ('5701', t + timedelta(minutes=5), 'A1'), ('5701', t + timedelta(minutes=20), '')]
+        store = self.refresh(rows, chunk_days=7)
+        pareto = store.pareto(None, '2026-04-05', '2026-04-05', now=NOW.timestamp())
+        self.assertEqual(pareto['codes'][0]['seconds'], 1200.0)
+        self.assertEqual(pareto['codes'][0]['stops'], 1)
+
+    def test_open_stop_counts_up_to_now(self):
+        rows = [('5701', utc('2026-04-10T13:00:00'), 'A1')]  # 11:00 UTC, one hour before NOW
+        store = self.refresh(rows, chunk_days=7)
+        pareto = store.pareto(None, '2026-04-10', '2026-04-10', now=NOW.timestamp())
+        self.assertEqual(pareto['codes'][0]['seconds'], 3600.0)
+        self.assertTrue(store.timeline('5701', 0, NOW.timestamp(), now=NOW.timestamp())[0]['ongoing'])
+
+    def test_stop_over_the_spring_dst_change_is_split_by_local_day(self):
+        # Clocks go from 02:00 to 03:00 on 2026-03-29: 23:00 -> 04:00 local is four real hours
+        rows = [('5701', utc('2026-03-28T23:00:00'), 'A1'), ('5701', utc('2026-03-29T04:00:00'), '')]
+        store = self.refresh(rows, chunk_days=7)
+        pareto = store.pareto(None, '2026-03-28', '2026-03-29', by_day=True, now=NOW.timestamp())
+        self.assertEqual([(d['day'], d['codes']['A1']) for d in pareto['days']],
+                         [('2026-03-28', 3600.0), ('2026-03-29', 3 * 3600.0)])
+        self.assertEqual(pareto['codes'][0]['stops'], 1)  # Counted on the day it starts
+
+    def test_second_run_continues_from_the_watermark(self):
+        rows = [('5701', utc('2026-04-09T08:00:00'), 'A1')]
+        store = self.refresh(rows, chunk_days=7)
+        rows.append(('5701', utc('2026-04-10T14:30:00'), ''))  # Closed after the first run's watermark
+        store.refresh(fetcher(rows), now=NOW + timedelta(hours=1))
+        timeline = store.timeline('5701', 0, NOW.timestamp() + 3600, now=NOW.timestamp() + 3600)
+        self.assertEqual([(s['code'], s['ongoing']) for s in timeline], [('A1', False)])
+        self.assertEqual(timeline[0]['duration_seconds'], 30.5 * 3600)
+
+
+class SplitByLocalDayTest(unittest.TestCase):
+    def test_autumn_dst_day_has_25_hours(self):
+        start = datetime(2026, 10, 25, tzinfo=LOCAL_TZ).timestamp()
+        end = datetime(2026, 10, 26, tzinfo=LOCAL_TZ).timestamp()
+        self.assertEqual(split_by_local_day(start, end), [('2026-10-25', 25 * 3600.0)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+"""Counter wrap handling and rate math in wear_analytics.py (python -m unittest discover -s tests, from backend/)"""
+
+import os
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from compensation_snapshot import MISSING  # noqa: E402
+from wear_analytics import COUNTER_MODULO, WEAR_FIELDS, ToolChangeLog, WearAnalytics, monotonic_counter  # noqa: E402
+
+
+class MonotonicCounterTest(unittest.TestCase):
+    def test_counts_across_16_bit_wrap(self):
+        values = np.array([65000, 65500, 100, 600])
+        # 65500 -> 100 is a wrap: 36 parts up to 65535, one to 0 and 100 after it
+        self.assertEqual(monotonic_counter(values).tolist(), [0, 500, 636, 1136])
+
+    def test_wrap_step_equals_modulo_difference(self):
+        before, after = COUNTER_MODULO - 10, 20
+        self.assertEqual(monotonic_counter(np.array([before, after])).tolist(), [0, 30])
+
+    def test_drop_far_from_the_top_is_a_reset(self):
+        # Counter cleared by hand: the new value is counted from zero
+        self.assertEqual(monotonic_counter(np.array([1000, 1200, 50, 80])).tolist(), [0, 200, 250, 280])
+
+    def test_empty(self):
+        self.assertEqual(monotonic_counter(np.array([], dtype=np.int64)).tolist(), [])
+
+
+class RateTest(unittest.TestCase):
+    def test_mm_per_1000_parts(self):
+        # 50 um of wear over 2000 parts = 0.025 mm per 1000 parts
+        state = {'tools': {'7': {'lives': 1, 'fields': {'verktyg_radie_wear': {
+            'wear_units': -50, 'abs_wear_units': 50, 'adjustments': 5, 'parts': 2000.0}}}}}
+        rate = WearAnalytics.rates('m1', state, [])[0]
+        field = rate['fields']['verktyg_radie_wear']
+        self.assertAlmostEqual(field['wear_mm_per_1000_parts'], -0.025)
+        self.assertAlmostEqual(field['net_wear_mm'], -0.05)
+        self.assertEqual(field['parts'], 2000)
+
+    def test_no_parts_gives_no_rate(self):
+        state = {'tools': {'7': {'lives': 0, 'fields': {'verktyg_radie_wear': {
+            'wear_units': 10, 'abs_wear_units': 10, 'adjustments': 1, 'parts': 0.0}}}}}
+        rate = WearAnalytics.rates('m1', state, [])[0]
+        self.assertIsNone(rate['fields']['verktyg_radie_wear']['wear_mm_per_1000_parts'])
+        self.assertIsNone(rate['suggested_maxgräns'])
+
+    def test_fold_uses_parts_across_a_counter_wrap(self):
+        # Three scans 1000 parts apart, the counter wrapping between the last two; radius wear -10 um per scan
+        ts = np.array([0, 1000, 2000], dtype=np.int64)
+        wear = np.full((3, 1, len(WEAR_FIELDS)), MISSING, dtype=np.int64)
+        radius = [f for f, (_, db) in enumerate(WEAR_FIELDS) if db == 'verktyg_radie_wear'][0]
+        wear[:, 0, radius] = [0, -10, -20]
+        counter_ts = ts
+        counter = monotonic_counter(np.array([64000, 65000, 464]))  # 65000 -> 464 is 1000 parts
+        state = {'tools': {}}
+        WearAnalytics._fold(state, 3, ts, wear, counter_ts, counter, {})
+
+        sums = state['tools']['3']['fields']['verktyg_radie_wear']
+        self.assertEqual(sums['parts'], 2000.0)
+        self.assertEqual(sums['wear_units'], -20)
+        rate = WearAnalytics.rates('m1', state, [])[0]['fields']['verktyg_radie_wear']
+        self.assertAlmostEqual(rate['wear_mm_per_1000_parts'], -0.01)
+
+    def test_tool_change_splits_lives(self):
+        ts = np.array([0, 1000, 2000], dtype=np.int64)
+        wear = np.zeros((3, 1, len(WEAR_FIELDS)), dtype=np.int64)
+        wear[:, 0, 0] = [-40, 0, -10]  # wear reset to 0 at the tool change between scan 0 and 1
+        counter = np.array([0, 1000, 2000], dtype=np.int64)
+        state = {'tools': {}}
+        WearAnalytics._fold(state, 1, ts, wear, ts, counter, {1: np.array([500], dtype=np.int64)})
+
+        sums = state['tools']['1']['fields'][WEAR_FIELDS[0][1]]
+        self.assertEqual(sums['wear_units'], -10)  # The +40 step across the change is left out
+        self.assertEqual(sums['parts'], 1000.0)
+        self.assertEqual(state['tools']['1']['lives'], 1)
+
+
+class ToolChangeLogTest(unittest.TestCase):
+    def test_append_skips_known_rows_and_tracks_high_water(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            log = ToolChangeLog(tmp)
+            self.assertIsNone(log.high_water('m1'))
+            rows = [
+                {'id': 'a', 'tool_id': 't1', 'number_of_parts_ADAM': 10, 'date_created': '2025-01-01T10:00:00+00:00'},
+                {'id': 'b', 'tool_id': 't2', 'number_of_parts_ADAM': 20, 'date_created': '2025-01-02T10:00:00+00:00'},
+            ]
+            self.assertEqual(log.append('m1', rows), 2)
+            # A fetch from the high-water mark returns the newest row again
+            self.assertEqual(log.append('m1', rows[1:] + [
+                {'id': 'c', 'tool_id': 't1', 'number_of_parts_ADAM': 30, 'date_created': '2025-01-02T10:00:00+00:00'},
+            ]), 1)
+            self.assertEqual([r['id'] for r in log.rows('m1')], ['a', 'b', 'c'])
+            self.assertEqual(log.high_water('m1'), '2025-01-02T10:00:00+00:00')
+
+
+if __name__ == '__main__':
+    unittest.main()
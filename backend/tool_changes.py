@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Latest verktygsbyteslista row per machine and tool, kept up to date incrementally.
+
+The fleet snapshot and the tool max checker only need the last tool change of the tools that have
+plats and maxgräns. Those are loaded once per machine (one limit(1) query per tool); after that each
+call fetches only rows from TOOL_CHANGES_LOOKBACK_SECONDS before the newest date_created seen for the
+machine, filtered to the tracked tools, so the query size no longer grows with the machine's tool change
+history. date_created is set by the terminal's clock, so a row saved late or by a terminal whose clock is
+behind can land below the newest one seen; the lookback overlap picks it up, and rows already seen are
+skipped by id. Everything is reloaded every TOOL_CHANGES_RESYNC_SECONDS to pick up edited or deleted rows.
+"""
+
+import os
+import time
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, List, Optional
+
+TOOL_CHANGES_TABLE = 'verktygshanteringssystem_verktygsbyteslista'
+TOOL_CHANGE_COLUMNS = 'id, tool_id, number_of_parts_ADAM, extra_parts_old_tool, date_created'
+
+TOOL_CHANGES_RESYNC_SECONDS = float(os.getenv('TOOL_CHANGES_RESYNC_SECONDS', '3600'))  # Full reload per machine
+TOOL_CHANGES_LOOKBACK_SECONDS = float(os.getenv('TOOL_CHANGES_LOOKBACK_SECONDS', '900'))  # Overlap before the newest row seen
+
+
+def tracked_tool_ids(tools: List[Dict]) -> List[str]:
+    """Tools the max limit logic looks at: those with both plats and maxgräns"""
+    return [str(t['id']) for t in tools if t.get('plats') and t.get('maxgräns')]
+
+
+def _created(row: Dict) -> datetime:
+    value = row.get('date_created') or '1970-01-01T00:00:00+00:00'
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+
+class LatestToolChanges:
+    """Per-machine latest tool change per tool, with a date_created high-water mark"""
+
+    def __init__(self, client_getter: Callable[[], object], resync_seconds: float = TOOL_CHANGES_RESYNC_SECONDS,
+                 lookback_seconds: float = TOOL_CHANGES_LOOKBACK_SECONDS):
+        self._client_getter = client_getter
+        self.resync_seconds = resync_seconds
+        self.lookback_seconds = lookback_seconds
+        self._lock = threading.Lock()
+        self._machines: Dict[str, Dict] = {}
+        self.stats = {"tool_loads": 0, "incremental_fetches": 0, "rows_fetched": 0}
+
+    def _machine(self, machine_id: str) -> Dict:
+        with self._lock:
+            return self._machines.setdefault(machine_id, {
+                "lock": threading.Lock(), "latest": {}, "tracked": set(), "watermark": None, "synced_at": 0.0,
+                "seen": {}
+            })
+
+    def _since(self, state: Dict) -> datetime:
+        return _created({"date_created": state["watermark"]}) - timedelta(seconds=self.lookback_seconds)
+
+    def _apply(self, state: Dict, rows: Iterable[Dict]) -> int:
+        """Fold rows into the latest-per-tool map; returns the number of rows not seen before"""
+        new = 0
+        for row in rows:
+            if row.get('id') is not None:
+                if row['id'] in state["seen"]:
+                    continue
+                state["seen"][row['id']] = _created(row)
+            new += 1
+            tool_id = str(row.get('tool_id'))
+            current = state["latest"].get(tool_id)
+            created = _created(row)
+            if current is None or created >= _created(current):
+                state["latest"][tool_id] = row
+            if state["watermark"] is None or created > _created({"date_created": state["watermark"]}):
+                state["watermark"] = row.get('date_created')
+        if state["watermark"] is not None:
+            # Ids are only needed for rows the next lookback query can return again
+            since = self._since(state)
+            state["seen"] = {k: v for k, v in state["seen"].items() if v >= since}
+        return new
+
+    def latest(self, machine_id, tool_ids: Iterable[str]) -> Dict[str, Dict]:
+        """{tool_id: latest row} for the given tools on one machine (tools without changes are left out)"""
+        client = self._client_getter()
+        if client is None:
+            raise RuntimeError("Supabase client not available")
+        machine_id = str(machine_id)
+        tool_ids = set(tool_ids)
+        state = self._machine(machine_id)
+        with state["lock"]:
+            if time.time() - state["synced_at"] > self.resync_seconds:
+                state.update(latest={}, tracked=set(), watermark=None, synced_at=time.time(), seen={})
+
+            # Rows from the lookback window before the high-water mark on, for the tools already tracked
+            if state["tracked"]:
+                query = client.table(TOOL_CHANGES_TABLE)\
+                    .select(TOOL_CHANGE_COLUMNS)\
+                    .eq('machine_id', machine_id)\
+                    .in_('tool_id', sorted(state["tracked"]))
+                if state["watermark"] is not None:
+                    query = query.gte('date_created', self._since(state).isoformat())
+                rows = query.order('date_created').execute().data or []
+                self.stats["incremental_fetches"] += 1
+                self.stats["rows_fetched"] += self._apply(state, rows)
+
+            # Tools that got plats/maxgräns since the last call: their last change only
+            for tool_id in sorted(tool_ids - state["tracked"]):
+                rows = client.table(TOOL_CHANGES_TABLE)\
+                    .select(TOOL_CHANGE_COLUMNS)\
+                    .eq('machine_id', machine_id)\
+                    .eq('tool_id', tool_id)\
+                    .order('date_created', desc=True)\
+                    .limit(1)\
+                    .execute().data or []
+                self.stats["tool_loads"] += 1
+                self.stats["rows_fetched"] += self._apply(state, rows)
+                state["tracked"].add(tool_id)
+
+            return {t: dict(state["latest"][t]) for t in tool_ids if t in state["latest"]}
+
+    def invalidate(self, machine_id: Optional[str] = None):
+        """Reload one machine (or all) on the next call"""
+        with self._lock:
+            if machine_id is None:
+                self._machines.clear()
+            else:
+                self._machines.pop(str(machine_id), None)
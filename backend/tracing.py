@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+Lightweight tracing for the backend hot paths.
+Spans are collected per request (or per background scan), summarised in a
+Server-Timing header and exported asynchronously to a JSONL file and/or an
+OTLP/HTTP JSON collector. Run `python tracing.py collect` for a local collector stub.
+"""
+
+import os
+import json
+import time
+import queue
+import random
+import threading
+import functools
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+TRACING_ENABLED = os.getenv('TRACING_ENABLED', 'true').lower() == 'true'
+TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', '1.0'))  # Fraction of traces exported
+TRACE_EXPORT_FILE = os.getenv(
+    'TRACE_EXPORT_FILE',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'traces', 'spans.jsonl')
+)
+TRACE_EXPORT_MAX_BYTES = int(os.getenv('TRACE_EXPORT_MAX_BYTES', str(50 * 1024 * 1024)))
+OTLP_ENDPOINT = os.getenv('OTLP_ENDPOINT', '')  # e.g. http://localhost:4318/v1/traces
+TRACE_SERVICE_NAME = os.getenv('TRACE_SERVICE_NAME', 'maskinterminal-backend')
+
+_current_trace: contextvars.ContextVar = contextvars.ContextVar('current_trace', default=None)
+_current_span: contextvars.ContextVar = contextvars.ContextVar('current_span', default=None)
+
+
+def _new_id(n_bytes: int) -> str:
+    return f"{random.getrandbits(n_bytes * 8):0{n_bytes * 2}x}"
+
+
+class Trace:
+    """All spans of one request or background scan"""
+
+    def __init__(self, name: str, trace_id: Optional[str] = None, parent_span_id: Optional[str] = None):
+        self.name = name
+        self.trace_id = trace_id or _new_id(16)
+        self.parent_span_id = parent_span_id
+        self.sampled = random.random() < TRACE_SAMPLE_RATE
+        self.root_span_id: Optional[str] = None
+        self.spans: List[Dict] = []
+        self._lock = threading.Lock()
+
+    def add(self, span: Dict):
+        with self._lock:
+            self.spans.append(span)
+
+    def server_timing(self, limit: int = 20) -> str:
+        """Summarise span durations per name as a Server-Timing header value"""
+        totals: Dict[str, float] = {}
+        with self._lock:
+            for span in self.spans:
+                if span['span_id'] == self.root_span_id:
+                    continue  # Root span is the total, already known to the client
+                totals[span['name']] = totals.get(span['name'], 0.0) + span['duration_ms']
+        parts = []
+        for name, dur in list(totals.items())[:limit]:
+            token = ''.join(ch if ch.isalnum() or ch in '-_.' else '_' for ch in name)
+            parts.append(f"{token};dur={dur:.1f}")
+        return ", ".join(parts)
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Optional[Dict]]:
+    """
+    Record a span inside the current trace. No-op (yields None) when there is no
+    active trace, so helpers can be instrumented unconditionally.
+    """
+    trace = _current_trace.get()
+    if trace is None or not TRACING_ENABLED:
+        yield None
+        return
+
+    parent = _current_span.get()
+    record = {
+        'name': name,
+        'span_id': _new_id(8),
+        'parent_span_id': parent['span_id'] if parent else trace.parent_span_id,
+        'start_unix_ns': time.time_ns(),
+        'attributes': attributes,
+        'status': 'ok',
+    }
+    token = _current_span.set(record)
+    start = time.perf_counter_ns()
+    try:
+        yield record
+    except Exception as e:
+        record['status'] = 'error'
+        record['attributes']['error'] = str(e)[:200]
+        raise
+    finally:
+        record['duration_ms'] = (time.perf_counter_ns() - start) / 1e6
+        _current_span.reset(token)
+        trace.add(record)
+
+
+def traced(name: str):
+    """Decorator form of span() for helpers called many times per scan"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def start_trace(name: str, traceparent: Optional[str] = None, **attributes):
+    """
+    Begin a trace and its root span; returns a token for end_trace().
+    Honours an incoming W3C traceparent header so compensation_monitor scans
+    and the backend requests they cause share one trace id.
+    """
+    trace_id = parent_span_id = None
+    if traceparent:
+        parts = traceparent.split('-')
+        if len(parts) == 4 and len(parts[1]) == 32 and len(parts[2]) == 16:
+            trace_id, parent_span_id = parts[1], parts[2]
+
+    trace = Trace(name, trace_id, parent_span_id)
+    trace_token = _current_trace.set(trace)
+    root_cm = span(name, **attributes)
+    root = root_cm.__enter__()
+    if root is not None:
+        trace.root_span_id = root['span_id']
+    return trace, trace_token, root_cm, root
+
+
+def end_trace(token, error: Optional[BaseException] = None) -> Optional[Trace]:
+    """Close the root span, export the trace and restore the previous context"""
+    trace, trace_token, root_cm, root = token
+    if error is not None and root is not None:
+        root['status'] = 'error'
+        root['attributes']['error'] = str(error)[:200]
+    root_cm.__exit__(None, None, None)
+    _current_trace.reset(trace_token)
+    if trace.sampled and TRACING_ENABLED:
+        exporter.submit(trace)
+    return trace
+
+
+@contextmanager
+def trace(name: str, **attributes) -> Iterator[Trace]:
+    """Trace a background unit of work (e.g. one compensation monitor scan)"""
+    token = start_trace(name, **attributes)
+    try:
+        yield token[0]
+    except BaseException as e:
+        end_trace(token, e)
+        raise
+    else:
+        end_trace(token)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+def traceparent_header() -> Optional[str]:
+    """W3C traceparent for outgoing calls, so the callee joins the current trace"""
+    trace = _current_trace.get()
+    current = _current_span.get()
+    if trace is None or current is None:
+        return None
+    return f"00-{trace.trace_id}-{current['span_id']}-{'01' if trace.sampled else '00'}"
+
+
+def outgoing_headers() -> Dict[str, str]:
+    """Headers to pass to requests calls to propagate the current trace"""
+    header = traceparent_header()
+    return {'traceparent': header} if header else {}
+
+
+class SpanExporter:
+    """Background exporter; drops traces instead of blocking when the queue is full"""
+
+    def __init__(self, max_queue: int = 1000):
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def submit(self, trace: Trace):
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            self.dropped += 1
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            # Drain whatever else is waiting so file/collector writes are batched
+            while len(batch) < 200:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                if TRACE_EXPORT_FILE:
+                    self._write_file(batch)
+                if OTLP_ENDPOINT:
+                    self._post_otlp(batch)
+            except Exception as e:
+                print(f"Warning: Span export failed: {e}")
+
+    def _write_file(self, batch: List[Trace]):
+        os.makedirs(os.path.dirname(TRACE_EXPORT_FILE), exist_ok=True)
+        try:
+            if os.path.getsize(TRACE_EXPORT_FILE) > TRACE_EXPORT_MAX_BYTES:
+                os.replace(TRACE_EXPORT_FILE, TRACE_EXPORT_FILE + '.1')
+        except OSError:
+            pass
+        with open(TRACE_EXPORT_FILE, 'a', encoding='utf-8') as f:
+            for t in batch:
+                for s in t.spans:
+                    f.write(json.dumps({'trace_id': t.trace_id, 'service': TRACE_SERVICE_NAME, **s},
+                                       ensure_ascii=False, default=str) + "\n")
+
+    def _post_otlp(self, batch: List[Trace]):
+        import requests  # Deferred - only needed when a collector is configured
+        spans = []
+        for t in batch:
+            for s in t.spans:
+                spans.append({
+                    'traceId': t.trace_id,
+                    'spanId': s['span_id'],
+                    'parentSpanId': s['parent_span_id'] or '',
+                    'name': s['name'],
+                    'kind': 1,
+                    'startTimeUnixNano': str(s['start_unix_ns']),
+                    'endTimeUnixNano': str(s['start_unix_ns'] + int(s['duration_ms'] * 1e6)),
+                    'attributes': [
+                        {'key': k, 'value': {'stringValue': str(v)}} for k, v in s['attributes'].items()
+                    ],
+                    'status': {'code': 2 if s['status'] == 'error' else 1},
+                })
+        payload = {'resourceSpans': [{
+            'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': TRACE_SERVICE_NAME}}]},
+            'scopeSpans': [{'scope': {'name': 'tracing.py'}, 'spans': spans}],
+        }]}
+        requests.post(OTLP_ENDPOINT, json=payload, timeout=5)
+
+
+exporter = SpanExporter()
+
+
+def run_collector_stub(host: str = '127.0.0.1', port: int = 4318, output: str = 'otlp_spans.jsonl'):
+    """Minimal OTLP/HTTP JSON collector that appends received payloads to a file"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class CollectorHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            body = self.rfile.read(length)
+            with open(output, 'ab') as f:
+                f.write(body.replace(b"\n", b" ") + b"\n")
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.end_headers()
+            self.wfile.write(b"{}")
+
+        def log_message(self, *args):
+            pass
+
+    print(f"OTLP collector stub listening on http://{host}:{port}/v1/traces, writing to {output}")
+    ThreadingHTTPServer((host, port), CollectorHandler).serve_forever()
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="Tracing utilities")
+    sub = parser.add_subparsers(dest='command', required=True)
+    collect = sub.add_parser('collect', help='Run a local OTLP/HTTP JSON collector stub')
+    collect.add_argument('--host', default='127.0.0.1')
+    collect.add_argument('--port', type=int, default=4318)
+    collect.add_argument('--output', default='otlp_spans.jsonl')
+    args = parser.parse_args()
+    run_collector_stub(args.host, args.port, args.output)
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Record upstream traffic for offline replay (bench/replay.py).
+
+With TRAFFIC_CAPTURE_FILE set, every FocasService HTTP exchange made by app.py (request,
+response body, status and timing), every raw Modbus frame pair sent to an AdamBox and every
+backend call made by compensation_monitor.py is appended to a gzip-compressed JSON lines file.
+Records are queued and written by a background thread, so a slow disk never blocks a request;
+when the queue is full records are dropped and counted.
+
+File layout: one header line ({"k": "capture", ...}) followed by one record per line:
+    {"k": "http", "svc": "focas", "t": 12.5, "d": 0.021, "m": "GET", "p": "/api/focas/...",
+     "ip": "10.0.0.5", "q": {...}, "s": 200, "ct": "application/json", "b": "..."}
+    {"k": "modbus", "t": 12.6, "d": 0.004, "ip": "10.0.1.5", "port": 502, "tx": "0001...", "rx": "0001..."}
+t is seconds since the capture started and d the duration. Failed exchanges carry "e"
+(exception name) instead of a response. FocasService keeps one global CNC handle, so "ip"
+is the CNC of the last connect call - the one the service answered for.
+"""
+
+import os
+import sys
+import gzip
+import json
+import time
+import queue
+import atexit
+import socket
+import threading
+from datetime import datetime, timezone
+from typing import Dict, Iterator, Optional
+
+# Empty = capture disabled. {process} and {pid} are replaced, so app.py and
+# compensation_monitor.py can share one setting without writing to the same file.
+TRAFFIC_CAPTURE_FILE = os.getenv('TRAFFIC_CAPTURE_FILE', '')
+TRAFFIC_CAPTURE_SECONDS = float(os.getenv('TRAFFIC_CAPTURE_SECONDS', '0'))  # Stop recording after this long (0 = until exit)
+TRAFFIC_CAPTURE_QUEUE = int(os.getenv('TRAFFIC_CAPTURE_QUEUE', '10000'))
+
+CAPTURE_VERSION = 1
+
+
+def _process_name() -> str:
+    return os.path.splitext(os.path.basename(sys.argv[0] or 'python'))[0] or 'python'
+
+
+def encode_body(body: bytes) -> str:
+    # surrogateescape keeps non-UTF-8 bytes; json escapes them and decode_body restores them
+    return body.decode('utf-8', 'surrogateescape')
+
+
+def decode_body(text: Optional[str]) -> bytes:
+    return (text or '').encode('utf-8', 'surrogateescape')
+
+
+class TrafficRecorder:
+    """Queue-backed capture writer; all record methods are no-ops while disabled"""
+
+    def __init__(self, path: str = TRAFFIC_CAPTURE_FILE, max_seconds: float = TRAFFIC_CAPTURE_SECONDS,
+                 max_queue: int = TRAFFIC_CAPTURE_QUEUE):
+        self.path = path.format(process=_process_name(), pid=os.getpid()) if path else ''
+        self.enabled = bool(self.path)
+        self.max_seconds = max_seconds
+        self.recorded = 0
+        self.dropped = 0
+        self.started_at = time.time()
+        self._t0 = time.perf_counter()
+        self._focas_ip: Optional[str] = None
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._file = None
+
+    def http(self, service: str, method: str, path: str, start: float, request: Optional[Dict] = None,
+             status: Optional[int] = None, body: Optional[bytes] = None, content_type: Optional[str] = None,
+             error: Optional[str] = None):
+        """Record one HTTP exchange; start is the time.perf_counter() value taken before sending"""
+        if not self.enabled:
+            return
+        record = {"k": "http", "svc": service, "m": method, "p": path}
+        if service == 'focas':
+            if path.startswith('/api/focas/connect') and request:
+                self._focas_ip = request.get('ipAddress')
+            record["ip"] = self._focas_ip
+        if request is not None:
+            record["q"] = request
+        if error is not None:
+            record["e"] = error
+        else:
+            record.update({"s": status, "ct": content_type, "b": encode_body(body or b'')})
+        self._submit(record, start)
+
+    def modbus(self, ip: str, port: int, start: float, request: Optional[bytes], response: Optional[bytes],
+               error: Optional[str] = None):
+        """Record one Modbus TCP request/response frame pair (either may be None when the exchange failed)"""
+        if not self.enabled:
+            return
+        record = {"k": "modbus", "ip": ip, "port": port}
+        if request is not None:
+            record["tx"] = request.hex()
+        if response is not None:
+            record["rx"] = response.hex()
+        if error is not None:
+            record["e"] = error
+        self._submit(record, start)
+
+    def _submit(self, record: Dict, start: float):
+        now = time.perf_counter()
+        if self.max_seconds and now - self._t0 > self.max_seconds:
+            return
+        record["t"] = round(start - self._t0, 4)
+        record["d"] = round(now - start, 4)
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._open()
+                self._thread = threading.Thread(target=self._run, name="traffic-capture", daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def _open(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._file = gzip.open(self.path, 'wt', encoding='utf-8')
+        self._file.write(json.dumps({
+            "k": "capture",
+            "v": CAPTURE_VERSION,
+            "process": _process_name(),
+            "host": socket.gethostname(),
+            "pid": os.getpid(),
+            "started_at": datetime.fromtimestamp(self.started_at, timezone.utc).isoformat(),
+        }) + "\n")
+        print(f"Traffic capture: recording upstream traffic to {self.path}")
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < 500:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._write(batch)
+
+    def _write(self, batch):
+        with self._lock:
+            if self._file is None:
+                return
+            try:
+                for record in batch:
+                    self._file.write(json.dumps(record, separators=(',', ':')) + "\n")
+                # Sync flush: everything written so far stays readable if the process is killed
+                self._file.flush()
+                self.recorded += len(batch)
+            except Exception as e:
+                print(f"Warning: Traffic capture write failed: {e}")
+
+    def close(self):
+        """Write what is still queued and finish the gzip stream"""
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if batch:
+            self._write(batch)
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def status(self) -> Dict:
+        return {
+            "enabled": self.enabled,
+            "file": self.path or None,
+            "recorded": self.recorded,
+            "dropped": self.dropped,
+            "queued": self._queue.qsize(),
+        }
+
+
+recorder = TrafficRecorder()
+
+
+def read_capture(path: str) -> Iterator[Dict]:
+    """Yield the records of a capture file (header included); a file cut off by a kill ends at the last full line"""
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        try:
+            for line in f:
+                if line.endswith("\n"):
+                    yield json.loads(line)
+        except EOFError:
+            return
@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+"""
+Wear-rate analytics: wear offset change per 1000 parts for each (machine, tool).
+
+Sources:
+- wear columns (verktyg_radie_wear, verktyg_längd_wear) from the local compensation history
+- the machine's part counter, sampled from number_of_parts_ADAM in verktygsbyteslista and
+  from the AdamBox readings recorded by the fleet snapshot refresher (PartsCounterLog)
+- tool changes in verktygshanteringssystem_verktygsbyteslista, which split the history into tool lives
+
+Per (machine, tool, field) only running sums are kept (wear change, parts, tool lives), so an
+incremental update reads just the history rows added since the last one. A rebuild runs the same
+code over the whole history. Tool change rows are kept in a local log per machine (ToolChangeLog),
+so Supabase is only asked for rows at or after the newest date_created already stored.
+"""
+
+import os
+import json
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from compensation_history import CompensationHistory, history as compensation_history
+from compensation_snapshot import TOOL_FIELDS, MISSING
+
+WEAR_ANALYTICS_DIR = os.getenv(
+    'WEAR_ANALYTICS_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'wear_analytics')
+)
+WEAR_LIMIT_MM = float(os.getenv('WEAR_LIMIT_MM', '0.1'))  # wear offset budget per tool life used for maxgräns suggestions
+WEAR_WARNING_RATIO = float(os.getenv('WEAR_WARNING_RATIO', '0.9'))  # maxgräns_varning as a fraction of the suggested maxgräns
+WEAR_MIN_PARTS = int(os.getenv('WEAR_MIN_PARTS', '500'))  # parts observed before a rate is used for suggestions
+WEAR_ANALYTICS_INTERVAL = int(os.getenv('WEAR_ANALYTICS_INTERVAL', '300'))  # seconds between background updates
+
+# AdamBox register is 16 bit; a drop from near the top is a wrap, anything else a counter reset
+COUNTER_MODULO = 65536
+COUNTER_WRAP_MARGIN = 5000
+
+# Wear columns of the tool arrays (index into TOOL_FIELDS)
+WEAR_FIELDS = [(i, db) for i, (db, _) in enumerate(TOOL_FIELDS) if db.endswith('_wear')]
+
+CHUNK_ROWS = 20000  # history rows processed per step, bounds memory for long histories
+
+
+def parse_timestamp_ms(value: str) -> Optional[int]:
+    """Supabase timestamptz string -> unix ms"""
+    if not value:
+        return None
+    try:
+        return int(datetime.fromisoformat(str(value).replace('Z', '+00:00')).timestamp() * 1000)
+    except ValueError:
+        return None
+
+
+def counter_step(previous: int, count: int) -> int:
+    """Parts between two raw counter samples: a 16-bit wrap adds up to the modulo, a reset counts from zero"""
+    if count >= previous:
+        return count - previous
+    if previous > COUNTER_MODULO - COUNTER_WRAP_MARGIN:
+        return count + COUNTER_MODULO - previous
+    return count
+
+
+def monotonic_counter(values: np.ndarray) -> np.ndarray:
+    """Cumulative parts from raw counter samples, across 16-bit wraps and counter resets (see counter_step)"""
+    if len(values) == 0:
+        return values.astype(np.int64)
+    values = values.astype(np.int64)
+    steps = np.diff(values)
+    wrapped = (steps < 0) & (values[:-1] > COUNTER_MODULO - COUNTER_WRAP_MARGIN)
+    steps = np.where(wrapped, steps + COUNTER_MODULO, steps)
+    steps = np.where(steps < 0, values[1:], steps)  # Reset: count from zero again
+    return np.concatenate(([0], np.cumsum(steps)))
+
+
+class PartsCounterLog:
+    """Append-only (unix ms, counter value) pairs per machine, written when the value changes"""
+
+    def __init__(self, base_dir: str):
+        self.base_dir = base_dir
+        self._last: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _path(self, machine_id: str) -> str:
+        return os.path.join(self.base_dir, 'parts', f"{machine_id}.i8")
+
+    def record(self, machine_id: str, value: int, ts_ms: Optional[int] = None):
+        machine_id = str(machine_id)
+        with self._lock:
+            if self._last.get(machine_id) == value:
+                return
+            if machine_id not in self._last:
+                samples = self.read(machine_id)
+                if len(samples) and samples[-1, 1] == value:
+                    self._last[machine_id] = value
+                    return
+            path = self._path(machine_id)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            ts_ms = int(ts_ms if ts_ms is not None else time.time() * 1000)
+            with open(path, 'ab') as f:
+                size = f.tell()
+                if size % 16:
+                    f.truncate(size - size % 16)  # Drop a half-written pair
+                f.write(np.array([ts_ms, int(value)], dtype=np.int64).tobytes())
+            self._last[machine_id] = value
+
+    def read(self, machine_id: str) -> np.ndarray:
+        """samples x 2 array (ts_ms, value)"""
+        try:
+            raw = np.fromfile(self._path(str(machine_id)), dtype=np.int64)
+        except (OSError, ValueError):
+            return np.empty((0, 2), dtype=np.int64)
+        return raw[:len(raw) // 2 * 2].reshape(-1, 2)
+
+
+class ToolChangeLog:
+    """Local copy of a machine's verktygsbyteslista rows (JSON lines), appended incrementally"""
+
+    COLUMNS = ('id', 'tool_id', 'number_of_parts_ADAM', 'date_created')
+
+    def __init__(self, base_dir: str):
+        self.base_dir = base_dir
+        self._lock = threading.Lock()
+
+    def _path(self, machine_id: str) -> str:
+        return os.path.join(self.base_dir, 'tool_changes', f"{machine_id}.jsonl")
+
+    def rows(self, machine_id: str) -> List[Dict]:
+        rows = []
+        try:
+            with open(self._path(str(machine_id)), 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        rows.append(json.loads(line))
+                    except ValueError:
+                        pass  # Half-written last line
+        except OSError:
+            pass
+        return rows
+
+    def high_water(self, machine_id: str) -> Optional[str]:
+        """Newest date_created stored for the machine, or None before the first fetch"""
+        newest = max(self.rows(machine_id), key=lambda r: parse_timestamp_ms(r.get('date_created')) or 0, default=None)
+        return newest.get('date_created') if newest else None
+
+    def append(self, machine_id: str, rows: List[Dict]) -> int:
+        """Store rows not stored yet (matched by id); returns how many were added"""
+        machine_id = str(machine_id)
+        with self._lock:
+            known = {r.get('id') for r in self.rows(machine_id)}
+            new = [{c: r.get(c) for c in self.COLUMNS} for r in rows if r.get('id') not in known]
+            if new:
+                path = self._path(machine_id)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, 'a', encoding='utf-8') as f:
+                    f.writelines(json.dumps(r, ensure_ascii=False) + "\n" for r in new)
+            return len(new)
+
+    def clear(self, machine_id: str):
+        with self._lock:
+            try:
+                os.remove(self._path(str(machine_id)))
+            except OSError:
+                pass
+
+
+class WearAnalytics:
+    """Running wear/parts sums per (machine, tool, wear field), persisted as JSON"""
+
+    def __init__(self, history: CompensationHistory = compensation_history, base_dir: str = WEAR_ANALYTICS_DIR):
+        self.history = history
+        self.base_dir = base_dir
+        self.parts_log = PartsCounterLog(base_dir)
+        self.tool_changes = ToolChangeLog(base_dir)
+        self._lock = threading.Lock()
+        self._state: Dict[str, Dict] = {}
+        self._load()
+
+    # State
+
+    def _state_path(self) -> str:
+        return os.path.join(self.base_dir, 'state.json')
+
+    def _mtime(self) -> Optional[int]:
+        try:
+            return os.stat(self._state_path()).st_mtime_ns
+        except OSError:
+            return None
+
+    def _load(self):
+        self._loaded_mtime = self._mtime()
+        try:
+            with open(self._state_path(), 'r', encoding='utf-8') as f:
+                self._state = json.load(f).get('machines', {})
+        except (OSError, ValueError):
+            self._state = {}
+
+    def _refresh(self):
+        """Reload state.json if another instance (the wear-rates leader in app.py) has rewritten it"""
+        mtime = self._mtime()
+        if mtime is not None and mtime != self._loaded_mtime:
+            self._load()
+
+    def _save(self):
+        os.makedirs(self.base_dir, exist_ok=True)
+        tmp_path = f"{self._state_path()}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'machines': self._state}, f, ensure_ascii=False)
+        os.replace(tmp_path, self._state_path())
+        self._loaded_mtime = self._mtime()
+
+    # Inputs
+
+    def counter_samples(self, machine_id: str, tool_changes: List[Dict]) -> Tuple[np.ndarray, np.ndarray]:
+        """(ts_ms, cumulative parts) for a machine from tool change rows and recorded AdamBox samples"""
+        samples = [self.parts_log.read(machine_id)]
+        from_changes = [
+            (parse_timestamp_ms(row.get('date_created')), row.get('number_of_parts_ADAM'))
+            for row in tool_changes
+        ]
+        from_changes = [(ts, v) for ts, v in from_changes if ts is not None and v is not None]
+        if from_changes:
+            samples.append(np.array(from_changes, dtype=np.int64))
+        samples = np.concatenate(samples)
+        if len(samples) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        samples = samples[np.argsort(samples[:, 0], kind='stable')]
+        return samples[:, 0], monotonic_counter(samples[:, 1])
+
+    @staticmethod
+    def change_times(tools: List[Dict], tool_changes: List[Dict]) -> Dict[int, np.ndarray]:
+        """Sorted tool change timestamps (ms) per tool number (plats)"""
+        plats_by_id = {
+            str(t['id']): int(t['plats']) for t in tools
+            if str(t.get('plats') or '').strip().isdigit()
+        }
+        times: Dict[int, List[int]] = {}
+        for row in tool_changes:
+            number = plats_by_id.get(str(row.get('tool_id')))
+            ts = parse_timestamp_ms(row.get('date_created'))
+            if number is not None and ts is not None:
+                times.setdefault(number, []).append(ts)
+        return {n: np.sort(np.array(ts, dtype=np.int64)) for n, ts in times.items()}
+
+    # Computation
+
+    def update(self, machine_id: str, tools: List[Dict], tool_changes: List[Dict], rebuild: bool = False) -> Dict:
+        """
+        Fold history rows newer than the last update into the running sums
+        (all rows when rebuild is set). Returns the machine's state.
+        """
+        machine_id = str(machine_id)
+        with self._lock:
+            self._refresh()  # Continue from the previous leader's sums
+            state = None if rebuild else self._state.get(machine_id)
+            changed = state is None
+            if state is None:
+                state = {'last_ts': None, 'last_row': None, 'tools': {}}
+
+            counter_ts, counter = self.counter_samples(machine_id, tool_changes)
+            changes = self.change_times(tools, tool_changes)
+            if len(counter_ts) == 0:
+                return state
+            start_ms = state['last_ts'] + 1 if state['last_ts'] is not None else 0
+            # Scans after the newest counter sample wait for the next update, their parts are not known yet
+            end_ms = int(counter_ts[-1])
+
+            for tool_start, ts, wear in self._history_chunks(machine_id, start_ms, end_ms):
+                if state['last_row'] is not None and state['last_row']['tool_start'] == tool_start \
+                        and len(state['last_row']['wear']) == wear.shape[1]:
+                    # Continue from the last row of the previous update
+                    ts = np.concatenate(([state['last_ts']], ts))
+                    wear = np.concatenate((np.array([state['last_row']['wear']], dtype=np.int64), wear))
+                self._fold(state, tool_start, ts, wear, counter_ts, counter, changes)
+                state['last_ts'] = int(ts[-1])
+                state['last_row'] = {'tool_start': tool_start, 'wear': wear[-1].tolist()}
+                changed = True
+
+            state['updated_at'] = datetime.now().isoformat()
+            self._state[machine_id] = state
+            if changed:
+                self._save()  # Nothing new folded in: the file on disk is still current
+            return state
+
+    def _history_chunks(self, machine_id: str, start_ms: int, end_ms: int):
+        """(tool_start, ts, wear[rows x tools x wear fields]) in time order, CHUNK_ROWS at a time"""
+        wear_index = [i for i, _ in WEAR_FIELDS]
+        for p in self.history._partitions(machine_id, start_ms, end_ms):
+            ts = p.column('ts', ())
+            lo, hi = np.searchsorted(ts, start_ms, 'left'), np.searchsorted(ts, end_ms, 'right')
+            tools = p.column('tools', (p.tool_count, len(TOOL_FIELDS)))
+            for chunk in range(lo, hi, CHUNK_ROWS):
+                stop = min(chunk + CHUNK_ROWS, hi)
+                yield p.tool_start, np.array(ts[chunk:stop]), np.array(tools[chunk:stop][:, :, wear_index])
+
+    @staticmethod
+    def _fold(state: Dict, tool_start: int, ts: np.ndarray, wear: np.ndarray,
+              counter_ts: np.ndarray, counter: np.ndarray, changes: Dict[int, np.ndarray]):
+        """Add wear and parts between consecutive rows to each tool's sums, skipping steps across a tool change"""
+        if len(ts) < 2 or len(counter_ts) == 0:
+            return
+        # Parts at each scan, interpolated between counter samples (flat outside the sampled range)
+        parts = np.interp(ts, counter_ts, counter)
+        part_steps = np.diff(parts)
+        valid = (wear[1:] != MISSING) & (wear[:-1] != MISSING)  # steps x tools x fields
+        wear_steps = np.where(valid, np.diff(wear, axis=0), 0)
+
+        for t in range(wear.shape[1]):
+            number = tool_start + t
+            if not valid[:, t].any():
+                continue
+            same_life = np.ones(len(part_steps), dtype=bool)
+            change_ts = changes.get(number)
+            if change_ts is not None and len(change_ts):
+                life = np.searchsorted(change_ts, ts, 'right')
+                same_life = life[1:] == life[:-1]
+                lives = int(life[-1] - life[0])
+            else:
+                lives = 0
+
+            tool_state = state['tools'].setdefault(str(number), {'lives': 0, 'fields': {}})
+            tool_state['lives'] += lives
+            for f, (_, field) in enumerate(WEAR_FIELDS):
+                mask = same_life & valid[:, t, f]
+                if not mask.any():
+                    continue
+                steps = wear_steps[mask, t, f]
+                sums = tool_state['fields'].setdefault(field, {
+                    'wear_units': 0, 'abs_wear_units': 0, 'adjustments': 0, 'parts': 0.0,
+                })
+                sums['wear_units'] += int(steps.sum())
+                sums['abs_wear_units'] += int(np.abs(steps).sum())
+                sums['adjustments'] += int(np.count_nonzero(steps))
+                sums['parts'] += float(part_steps[mask].sum())
+
+    # Results
+
+    @staticmethod
+    def rates(machine_id: str, state: Dict, tools: List[Dict]) -> List[Dict]:
+        """Wear per 1000 parts and a maxgräns suggestion per tool"""
+        tools_by_plats: Dict[int, List[Dict]] = {}
+        for t in tools:
+            if str(t.get('plats') or '').strip().isdigit():
+                tools_by_plats.setdefault(int(t['plats']), []).append(t)
+
+        result = []
+        for number in sorted(state.get('tools', {}), key=int):
+            tool_state = state['tools'][number]
+            fields = {}
+            suggestions = []
+            for field, sums in tool_state['fields'].items():
+                parts = sums['parts']
+                rate = sums['wear_units'] / 1000.0 / parts * 1000 if parts > 0 else None
+                fields[field] = {
+                    "wear_mm_per_1000_parts": round(rate, 6) if rate is not None else None,
+                    "net_wear_mm": sums['wear_units'] / 1000.0,
+                    "abs_wear_mm": sums['abs_wear_units'] / 1000.0,
+                    "adjustments": sums['adjustments'],
+                    "parts": int(parts),
+                }
+                if rate and parts >= WEAR_MIN_PARTS:
+                    suggestions.append(WEAR_LIMIT_MM / abs(rate) * 1000)
+            if not fields:
+                continue
+
+            suggested = int(min(suggestions) // 10 * 10) if suggestions else None
+            catalogue = tools_by_plats.get(int(number), [])
+            result.append({
+                "machine_id": machine_id,
+                "tool_number": int(number),
+                "tools": [
+                    {"tool_id": t['id'], "benämning": t.get('benämning'),
+                     "maxgräns": t.get('maxgräns'), "maxgräns_varning": t.get('maxgräns_varning')}
+                    for t in catalogue
+                ],
+                "tool_lives": tool_state['lives'],
+                "fields": fields,
+                "suggested_maxgräns": suggested if suggested else None,
+                "suggested_maxgräns_varning": int(suggested * WEAR_WARNING_RATIO) if suggested else None,
+            })
+        return result
+
+    def machine_rates(self, machine_id: str, tools: List[Dict]) -> List[Dict]:
+        with self._lock:
+            self._refresh()
+            state = self._state.get(str(machine_id))
+        return self.rates(str(machine_id), state, tools) if state else []
+
+    def machines(self) -> Dict[str, Optional[str]]:
+        """{machine_id: updated_at} for every machine with wear state"""
+        with self._lock:
+            self._refresh()
+            return {machine_id: state.get('updated_at') for machine_id, state in self._state.items()}
+
+
+analytics = WearAnalytics()
@@ -75,6 +75,14 @@ export default function SettingsPage() {
         throw new Error("Några uppdateringar misslyckades");
       }
 
+      // Backend cachar verktygstabellen (verktygskontroll, fleet snapshot) - be den läsa om maxgränserna
+      const API_BASE_URL = import.meta.env.VITE_API_BASE_URL || import.meta.env.VITE_BACKEND_URL || 'http://localhost:5004';
+      fetch(`${API_BASE_URL}/api/reference-cache/invalidate`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ table: 'verktygshanteringssystem_verktyg' }),
+      }).catch((error) => console.warn('Could not invalidate backend tool cache:', error));
+
       toast.success("Maxgränser uppdaterade");
       setHasChanges(false);
       refetch();